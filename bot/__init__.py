@@ -60,6 +60,53 @@ basicConfig(
 LOGGER = getLogger(__name__)
 cpu_no = cpu_count()
 
+
+class TaskDict(dict):
+    """task_dict keyed by mid, with a gid -> status secondary index.
+
+    The index follows inserts, replacements and removals; status objects
+    whose gid changes afterwards call reindex() themselves.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.gid_index = {}
+        self._task_gids = {}
+
+    def __setitem__(self, mid, task):
+        if (old := self.get(mid)) is not None:
+            self._unindex(old)
+        super().__setitem__(mid, task)
+        self.reindex(task)
+
+    def __delitem__(self, mid):
+        self._unindex(self[mid])
+        super().__delitem__(mid)
+
+    def pop(self, mid, *default):
+        if mid in self:
+            self._unindex(self[mid])
+        return super().pop(mid, *default)
+
+    def clear(self):
+        self.gid_index.clear()
+        self._task_gids.clear()
+        super().clear()
+
+    def reindex(self, task):
+        try:
+            gid = task.gid()
+        except Exception:
+            return
+        if gid:
+            self.gid_index[gid] = task
+            self._task_gids.setdefault(id(task), set()).add(gid)
+
+    def _unindex(self, task):
+        for gid in self._task_gids.pop(id(task), ()):
+            if self.gid_index.get(gid) is task:
+                del self.gid_index[gid]
+
 bot_cache = {}
 DOWNLOAD_DIR = "/usr/src/app/downloads/"
 intervals = {"status": {}, "qb": "", "jd": "", "stopAll": False}
@@ -72,7 +119,7 @@ qbit_options = {}
 queued_dl = {}
 queued_up = {}
 status_dict = {}
-task_dict = {}
+task_dict = TaskDict()
 rss_dict = {}
 shortener_dict = {}
 var_list = [
@@ -99,7 +146,6 @@ task_dict_lock = Lock()
 queue_dict_lock = Lock()
 qb_listener_lock = Lock()
 jd_listener_lock = Lock()
-cpu_eater_lock = Lock()
 same_directory_lock = Lock()
 
 srun([BinConfig.QBIT_NAME, "-d", f"--profile={getcwd()}"], check=False)
@@ -66,6 +66,8 @@ class Config:
     LEECH_CAPTION = ""
     LEECH_SUFFIX = ""
     LEECH_FONT = "b"
+    HASH_ALGORITHM = "md5"  # md5, sha1 or xxh64
+    STREAM_EXTRACT = False
     LEECH_SPLIT_SIZE = 2097152000
     MEDIA_GROUP = False
     HYBRID_LEECH = True
@@ -75,6 +77,8 @@ class Config:
     QUEUE_ALL = 0
     QUEUE_DOWNLOAD = 0
     QUEUE_UPLOAD = 0
+    QUEUE_SJF = False
+    QUEUE_BANDWIDTH = 0
     RCLONE_FLAGS = ""
     RCLONE_PATH = ""
     RCLONE_SERVE_URL = ""
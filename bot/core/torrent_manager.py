@@ -1,7 +1,8 @@
-from asyncio import TimeoutError, gather
+from asyncio import TimeoutError, create_task, gather, shield
 from contextlib import suppress
 from inspect import iscoroutinefunction
 from pathlib import Path
+from time import time
 
 from aioaria2 import Aria2WebsocketClient
 from aiohttp import ClientError
@@ -36,9 +37,37 @@ def wrap_with_retry(obj, max_retries=3):
     return obj
 
 
+# Status refreshes within this window reuse the same qBittorrent/aria2 listing
+QB_SNAPSHOT_TTL = 1
+ARIA2_SNAPSHOT_TTL = 1
+# Only what Aria2Status and aria2_name read
+ARIA2_STATUS_KEYS = [
+    "gid",
+    "status",
+    "totalLength",
+    "completedLength",
+    "downloadSpeed",
+    "uploadLength",
+    "uploadSpeed",
+    "numSeeders",
+    "connections",
+    "seeder",
+    "followedBy",
+    "bittorrent",
+    "files",
+    "dir",
+]
+
+
 class TorrentManager:
     aria2 = None
     qbittorrent = None
+    qb_snapshot = {}
+    _qb_snapshot_time = 0
+    _qb_refresh = None
+    aria2_snapshot = {}
+    _aria2_snapshot_time = 0
+    _aria2_refresh = None
 
     @classmethod
     async def initiate(cls):
@@ -66,9 +95,13 @@ class TorrentManager:
         if cls.aria2:
             close_tasks.append(cls.aria2.close())
             cls.aria2 = None
+        cls.aria2_snapshot = {}
+        cls._aria2_snapshot_time = 0
         if cls.qbittorrent:
             close_tasks.append(cls.qbittorrent.close())
             cls.qbittorrent = None
+        cls.qb_snapshot = {}
+        cls._qb_snapshot_time = 0
         if close_tasks:
             await gather(*close_tasks)
 
@@ -99,6 +132,46 @@ class TorrentManager:
         with suppress(Exception):
             await gather(*tasks)
 
+    @classmethod
+    async def qb_torrents(cls, max_age=QB_SNAPSHOT_TTL):
+        """tag -> TorrentInfo of all torrents, one torrents.info call per tick.
+
+        Concurrent callers share the in-flight request.
+        """
+        if time() - cls._qb_snapshot_time < max_age:
+            return cls.qb_snapshot
+        if cls._qb_refresh is None or cls._qb_refresh.done():
+            cls._qb_refresh = create_task(cls._refresh_qb_snapshot())
+        return await shield(cls._qb_refresh)
+
+    @classmethod
+    async def _refresh_qb_snapshot(cls):
+        torrents = await cls.qbittorrent.torrents.info()
+        cls.qb_snapshot = {tor.tags[0]: tor for tor in torrents if tor.tags}
+        cls._qb_snapshot_time = time()
+        return cls.qb_snapshot
+
+    @classmethod
+    async def aria2_downloads(cls, max_age=ARIA2_SNAPSHOT_TTL):
+        """gid -> status dict of active and waiting downloads, two RPCs per tick."""
+        if time() - cls._aria2_snapshot_time < max_age:
+            return cls.aria2_snapshot
+        if cls._aria2_refresh is None or cls._aria2_refresh.done():
+            cls._aria2_refresh = create_task(cls._refresh_aria2_snapshot())
+        return await shield(cls._aria2_refresh)
+
+    @classmethod
+    async def _refresh_aria2_snapshot(cls):
+        results = await gather(
+            cls.aria2.tellActive(ARIA2_STATUS_KEYS),
+            cls.aria2.tellWaiting(0, 1000, ARIA2_STATUS_KEYS),
+        )
+        cls.aria2_snapshot = {
+            download["gid"]: download for res in results for download in res
+        }
+        cls._aria2_snapshot_time = time()
+        return cls.aria2_snapshot
+
     @classmethod
     async def overall_speed(cls):
         aria2_speed = await cls.aria2.getGlobalStat()
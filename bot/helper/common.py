@@ -1,5 +1,5 @@
 import re
-from asyncio import gather, sleep
+from asyncio import Queue, create_task, gather, sleep
 from contextlib import suppress
 from os import path as ospath, walk
 from re import sub
@@ -15,7 +15,6 @@ from pyrogram.types import InputMediaPhoto, InputMediaDocument
 from .. import (
     DOWNLOAD_DIR,
     LOGGER,
-    cpu_eater_lock,
     excluded_extensions,
     intervals,
     multi_tags,
@@ -27,13 +26,19 @@ from ..core.config_manager import Config, BinConfig
 from ..core.tg_client import TgClient
 from .ext_utils.bot_utils import get_size_bytes, new_task, sync_to_async
 from .ext_utils.bulk_links import extract_bulk_links
+from .ext_utils.cpu_scheduler import (
+    COPY,
+    SCREENSHOT,
+    TRANSCODE,
+    cpu_scheduler,
+    job_class,
+)
 from .ext_utils.files_utils import (
+    ArchiveExtractor,
     SevenZ,
-    get_base_name,
     get_path_size,
     is_archive,
     is_archive_split,
-    is_first_archive_split,
     split_file,
 )
 from .ext_utils.links_utils import (
@@ -150,6 +155,7 @@ class TaskConfig:
         self.ffmpeg_cmds = None
         self.chat_thread_id = None
         self.subproc = None
+        self.manifest = None
         self.thumb = None
         self.excluded_extensions = []
         self.files_to_proceed = []
@@ -674,96 +680,165 @@ class TaskConfig:
                 "Reply to text file or to telegram message that have links seperated by new line!",
             )
 
+    async def walk_files(self, path):
+        if self.manifest is not None:
+            return self.manifest.walk(path)
+        return await sync_to_async(lambda: list(walk(path, topdown=False)))
+
+    async def path_size(self, path):
+        if self.manifest is not None and (size := self.manifest.size(path)):
+            return size
+        return await get_path_size(path)
+
+    async def track_files(self, *paths):
+        if self.manifest is not None:
+            await self.manifest.add(*paths)
+
+    async def document_type(self, path):
+        mime_type = None
+        if self.manifest is not None and self.manifest.is_file(path):
+            mime_type = await self.manifest.mime(path)
+        return await get_document_type(path, mime_type)
+
     async def proceed_extract(self, dl_path, gid):
         pswd = self.extract if isinstance(self.extract, str) else ""
         self.files_to_proceed = []
-        archives = []
-        
-        async def scan_for_archives(path):
-            found = []
-            if await aiopath.isfile(path) and is_archive(path):
-                found.append(path)
-            elif await aiopath.isdir(path):
-                for dirpath, _, files in await sync_to_async(walk, path, topdown=False):
-                    for file_ in files:
-                        if is_first_archive_split(file_) or (is_archive(file_) and not file_.strip().lower().endswith(".rar")):
-                            found.append(ospath.join(dirpath, file_))
-            return found
-
-        archives = await scan_for_archives(dl_path)
+        archives = await ArchiveExtractor.scan(dl_path, self.manifest)
         if not archives:
             return dl_path
 
         self.total_count = len(archives)
+        self.subsize = 0
         sevenz = SevenZ(self)
         LOGGER.info(f"Extracting: {self.name}")
         async with task_dict_lock:
             task_dict[self.mid] = SevenZStatus(self, sevenz, gid, "Extract")
 
-        depth = 0
-        max_depth = 10
-        processed_archives = set()
-        total_extracted_size = 0
-        zip_bomb_limit = 50 * 1024 * 1024 * 1024  # 50GB safety limit
-        
-        while archives and depth < max_depth:
-            next_layer_archives = []
-            for f_path in list(archives):
-                if self.is_cancelled:
-                    return False
-                if f_path in processed_archives:
-                    continue
-                
-                # Zip Bomb Protection
-                arch_size = await get_path_size(f_path)
-                if total_extracted_size + arch_size > zip_bomb_limit:
-                    LOGGER.warning(f"Zip bomb risk detected! Stopping extraction at: {f_path}")
-                    break
+        extractor = ArchiveExtractor(self, sevenz, pswd)
+        if not await extractor.run(archives):
+            return False
+        self.subname = ""
+        return extractor.target(dl_path) if self.is_file else dl_path
 
-                self.proceed_count += 1
-                dirpath = ospath.dirname(f_path)
-                t_path = get_base_name(f_path) if self.is_file else dirpath
-                
-                if not self.is_file:
-                    self.subname = ospath.basename(f_path)
-                
-                code = await sevenz.extract(f_path, t_path, pswd)
-                if code == 0:
-                    processed_archives.add(f_path)
-                    # Scan for new archives in the extraction output
-                    new_found = await scan_for_archives(t_path)
-                    for nf in new_found:
-                        if nf not in processed_archives and nf not in archives and nf not in next_layer_archives:
-                            next_layer_archives.append(nf)
-                    
-                    # Cleanup extracted archive
-                    base_name = ospath.basename(f_path)
-                    for file_ in await listdir(dirpath):
-                        if is_archive_split(file_) or is_archive(file_):
-                            # Check if it belongs to the same archive set (best effort)
-                            if file_.startswith(ospath.splitext(base_name)[0]):
-                                with suppress(Exception):
-                                    await remove(ospath.join(dirpath, file_))
-                else:
-                    LOGGER.warning(f"Failed to extract {f_path}. Code: {code}")
-            
-            if not next_layer_archives:
-                break
-            
-            archives = next_layer_archives
-            self.total_count += len(archives)
-            depth += 1
-            total_extracted_size = await get_path_size(self.dir)
+    def streams_extract(self):
+        """Whether extracted files can go to the leech upload as they land.
 
-        self.subname = ""
-        return t_path if self.is_file else dl_path
+        Only when no later stage needs the whole extracted tree at once.
+        """
+        return bool(
+            Config.STREAM_EXTRACT
+            and self.is_leech
+            and self.extract
+            and not self.seed
+            and not self.compress
+            and not self.ffmpeg_cmds
+            and not self.name_swap
+            and not (self.screen_shots or self.screenshot_timestamps)
+            and not (self.convert_audio or self.convert_video)
+            and not self.sample_video
+            and not (
+                self.user_dict.get("METADATA_KEY")
+                or (
+                    Config.METADATA_KEY
+                    if "METADATA_KEY" not in self.user_dict
+                    else ""
+                )
+            )
+        )
+
+    async def proceed_stream_extract(self, dl_path, archives, feed):
+        """Extracts archives while handing every finished file to feed.
+
+        A member is passed on once 7z moves past it, split if it's over the
+        leech size, and uploaded and removed while the rest is extracting.
+        Whatever is left when extraction ends (failed or too deep archives,
+        renamed duplicates) is handed over last. feed is always closed with
+        None.
+        """
+        pswd = self.extract if isinstance(self.extract, str) else ""
+        self.total_count = len(archives)
+        self.subsize = 0
+        self.size = 0
+        ready = Queue()
+        fed = set()
+        ffmpeg = FFMpeg(self)
+        extractor = ArchiveExtractor(self, SevenZ(self), pswd, ready)
+
+        async def hand_over(f_path):
+            # The upload ended early, nothing reads the feed anymore
+            if self.is_cancelled:
+                return
+            if f_path in fed or not await aiopath.isfile(f_path):
+                return
+            fed.add(f_path)
+            dirpath, file_ = ospath.split(f_path)
+            if file_.strip().lower().endswith(tuple(self.excluded_extensions)):
+                await remove(f_path)
+                return
+            paths = [f_path]
+            f_size = await aiopath.getsize(f_path)
+            if f_size > self.split_size:
+                if not await self.split_one(ffmpeg, f_path, f_size, file_):
+                    return
+                if not await aiopath.exists(f_path):
+                    base, ext = ospath.splitext(file_)
+                    part = re.compile(
+                        rf"^{re.escape(base)}\.part\d{{3}}{re.escape(ext)}$"
+                        rf"|^{re.escape(file_)}\.\d{{3}}$"
+                    )
+                    paths = [
+                        ospath.join(dirpath, name)
+                        for name in natsorted(await listdir(dirpath))
+                        if part.match(name)
+                    ]
+            for path in paths:
+                fed.add(path)
+                self.size += await aiopath.getsize(path)
+                feed.put_nowait(path)
+
+        async def feeder():
+            while (f_path := await ready.get()) is not None:
+                # Archives are extracted in turn, or handed over at the end
+                name = ospath.basename(f_path)
+                if not (is_archive(name) or is_archive_split(name)):
+                    await hand_over(f_path)
+
+        feeding = create_task(feeder())
+        try:
+            if not self.is_file:
+                for dirpath, _, files in await self.walk_files(dl_path):
+                    for file_ in natsorted(files):
+                        ready.put_nowait(ospath.join(dirpath, file_))
+            done = await extractor.run(archives)
+            ready.put_nowait(None)
+            await feeding
+            if done and not self.is_cancelled:
+                t_path = dl_path
+                if self.is_file:
+                    # Still there when it couldn't be extracted
+                    await hand_over(dl_path)
+                    t_path = extractor.target(dl_path)
+                for dirpath, _, files in natsorted(
+                    # From disk, 7z renames members that clash with a file
+                    await sync_to_async(walk, t_path)
+                ):
+                    for file_ in natsorted(files):
+                        await hand_over(ospath.join(dirpath, file_))
+        finally:
+            if not feeding.done():
+                feeding.cancel()
+            self.subname = ""
+            feed.put_nowait(None)
 
     async def proceed_ffmpeg(self, dl_path, gid):
         checked = False
+        # Set once acquire returns, a cancel while queued holds no slot
+        cpu_cost = None
         cmds = [
             [part.strip() for part in split(item) if part.strip()]
             for item in self.ffmpeg_cmds
         ]
+        job = COPY if all(job_class(cmd) == COPY for cmd in cmds) else TRANSCODE
         try:
             ffmpeg = FFMpeg(self)
             for ffmpeg_cmd in cmds:
@@ -804,7 +879,7 @@ class TaskConfig:
                 else:
                     ext = ospath.splitext(input_file)[-1].lower()
                 if await aiopath.isfile(dl_path):
-                    is_video, is_audio, _ = await get_document_type(dl_path)
+                    is_video, is_audio, _ = await self.document_type(dl_path)
                     if not is_video and not is_audio:
                         break
                     elif is_video and ext == "audio":
@@ -831,7 +906,7 @@ class TaskConfig:
                                 self, ffmpeg, gid, "FFmpeg"
                             )
                         self.progress = False
-                        await cpu_eater_lock.acquire()
+                        cpu_cost = await cpu_scheduler.acquire(self.mid, job)
                         self.progress = True
                     LOGGER.info(f"Running ffmpeg cmd for: {file_path}")
                     cmd[index + 1] = file_path
@@ -858,15 +933,13 @@ class TaskConfig:
                         await move(file_path, dl_path)
                         await rmtree(new_folder)
                 else:
-                    for dirpath, _, files in await sync_to_async(
-                        walk, dl_path, topdown=False
-                    ):
+                    for dirpath, _, files in await self.walk_files(dl_path):
                         for file_ in files:
                             var_cmd = cmd.copy()
                             if self.is_cancelled:
                                 return False
                             f_path = ospath.join(dirpath, file_)
-                            is_video, is_audio, _ = await get_document_type(f_path)
+                            is_video, is_audio, _ = await self.document_type(f_path)
                             if not is_video and not is_audio:
                                 continue
                             elif is_video and ext == "audio":
@@ -888,10 +961,10 @@ class TaskConfig:
                                         self, ffmpeg, gid, "FFmpeg"
                                     )
                                 self.progress = False
-                                await cpu_eater_lock.acquire()
+                                cpu_cost = await cpu_scheduler.acquire(self.mid, job)
                                 self.progress = True
                             LOGGER.info(f"Running ffmpeg cmd for: {f_path}")
-                            self.subsize = await get_path_size(f_path)
+                            self.subsize = await self.path_size(f_path)
                             self.subname = file_
                             res = await ffmpeg.ffmpeg_cmds(var_cmd, f_path)
                             if res and delete_files:
@@ -903,8 +976,8 @@ class TaskConfig:
                                         newres = ospath.join(dirpath, newname)
                                         await move(res[0], newres)
         finally:
-            if checked:
-                cpu_eater_lock.release()
+            if cpu_cost is not None:
+                cpu_scheduler.release(cpu_cost)
         return dl_path
 
     async def proceed_metadata(self, dl_path, gid):
@@ -913,6 +986,8 @@ class TaskConfig:
             return dl_path
 
         checked = False
+        # Set once acquire returns, a cancel while queued holds no slot
+        cpu_cost = None
         base_cmd = [
             BinConfig.FFMPEG_NAME,
             "-hide_banner",
@@ -944,7 +1019,7 @@ class TaskConfig:
             self.proceed_count = 0
             
             if await aiopath.isfile(dl_path):
-                is_video, is_audio, _ = await get_document_type(dl_path)
+                is_video, is_audio, _ = await self.document_type(dl_path)
                 if not is_video and not is_audio:
                     return dl_path
                 
@@ -961,7 +1036,7 @@ class TaskConfig:
                     async with task_dict_lock:
                         task_dict[self.mid] = MetadataStatus(self, ffmpeg, gid, "Metadata")
                     self.progress = False
-                    await cpu_eater_lock.acquire()
+                    cpu_cost = await cpu_scheduler.acquire(self.mid, COPY)
                     self.progress = True
                 
                 LOGGER.info(f"Running metadata cmd for: {file_path}")
@@ -982,6 +1057,7 @@ class TaskConfig:
                 if res is not False and await aiopath.exists(temp_output):
                    await move(temp_output, dl_path)
                    await rmtree(new_folder)
+                   await self.track_files(dl_path)
                 else:
                    if await aiopath.exists(temp_output):
                        await remove(temp_output)
@@ -991,12 +1067,12 @@ class TaskConfig:
                    await rmtree(new_folder)
 
             else:
-                for dirpath, _, files in await sync_to_async(walk, dl_path, topdown=False):
+                for dirpath, _, files in await self.walk_files(dl_path):
                     for file_ in files:
                         if self.is_cancelled:
                             return dl_path
                         f_path = ospath.join(dirpath, file_)
-                        is_video, is_audio, _ = await get_document_type(f_path)
+                        is_video, is_audio, _ = await self.document_type(f_path)
                         if not is_video and not is_audio:
                             continue
                         
@@ -1007,11 +1083,11 @@ class TaskConfig:
                             async with task_dict_lock:
                                 task_dict[self.mid] = MetadataStatus(self, ffmpeg, gid, "Metadata")
                             self.progress = False
-                            await cpu_eater_lock.acquire()
+                            cpu_cost = await cpu_scheduler.acquire(self.mid, COPY)
                             self.progress = True
                         
                         LOGGER.info(f"Running metadata cmd for: {f_path}")
-                        self.subsize = await get_path_size(f_path)
+                        self.subsize = await self.path_size(f_path)
                         
                         name, ext = ospath.splitext(f_path)
                         if not ext:
@@ -1027,12 +1103,13 @@ class TaskConfig:
                         res = await ffmpeg.ffmpeg_cmds(cmd, f_path)
                         if res is not False and await aiopath.exists(temp_out):
                             await move(temp_out, f_path)
+                            await self.track_files(f_path)
                         elif await aiopath.exists(temp_out):
                             await remove(temp_out)
                         
         finally:
-            if checked:
-                cpu_eater_lock.release()
+            if cpu_cost is not None:
+                cpu_scheduler.release(cpu_cost)
         return dl_path
 
     async def substitute(self, dl_path):
@@ -1067,7 +1144,7 @@ class TaskConfig:
             await move(dl_path, new_path)
             return new_path
         else:
-            for dirpath, _, files in await sync_to_async(walk, dl_path, topdown=False):
+            for dirpath, _, files in await self.walk_files(dl_path):
                 for file_ in files:
                     f_path = ospath.join(dirpath, file_)
                     new_name = perform_swap(file_, self.name_swap)
@@ -1090,9 +1167,10 @@ class TaskConfig:
             from .ext_utils.media_utils import take_ss as ss_func
         
         if self.is_file:
-            if (await get_document_type(dl_path))[0]:
+            if (await self.document_type(dl_path))[0]:
                 LOGGER.info(f"Creating Screenshot ({self.screenshot_mode}, {orientation}) for: {dl_path}")
-                res = await ss_func(dl_path, ss_nb, orientation=orientation, sst=sst)
+                async with cpu_scheduler.slot(self.mid, SCREENSHOT):
+                    res = await ss_func(dl_path, ss_nb, orientation=orientation, sst=sst)
                 if res:
                     if not self.is_leech:
                         await self.send_screenshots_to_tg(res, dl_path)
@@ -1110,11 +1188,12 @@ class TaskConfig:
                     return new_folder
         else:
             LOGGER.info(f"Creating Screenshot ({self.screenshot_mode}, {orientation}) for: {dl_path}")
-            for dirpath, _, files in await sync_to_async(walk, dl_path, topdown=False):
+            for dirpath, _, files in await self.walk_files(dl_path):
                 for file_ in files:
                     f_path = ospath.join(dirpath, file_)
-                    if (await get_document_type(f_path))[0]:
-                        res = await ss_func(f_path, ss_nb, orientation=orientation, sst=sst)
+                    if (await self.document_type(f_path))[0]:
+                        async with cpu_scheduler.slot(self.mid, SCREENSHOT):
+                            res = await ss_func(f_path, ss_nb, orientation=orientation, sst=sst)
                         if res and not self.is_leech:
                             await self.send_screenshots_to_tg(res, f_path)
                             await rmtree(res, ignore_errors=True)
@@ -1218,13 +1297,13 @@ class TaskConfig:
         if self.is_file:
             all_files.append(dl_path)
         else:
-            for dirpath, _, files in await sync_to_async(walk, dl_path, topdown=False):
+            for dirpath, _, files in await self.walk_files(dl_path):
                 for file_ in files:
                     f_path = ospath.join(dirpath, file_)
                     all_files.append(f_path)
 
         for f_path in all_files:
-            is_video, is_audio, _ = await get_document_type(f_path)
+            is_video, is_audio, _ = await self.document_type(f_path)
             if (
                 is_video
                 and vext
@@ -1259,7 +1338,7 @@ class TaskConfig:
             async with task_dict_lock:
                 task_dict[self.mid] = FFmpegStatus(self, ffmpeg, gid, "Convert")
             self.progress = False
-            async with cpu_eater_lock:
+            async with cpu_scheduler.slot(self.mid, TRANSCODE):
                 self.progress = True
                 for f_path, f_type in self.files_to_proceed.items():
                     self.proceed_count += 1
@@ -1267,7 +1346,7 @@ class TaskConfig:
                     if self.is_file:
                         self.subsize = self.size
                     else:
-                        self.subsize = await get_path_size(f_path)
+                        self.subsize = await self.path_size(f_path)
                         self.subname = ospath.basename(f_path)
                     if f_type == "video":
                         res = await ffmpeg.convert_video(f_path, vext)
@@ -1295,21 +1374,21 @@ class TaskConfig:
             part_duration = 4
 
         self.files_to_proceed = {}
-        if self.is_file and (await get_document_type(dl_path))[0]:
+        if self.is_file and (await self.document_type(dl_path))[0]:
             file_ = ospath.basename(dl_path)
             self.files_to_proceed[dl_path] = file_
         else:
-            for dirpath, _, files in await sync_to_async(walk, dl_path, topdown=False):
+            for dirpath, _, files in await self.walk_files(dl_path):
                 for file_ in files:
                     f_path = ospath.join(dirpath, file_)
-                    if (await get_document_type(f_path))[0]:
+                    if (await self.document_type(f_path))[0]:
                         self.files_to_proceed[f_path] = file_
         if self.files_to_proceed:
             ffmpeg = FFMpeg(self)
             async with task_dict_lock:
                 task_dict[self.mid] = FFmpegStatus(self, ffmpeg, gid, "Sample Video")
             self.progress = False
-            async with cpu_eater_lock:
+            async with cpu_scheduler.slot(self.mid, TRANSCODE):
                 self.progress = True
                 LOGGER.info(f"Creating Sample video: {self.name}")
                 for f_path, file_ in self.files_to_proceed.items():
@@ -1317,7 +1396,7 @@ class TaskConfig:
                     if self.is_file:
                         self.subsize = self.size
                     else:
-                        self.subsize = await get_path_size(f_path)
+                        self.subsize = await self.path_size(f_path)
                         self.subname = file_
                     res = await ffmpeg.sample_video(
                         f_path, sample_duration, part_duration
@@ -1357,14 +1436,14 @@ class TaskConfig:
     async def proceed_split(self, dl_path, gid):
         self.files_to_proceed = {}
         if self.is_file:
-            f_size = await get_path_size(dl_path)
+            f_size = await self.path_size(dl_path)
             if f_size > self.split_size:
                 self.files_to_proceed[dl_path] = [f_size, ospath.basename(dl_path)]
         else:
-            for dirpath, _, files in await sync_to_async(walk, dl_path, topdown=False):
+            for dirpath, _, files in await self.walk_files(dl_path):
                 for file_ in files:
                     f_path = ospath.join(dirpath, file_)
-                    f_size = await get_path_size(f_path)
+                    f_size = await self.path_size(f_path)
                     if f_size > self.split_size:
                         self.files_to_proceed[f_path] = [f_size, file_]
         if self.files_to_proceed:
@@ -1379,21 +1458,39 @@ class TaskConfig:
                 else:
                     self.subsize = f_size
                     self.subname = file_
-                parts = -(-f_size // self.split_size)
-                if self.equal_splits:
-                    split_size = (f_size // parts) + (f_size % parts)
-                else:
-                    split_size = self.split_size
-                if not self.as_doc and (await get_document_type(f_path))[0]:
-                    self.progress = True
-                    res = await ffmpeg.split(f_path, file_, parts, split_size)
-                else:
-                    self.progress = False
-                    res = await split_file(f_path, split_size, self)
-                if self.is_cancelled:
+                if not await self.split_one(ffmpeg, f_path, f_size, file_):
                     return False
-                if res or f_size >= self.max_split_size:
-                    try:
-                        await remove(f_path)
-                    except Exception:
-                        self.is_cancelled = True
+
+    async def split_one(self, ffmpeg, f_path, f_size, file_):
+        """Splits one file into leech sized parts, False once cancelled."""
+        parts = -(-f_size // self.split_size)
+        if self.equal_splits:
+            split_size = (f_size // parts) + (f_size % parts)
+        else:
+            split_size = self.split_size
+        if not self.as_doc and (await self.document_type(f_path))[0]:
+            self.progress = True
+            res = await ffmpeg.split(f_path, file_, parts, split_size)
+            if not res and not self.is_cancelled:
+                # No keyframes or stream to cut on, or parts that won't fit,
+                # byte parts still get the file uploaded
+                LOGGER.warning(f"Splitting by size instead. Path: {f_path}")
+                self.progress = False
+                res = await split_file(f_path, split_size, self)
+        else:
+            self.progress = False
+            res = await split_file(f_path, split_size, self)
+        if self.is_cancelled:
+            return False
+        # The source is only removed once its parts are there
+        base_name, extension = ospath.splitext(f_path)
+        if res and (
+            await aiopath.exists(f"{base_name}.part001{extension}")
+            or await aiopath.exists(f"{f_path}.001")
+        ):
+            try:
+                await remove(f_path)
+            except Exception:
+                self.is_cancelled = True
+                return False
+        return True
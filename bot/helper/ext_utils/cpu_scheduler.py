@@ -0,0 +1,100 @@
+from asyncio import CancelledError, Event
+from contextlib import asynccontextmanager
+
+from psutil import virtual_memory
+
+from ... import cpu_no
+
+COPY, EXTRACT, SCREENSHOT, TRANSCODE = "copy", "extract", "screenshot", "transcode"
+# CPU units a job holds, the scheduler has one unit per core. A transcode
+# uses the same share of cores media_utils gives ffmpeg threads
+JOB_COSTS = {COPY: 0, EXTRACT: 1, SCREENSHOT: 1, TRANSCODE: max(1, cpu_no // 2)}
+# Stream copies are disk bound and cost no units, only a job slot
+MAX_JOBS = max(2, cpu_no * 2)
+# Jobs that decode frames wait while free RAM is below this
+MIN_FREE_RAM = 512 * 1024**2
+
+_CODEC_FLAGS = {"-c", "-codec", "-vcodec", "-acodec", "-scodec"}
+_FILTER_FLAGS = {"-vf", "-af", "-filter", "-filter_complex", "-lavfi"}
+
+
+def job_class(cmd):
+    """COPY when an ffmpeg cmd only remuxes streams, TRANSCODE otherwise."""
+    copies = False
+    for index, part in enumerate(cmd):
+        flag = part.split(":", 1)[0]
+        if flag in _FILTER_FLAGS:
+            return TRANSCODE
+        if flag in _CODEC_FLAGS and index + 1 < len(cmd):
+            if cmd[index + 1] != "copy":
+                return TRANSCODE
+            copies = True
+    return COPY if copies else TRANSCODE
+
+
+class CpuScheduler:
+    def __init__(self, capacity=cpu_no, max_jobs=MAX_JOBS):
+        self.capacity = max(1, capacity)
+        self.max_jobs = max_jobs
+        self._used = 0
+        self._jobs = 0
+        self._waiters = []
+
+    def _fits(self, cost, free):
+        if self._jobs == 0:
+            return True
+        if self._jobs >= self.max_jobs:
+            return False
+        if not cost:
+            return True
+        return cost <= free and virtual_memory().available >= MIN_FREE_RAM
+
+    def _wake(self):
+        free = self.capacity - self._used
+        for waiter in list(self._waiters):
+            _, cost, event = waiter
+            if self._fits(cost, free):
+                self._waiters.remove(waiter)
+                self._used += cost
+                self._jobs += 1
+                event.set()
+            # A skipped job keeps its share, so the cheaper ones behind it
+            # can only use what is left and it isn't starved
+            free -= cost
+
+    async def acquire(self, mid, job):
+        cost = min(JOB_COSTS[job], self.capacity)
+        waiter = (mid, cost, Event())
+        self._waiters.append(waiter)
+        self._wake()
+        try:
+            await waiter[2].wait()
+        except CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            else:
+                self.release(cost)
+            raise
+        return cost
+
+    def release(self, cost):
+        self._used -= cost
+        self._jobs -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, mid, job):
+        cost = await self.acquire(mid, job)
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+    def position(self, mid):
+        for pos, (wmid, _, _) in enumerate(self._waiters, start=1):
+            if wmid == mid:
+                return pos, len(self._waiters)
+        return None
+
+
+cpu_scheduler = CpuScheduler()
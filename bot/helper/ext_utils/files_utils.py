@@ -1,10 +1,18 @@
 from aioshutil import rmtree as aiormtree, move
-from asyncio import create_subprocess_exec, sleep, wait_for
+from asyncio import FIRST_COMPLETED, create_subprocess_exec, create_task, sleep, wait, wait_for
 from asyncio.subprocess import PIPE
 from contextlib import suppress
 from psutil import disk_usage
 from os import path as ospath, readlink, walk
-from re import I, escape, search as re_search, split as re_split
+from re import (
+    I,
+    M,
+    compile as re_compile,
+    escape,
+    search as re_search,
+    split as re_split,
+    sub as re_sub,
+)
 
 from aiofiles.os import (
     listdir,
@@ -17,9 +25,10 @@ from aiofiles.os import (
 )
 from magic import Magic
 
-from ... import DOWNLOAD_DIR, LOGGER
+from ... import DOWNLOAD_DIR, LOGGER, cpu_no
 from ...core.torrent_manager import TorrentManager
 from .bot_utils import cmd_exec, sync_to_async
+from .cpu_scheduler import EXTRACT, cpu_scheduler
 from .exceptions import NotSupportedExtractionArchive
 
 ARCH_EXT = [
@@ -109,6 +118,15 @@ def is_archive_split(file):
     return bool(re_search(SPLIT_REGEX, file.lower(), I))
 
 
+def archive_set_name(file):
+    """Name shared by all volumes of a split archive, e.g. x for x.part01.rar."""
+    name = re_sub(SPLIT_REGEX, "", file, flags=I)
+    if name == file:
+        # Old style volumes, x.rar with x.r00 and x.zip with x.z01
+        name = re_sub(r"\.(rar|zip)$", "", file, flags=I)
+    return name
+
+
 async def clean_target(opath):
     if await aiopath.exists(opath):
         LOGGER.info(f"Cleaning Target: {opath}")
@@ -228,7 +246,13 @@ def get_mime_type(file_path):
     return mime_type
 
 
-async def remove_excluded_files(fpath, ee):
+async def remove_excluded_files(fpath, ee, manifest=None):
+    if manifest is not None:
+        for f_path in manifest.files(fpath):
+            if ospath.basename(f_path).strip().lower().endswith(tuple(ee)):
+                await remove(f_path)
+                manifest.discard(f_path)
+        return
     for root, _, files in await sync_to_async(walk, fpath):
         for f in files:
             if f.strip().lower().endswith(tuple(ee)):
@@ -317,40 +341,67 @@ async def split_file(f_path, split_size, listener):
 class SevenZ:
     def __init__(self, listener):
         self._listener = listener
-        self._processed_bytes = 0
-        self._percentage = "0%"
+        # Running 7z processes and the bytes each has processed so far
+        self._procs = {}
+        self._done_bytes = 0
 
     @property
     def processed_bytes(self):
-        return self._processed_bytes
+        return self._done_bytes + sum(self._procs.values())
 
     @property
     def progress(self):
-        return self._percentage
-
-    async def _sevenz_progress(self):
+        if not self._listener.subsize:
+            return "0%"
+        return f"{min(self.processed_bytes * 100 / self._listener.subsize, 100):.0f}%"
+
+    def cancel(self):
+        for proc in list(self._procs):
+            if proc.returncode is None:
+                with suppress(Exception):
+                    proc.kill()
+
+    @staticmethod
+    def _member_name(line):
+        """Name in a 7z -bb3 "- name" log line, past any erased progress."""
+        line = line.rsplit("\b", 1)[-1].strip()
+        return line[2:] if line.startswith("- ") else None
+
+    async def _sevenz_progress(self, proc, size, on_member=None):
+        """Tracks the progress of one 7z process, returns the output it read.
+
+        on_member gets the name of every item as 7z starts writing it. Only
+        the summary lines (Size:, Files:, ...) and the unfinished line are
+        returned, everything else is consumed here.
+        """
         pattern = r"(\d+)\s+bytes|Total Physical Size\s*=\s*(\d+)"
+        summary = re_compile(r"^(Size|Files|Folders|Compressed):\s")
+        kept = []
         while not (
-            self._listener.subproc.returncode is not None
+            proc.returncode is not None
             or self._listener.is_cancelled
-            or self._listener.subproc.stdout.at_eof()
+            or proc.stdout.at_eof()
         ):
             try:
-                line = await wait_for(self._listener.subproc.stdout.readline(), 2)
+                line = await wait_for(proc.stdout.readline(), 2)
             except Exception:
                 break
             line = line.decode().strip()
-            if match := re_search(pattern, line):
-                self._listener.subsize = int(match[1] or match[2])
+            if not size and (match := re_search(pattern, line)):
+                size = int(match[1] or match[2])
+            if summary.match(line):
+                kept.append(line)
+            if on_member and (name := self._member_name(line)):
+                on_member(name)
             await sleep(0.05)
         s = b""
         while not (
             self._listener.is_cancelled
-            or self._listener.subproc.returncode is not None
-            or self._listener.subproc.stdout.at_eof()
+            or proc.returncode is not None
+            or proc.stdout.at_eof()
         ):
             try:
-                char = await wait_for(self._listener.subproc.stdout.read(1), 60)
+                char = await wait_for(proc.stdout.read(1), 60)
             except Exception:
                 break
             if not char:
@@ -358,20 +409,65 @@ class SevenZ:
             s += char
             if char == b"%":
                 try:
-                    self._percentage = s.decode().rsplit(" ", 1)[-1].strip()
-                    self._processed_bytes = (
-                        int(self._percentage.strip("%")) / 100
-                    ) * self._listener.subsize
+                    percentage = s.decode().rsplit(" ", 1)[-1].strip()
+                    self._procs[proc] = (int(percentage.strip("%")) / 100) * size
                 except Exception:
-                    self._processed_bytes = 0
-                    self._percentage = "0%"
+                    self._procs[proc] = 0
+                s = b""
+            elif char == b"\n":
+                with suppress(Exception):
+                    line = s.decode().rsplit("\b", 1)[-1].strip()
+                    if summary.match(line):
+                        kept.append(line)
+                    if on_member and (name := self._member_name(line)):
+                        on_member(name)
                 s = b""
             await sleep(0.05)
+        return "".join(f"{line}\n" for line in kept).encode() + s
+
+    async def _run(self, cmd, size, on_member=None):
+        """Runs one 7z cmd next to any others, returns (code, stdout, stderr)."""
+        if self._listener.is_cancelled:
+            return -9, "", ""
+        proc = await create_subprocess_exec(*cmd, stdout=PIPE, stderr=PIPE)
+        self._listener.subproc = proc
+        self._procs[proc] = 0
+        try:
+            tail = await self._sevenz_progress(proc, size, on_member)
+            if self._listener.is_cancelled and proc.returncode is None:
+                with suppress(Exception):
+                    proc.kill()
+            stdout, stderr = await proc.communicate()
+        finally:
+            del self._procs[proc]
+        if proc.returncode == 0:
+            self._done_bytes += size
+        try:
+            stdout = (tail + stdout).decode()
+        except Exception:
+            stdout = ""
+        try:
+            stderr = stderr.decode().strip()
+        except Exception:
+            stderr = "Unable to decode the error!"
+        return proc.returncode, stdout, stderr
 
-        self._processed_bytes = 0
-        self._percentage = "0%"
+    async def members(self, f_path, pswd):
+        """Paths inside an archive read from its headers, None if unreadable."""
+        cmd = ["7z", "l", "-slt", "-ba", f"-p{pswd}", f_path]
+        if not pswd:
+            del cmd[4]
+        stdout, _, code = await cmd_exec(cmd)
+        if code != 0:
+            return None
+        return [
+            line.split(" = ", 1)[1]
+            for line in stdout.splitlines()
+            if line.startswith("Path = ")
+        ]
 
-    async def extract(self, f_path, t_path, pswd):
+    async def extract(self, f_path, t_path, pswd, size=0, on_member=None):
+        """Returns the exit code and the unpacked size 7z reported, else 0."""
         cmd = [
             "7z",
             "x",
@@ -386,28 +482,16 @@ class SevenZ:
         ]
         if not pswd:
             del cmd[2]
+        code, stdout, stderr = await self._run(cmd, size, on_member)
         if self._listener.is_cancelled:
-            return False
-        self._listener.subproc = await create_subprocess_exec(
-            *cmd,
-            stdout=PIPE,
-            stderr=PIPE,
-        )
-        await self._sevenz_progress()
-        _, stderr = await self._listener.subproc.communicate()
-        code = self._listener.subproc.returncode
-        if self._listener.is_cancelled:
-            return False
+            return False, 0
         if code == -9:
             self._listener.is_cancelled = True
-            return False
+            return False, 0
         elif code != 0:
-            try:
-                stderr = stderr.decode().strip()
-            except Exception:
-                stderr = "Unable to decode the error!"
             LOGGER.error(f"{stderr}. Unable to extract archive!. Path: {f_path}")
-        return code
+        unpacked = re_search(r"^Size:\s+(\d+)", stdout, M)
+        return code, int(unpacked[1]) if unpacked else 0
 
     async def zip(self, dl_path, up_path, pswd):
         size = await get_path_size(dl_path)
@@ -437,14 +521,8 @@ class SevenZ:
             if not pswd:
                 del cmd[3]
             LOGGER.info(f"Zip: orig_path: {dl_path}, zip_path: {up_path}")
-        if self._listener.is_cancelled:
-            return False
-        self._listener.subproc = await create_subprocess_exec(
-            *cmd, stdout=PIPE, stderr=PIPE
-        )
-        await self._sevenz_progress()
-        _, stderr = await self._listener.subproc.communicate()
-        code = self._listener.subproc.returncode
+        self._listener.subsize = size
+        code, _, stderr = await self._run(cmd, size)
         if self._listener.is_cancelled:
             return False
         if code == -9:
@@ -456,9 +534,190 @@ class SevenZ:
         else:
             if await aiopath.exists(up_path):
                 await remove(up_path)
-            try:
-                stderr = stderr.decode().strip()
-            except Exception:
-                stderr = "Unable to decode the error!"
             LOGGER.error(f"{stderr}. Unable to zip this path: {dl_path}")
             return dl_path
+
+
+class ArchiveExtractor:
+    """Extracts the archive sets of a download concurrently.
+
+    Every set is a job holding a core of the cpu_scheduler, at most
+    MAX_WORKERS of them run at once. Archives found in the output of a
+    finished job are queued right away, so nested layers don't wait for
+    the rest of their parent layer.
+    """
+
+    MAX_WORKERS = max(1, cpu_no // 2)
+    MAX_DEPTH = 10
+    BOMB_LIMIT = 50 * 1024**3
+
+    def __init__(self, listener, sevenz, pswd, ready=None):
+        self._listener = listener
+        self._sevenz = sevenz
+        self._pswd = pswd
+        # Gets the path of every member once 7z has finished writing it
+        self._ready = ready
+        self._extracted = 0
+        self._in_flight = 0
+        self._seen = set()
+
+    @staticmethod
+    def _is_first_volume(file_):
+        return is_first_archive_split(file_) or (
+            is_archive(file_) and not file_.strip().lower().endswith(".rar")
+        )
+
+    @classmethod
+    async def scan(cls, path, manifest=None):
+        if manifest is not None:
+            if manifest.is_file(path):
+                return [path] if is_archive(path) else []
+            return [
+                f_path
+                for f_path in manifest.files(path)
+                if cls._is_first_volume(ospath.basename(f_path))
+            ]
+        found = []
+        if await aiopath.isfile(path) and is_archive(path):
+            found.append(path)
+        elif await aiopath.isdir(path):
+            for dirpath, _, files in await sync_to_async(walk, path, topdown=False):
+                for file_ in files:
+                    if cls._is_first_volume(file_):
+                        found.append(ospath.join(dirpath, file_))
+        return found
+
+    @staticmethod
+    async def _volumes(f_path):
+        dirpath, name = ospath.split(f_path)
+        set_name = archive_set_name(name)
+        return [
+            ospath.join(dirpath, file_)
+            for file_ in await listdir(dirpath)
+            if file_ == name
+            or (is_archive_split(file_) and archive_set_name(file_) == set_name)
+        ]
+
+    def target(self, f_path):
+        if self._listener.is_file:
+            return get_base_name(f_path)
+        return ospath.dirname(f_path)
+
+    async def _extract(self, f_path, size, depth):
+        """Returns the (archive, depth) jobs found in the extracted output."""
+        volumes = await self._volumes(f_path)
+        t_path = self.target(f_path)
+        async with cpu_scheduler.slot(self._listener.mid, EXTRACT):
+            if self._listener.is_cancelled:
+                return []
+            # Other sets may be extracting into the same folder, so nested
+            # archives come from this one's own listing, not a folder scan
+            members = await self._sevenz.members(f_path, self._pswd)
+            self._listener.proceed_count += 1
+            if not self._listener.is_file:
+                self._listener.subname = ospath.basename(f_path)
+            current = None
+
+            def on_member(name):
+                # 7z writes one member at a time, starting the next one
+                # means the previous is complete
+                nonlocal current
+                if current is not None:
+                    self._ready.put_nowait(current)
+                current = ospath.join(t_path, name)
+
+            code, unpacked = await self._sevenz.extract(
+                f_path,
+                t_path,
+                self._pswd,
+                size,
+                on_member if self._ready is not None else None,
+            )
+        self._in_flight -= size
+        if self._listener.is_cancelled:
+            return []
+        if code != 0:
+            LOGGER.warning(f"Failed to extract {f_path}. Code: {code}")
+            return []
+        if current is not None:
+            self._ready.put_nowait(current)
+        if not unpacked:
+            # 7z's summary got lost, the bomb guard needs real bytes, not
+            # the compressed size
+            if members is None:
+                unpacked = await get_path_size(t_path)
+            else:
+                unpacked = await sync_to_async(
+                    self._members_size, t_path, members
+                )
+        self._extracted += unpacked
+        for volume in volumes:
+            with suppress(Exception):
+                await remove(volume)
+        if (manifest := self._listener.manifest) is not None:
+            for volume in volumes:
+                manifest.discard(volume)
+            if members is None:
+                await manifest.refresh(t_path)
+            else:
+                # Folders of the members, 7z renames a clashing file in place
+                await manifest.refresh(
+                    t_path,
+                    *{ospath.dirname(ospath.join(t_path, m)) for m in members},
+                    recursive=False,
+                )
+        if depth + 1 >= self.MAX_DEPTH:
+            return []
+        if members is None:
+            nested = await self.scan(t_path)
+        else:
+            nested = [
+                ospath.join(t_path, member)
+                for member in members
+                if self._is_first_volume(ospath.basename(member))
+            ]
+        return [(nf, depth + 1) for nf in nested if await aiopath.isfile(nf)]
+
+    @staticmethod
+    def _members_size(t_path, members):
+        size = 0
+        for member in members:
+            with suppress(OSError):
+                if ospath.isfile(f_path := ospath.join(t_path, member)):
+                    size += ospath.getsize(f_path)
+        return size
+
+    async def run(self, archives):
+        pending = [(f_path, 0) for f_path in archives]
+        running = set()
+        while pending or running:
+            while pending and len(running) < self.MAX_WORKERS:
+                f_path, depth = pending.pop(0)
+                if f_path in self._seen:
+                    continue
+                self._seen.add(f_path)
+                size = 0
+                for volume in await self._volumes(f_path):
+                    size += await get_path_size(volume)
+                if self._extracted + self._in_flight + size > self.BOMB_LIMIT:
+                    LOGGER.warning(
+                        f"Zip bomb risk detected! Stopping extraction at: {f_path}"
+                    )
+                    pending.clear()
+                    break
+                if depth:
+                    self._listener.total_count += 1
+                self._in_flight += size
+                self._listener.subsize += size
+                running.add(create_task(self._extract(f_path, size, depth)))
+            if not running:
+                break
+            done, running = await wait(running, return_when=FIRST_COMPLETED)
+            for task in done:
+                pending.extend(task.result())
+            if self._listener.is_cancelled:
+                self._sevenz.cancel()
+                if running:
+                    await wait(running)
+                return False
+        return True
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from hashlib import md5, sha1
+from json import dumps, loads
+from mmap import ACCESS_READ, mmap
+from os import getxattr, setxattr, stat
+
+try:
+    from xxhash import xxh64
+except ImportError:
+    xxh64 = None
+
+from ... import LOGGER
+from ...core.config_manager import Config
+from .bot_utils import sync_to_async
+
+HASHERS = {"md5": md5, "sha1": sha1}
+if xxh64 is not None:
+    HASHERS["xxh64"] = xxh64
+
+# Hashes ride along with the file as an xattr, so renames and moves keep them
+HASH_XATTR = "user.mltb.hashes"
+MMAP_CHUNK = 16 * 1024**2
+# Used where the filesystem has no user xattrs, keyed by (device, inode)
+_sidecars = OrderedDict()
+MAX_SIDECARS = 1024
+
+
+def hash_algo():
+    algo = (Config.HASH_ALGORITHM or "md5").lower()
+    return algo if algo in HASHERS else "md5"
+
+
+class StreamHasher:
+    """Hashes a file from the chunks written while downloading it.
+
+    Chunks may land out of order, those ahead of the hashed offset wait in a
+    bounded buffer. Once it overflows the stream is given up and the file
+    gets hashed from disk when needed.
+    """
+
+    MAX_PENDING = 64 * 1024**2
+
+    def __init__(self, algos=None):
+        algos = algos or {"md5", hash_algo()}
+        self._hashers = {algo: HASHERS[algo]() for algo in algos}
+        self._offset = 0
+        self._pending = {}
+        self._pending_bytes = 0
+        self.valid = True
+
+    def _update(self, data):
+        for hasher in self._hashers.values():
+            hasher.update(data)
+        self._offset += len(data)
+
+    def write(self, offset, data):
+        if not self.valid:
+            return
+        if offset != self._offset:
+            if offset < self._offset or offset in self._pending:
+                self.invalidate()
+                return
+            self._pending[offset] = data
+            self._pending_bytes += len(data)
+            if self._pending_bytes > self.MAX_PENDING:
+                self.invalidate()
+            return
+        self._update(data)
+        while self._offset in self._pending:
+            data = self._pending.pop(self._offset)
+            self._pending_bytes -= len(data)
+            self._update(data)
+
+    def invalidate(self):
+        self.valid = False
+        self._pending.clear()
+        self._pending_bytes = 0
+
+    def digests(self, size):
+        if not self.valid or self._offset != size:
+            return None
+        return {algo: hasher.hexdigest() for algo, hasher in self._hashers.items()}
+
+
+def load_hashes(path):
+    st = stat(path)
+    try:
+        record = loads(getxattr(path, HASH_XATTR))
+    except (OSError, ValueError):
+        record = _sidecars.get((st.st_dev, st.st_ino))
+    if (
+        record
+        and record.get("size") == st.st_size
+        and record.get("mtime_ns") == st.st_mtime_ns
+    ):
+        return record
+    return {}
+
+
+def save_hashes(path, hashes):
+    st = stat(path)
+    record = {
+        **load_hashes(path),
+        **hashes,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+    try:
+        setxattr(path, HASH_XATTR, dumps(record).encode())
+    except OSError:
+        key = (st.st_dev, st.st_ino)
+        _sidecars[key] = record
+        _sidecars.move_to_end(key)
+        if len(_sidecars) > MAX_SIDECARS:
+            _sidecars.popitem(last=False)
+
+
+def file_hash(path, algo=None):
+    algo = algo or hash_algo()
+    if digest := load_hashes(path).get(algo):
+        return digest
+    hasher = HASHERS[algo]()
+    with open(path, "rb") as f:
+        if stat(path).st_size:
+            with mmap(f.fileno(), 0, access=ACCESS_READ) as mm, memoryview(
+                mm
+            ) as view:
+                for start in range(0, len(view), MMAP_CHUNK):
+                    hasher.update(view[start : start + MMAP_CHUNK])
+    digest = hasher.hexdigest()
+    try:
+        save_hashes(path, {algo: digest})
+    except OSError as e:
+        LOGGER.warning(f"Couldn't store {algo} of {path}: {e}")
+    return digest
+
+
+async def get_file_hash(path, algo=None):
+    return await sync_to_async(file_hash, path, algo)
@@ -6,32 +6,302 @@ from asyncio import (
     wait_for,
     TimeoutError as AsyncTimeoutError,
     Event,
+    Lock,
+    Queue,
+    QueueEmpty,
+    shield,
+    wait,
+    FIRST_EXCEPTION,
 )
+from collections import OrderedDict
 from datetime import datetime
-from math import ceil, floor
+from json import dumps, loads
 from mimetypes import guess_extension
-from os import path as ospath
+from os import (
+    O_CREAT,
+    O_RDWR,
+    close as osclose,
+    ftruncate,
+    listdir,
+    open as osopen,
+    path as ospath,
+    pwrite,
+    remove as osremove,
+    replace,
+)
 from pathlib import Path
 from re import sub
 from sys import argv
 from time import time
 
-from aiofiles import open as aiopen
 from aiofiles.os import makedirs, remove
 from aioshutil import move
+from psutil import virtual_memory
 from pyrogram import StopTransmission, raw, utils
-from pyrogram.errors import AuthBytesInvalid, FloodWait
+from pyrogram.errors import AuthBytesInvalid, FileReferenceExpired, FloodWait
 from pyrogram.file_id import PHOTO_TYPES, FileId, FileType, ThumbnailSource
 from pyrogram.session import Auth, Session
 from pyrogram.session.internals import MsgId
 
-from ... import LOGGER, status_dict, task_dict_lock, task_dict
-from ..mirror_leech_utils.status_utils.merge_status import MergeStatus
+from ... import LOGGER
 from ...core.config_manager import Config
 from ...core.tg_client import TgClient
+from .bot_utils import sync_to_async
+from .hash_utils import StreamHasher, save_hashes
+
+try:
+    from os import posix_fallocate
+except ImportError:
+    posix_fallocate = None
+
+
+class MediaSessionPool:
+    """Process-wide, reference-counted MTProto media sessions per (client, dc)."""
+
+    IDLE_TIMEOUT = 10 * 60
+
+    _sessions = {}
+    # Broken sessions dropped from the pool that are still held
+    _retired = {}
+    _locks = {}
+    _cleaner = None
+
+    @staticmethod
+    def _is_alive(client, session):
+        started = getattr(session, "is_started", None)
+        return client.is_connected and (started is None or started.is_set())
+
+    @classmethod
+    async def acquire(cls, client, dc_id):
+        key = (client, dc_id)
+        lock = cls._locks.setdefault(key, Lock())
+        async with lock:
+            entry = cls._sessions.get(key)
+            if entry and not cls._is_alive(client, entry["session"]):
+                cls._sessions.pop(key, None)
+                await cls._stop_session(entry["session"])
+                entry = None
+            if entry is None:
+                entry = {
+                    "session": await cls._create_session(client, dc_id),
+                    "refs": 0,
+                    "last_used": time(),
+                }
+                cls._sessions[key] = entry
+            entry["refs"] += 1
+            entry["last_used"] = time()
+        if cls._cleaner is None or cls._cleaner.done():
+            cls._cleaner = create_task(cls._evict_idle())
+        return entry["session"]
+
+    @classmethod
+    async def release(cls, client, dc_id, session):
+        entry = cls._sessions.get((client, dc_id))
+        if entry is None or entry["session"] is not session:
+            if (entry := cls._retired.get(session)) is None:
+                return
+        entry["refs"] = max(0, entry["refs"] - 1)
+        entry["last_used"] = time()
+        if entry["refs"] == 0 and cls._retired.pop(session, None):
+            await cls._stop_session(session)
+
+    @classmethod
+    async def invalidate(cls, client, dc_id, session):
+        """Drops a broken session and the caller's reference to it.
+
+        It's stopped once no other download holds it. A session already
+        replaced in the pool leaves the new one alone.
+        """
+        key = (client, dc_id)
+        entry = cls._sessions.get(key)
+        if entry is not None and entry["session"] is session:
+            cls._sessions.pop(key)
+            cls._retired[session] = entry
+        await cls.release(client, dc_id, session)
+
+    @classmethod
+    async def stop_all(cls):
+        sessions = [entry["session"] for entry in cls._sessions.values()]
+        sessions.extend(cls._retired)
+        cls._sessions.clear()
+        cls._retired.clear()
+        await gather(*(cls._stop_session(s) for s in sessions))
+
+    @staticmethod
+    async def _stop_session(session):
+        try:
+            await session.stop()
+        except Exception:
+            pass
+
+    @classmethod
+    async def _evict_idle(cls):
+        while cls._sessions:
+            await sleep(60)
+            now = time()
+            for key, entry in list(cls._sessions.items()):
+                client, _ = key
+                if entry["refs"] == 0 and (
+                    now - entry["last_used"] > cls.IDLE_TIMEOUT
+                    or not cls._is_alive(client, entry["session"])
+                ):
+                    cls._sessions.pop(key, None)
+                    cls._locks.pop(key, None)
+                    await cls._stop_session(entry["session"])
+
+    @staticmethod
+    async def _create_session(client, dc_id, max_retries=3):
+        retries = 0
+        while retries < max_retries:
+            try:
+                if dc_id != await client.storage.dc_id():
+                    media_session = Session(
+                        client,
+                        dc_id,
+                        await Auth(
+                            client, dc_id, await client.storage.test_mode()
+                        ).create(),
+                        await client.storage.test_mode(),
+                        is_media=True,
+                    )
+                    await media_session.start()
+
+                    for _ in range(6):
+                        exported_auth = await client.invoke(
+                            raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+                        )
+
+                        try:
+                            await media_session.invoke(
+                                raw.functions.auth.ImportAuthorization(
+                                    id=exported_auth.id, bytes=exported_auth.bytes
+                                )
+                            )
+                            break
+                        except AuthBytesInvalid:
+                            await sleep(1)
+                    else:
+                        await media_session.stop()
+                        raise AuthBytesInvalid
+                else:
+                    media_session = Session(
+                        client,
+                        dc_id,
+                        await client.storage.auth_key(),
+                        await client.storage.test_mode(),
+                        is_media=True,
+                    )
+                    await media_session.start()
+
+                return media_session
+
+            except Exception:
+                retries += 1
+                await sleep(1)
+
+        raise ValueError(f"Failed to create media session after {max_retries} attempts")
+
+
+class FileRefCache:
+    """LRU/TTL cache of file ids keyed by (chat, message id, client index).
+
+    Concurrent misses for the same key share one in-flight get_messages.
+    """
+
+    MAX_SIZE = 500
+    TTL = 45 * 60
+
+    _cache = OrderedDict()
+    _inflight = {}
+
+    @classmethod
+    async def get(cls, key, fetch):
+        if entry := cls._cache.get(key):
+            file_id, stored_at = entry
+            if time() - stored_at < cls.TTL:
+                cls._cache.move_to_end(key)
+                return file_id
+            cls._cache.pop(key, None)
+        task = cls._inflight.get(key)
+        if task is None:
+            task = cls._inflight[key] = create_task(fetch())
+            task.add_done_callback(lambda t: cls._on_fetched(key, t))
+        return await shield(task)
+
+    @classmethod
+    def _on_fetched(cls, key, task):
+        cls._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        cls._cache[key] = (task.result(), time())
+        cls._cache.move_to_end(key)
+        while len(cls._cache) > cls.MAX_SIZE:
+            cls._cache.popitem(last=False)
+
+    @classmethod
+    def invalidate(cls, key):
+        cls._cache.pop(key, None)
+
+
+class HyperDLTuner:
+    """Per-DC memory of the request size and concurrency that worked best."""
+
+    MIN_CHUNK = 128 * 1024
+    MAX_CHUNK = 1024 * 1024  # upload.GetFile never returns more per request
+
+    _dc_stats = {}
+
+    @classmethod
+    def ram_budget(cls):
+        share = 0.05 if Config.HIGH_PERFORMANCE_MODE else 0.01
+        return max(4 * cls.MAX_CHUNK, int(virtual_memory().available * share))
+
+    @classmethod
+    def chunk_size(cls, dc_id):
+        chunk_size = cls._dc_stats.get(dc_id, {}).get("chunk_size", cls.MAX_CHUNK)
+        # Keep a handful of requests in flight even on low-RAM hosts
+        while chunk_size > cls.MIN_CHUNK and cls.ram_budget() < 8 * chunk_size:
+            chunk_size //= 2
+        return chunk_size
+
+    @classmethod
+    def max_workers(cls, chunk_size, clients):
+        if Config.HIGH_PERFORMANCE_MODE:
+            limit = Config.HYPER_THREADS or max(8, clients)
+        else:
+            limit = 4
+        return max(1, min(limit, clients * 4, cls.ram_budget() // chunk_size))
+
+    @classmethod
+    def initial_workers(cls, dc_id, max_workers):
+        return max(1, min(cls._dc_stats.get(dc_id, {}).get("workers", 2), max_workers))
+
+    @classmethod
+    def remember(cls, dc_id, chunk_size, workers, speed, rtt):
+        # Slow round-trips at full size risk the 30 s request timeout,
+        # so ask smaller next time; fast ones earn the full size back
+        if rtt > 8 and chunk_size > cls.MIN_CHUNK:
+            chunk_size //= 2
+        elif rtt < 2 and chunk_size < cls.MAX_CHUNK:
+            chunk_size *= 2
+        cls._dc_stats[dc_id] = {
+            "chunk_size": chunk_size,
+            "workers": workers,
+            "speed": speed,
+        }
 
 
 class HyperTGDownload:
+    # Partial downloads and their journals, named by file and kept out of
+    # the task folders, so a restarted or repeated task resumes them
+    RESUME_DIR = "hyperdl_resume"
+    # Left by a failed task nobody repeated, removed after this long
+    RESUME_TTL = 24 * 60 * 60
+
+    # Resume keys being downloaded, a second task of the same file gets its
+    # own temp file
+    _resuming = set()
+
     def __init__(self):
         self.clients = TgClient.helper_bots
         self.work_loads = TgClient.helper_loads
@@ -39,24 +309,28 @@ class HyperTGDownload:
         self.dump_chat = None
         self.download_dir = "downloads/"
         self.directory = None
-        # Resource Scaling based on Config
-        if Config.HIGH_PERFORMANCE_MODE:
-            self.num_parts = Config.HYPER_THREADS or max(8, len(self.clients))
-            self.chunk_size = 4 * 1024 * 1024 # 4MB (High Speed)
-        else:
-            self.num_parts = 4 # Conservative threads
-            self.chunk_size = 1024 * 1024 # 1MB (Low RAM)
-            
-        self.cache_file_ref = {}
-        self.cache_last_access = {}
-        self.cache_max_size = 100
-        self._processed_bytes = 0
+        self.dc_id = None
+        self.chunk_size = HyperDLTuner.MAX_CHUNK
+        self._done_chunks = set()
+        self._done_bytes = 0
+        self._jobs = Queue()
+        self._chunk_retries = {}
+        self._throttled = {}
         self.file_size = 0
-        self.chunk_size = 4 * 1024 * 1024  # 4MB chunks for high-bandwidth servers
+        self.file_unique_id = ""
         self.file_name = ""
         self._cancel_event = Event()
+        self._fd = None
+        self._hasher = None
+        self._journal = None
+        self._journal_path = None
+        self._journal_saved = 0
+        self._target_workers = 1
+        self._live_workers = 0
+        self._flood_hits = 0
+        self._rtt_total = 0
+        self._rtt_count = 0
         self.session_pool = {}
-        create_task(self._clean_cache())
 
     @staticmethod
     async def get_media_type(message):
@@ -76,15 +350,6 @@ class HyperTGDownload:
                 return media
         raise ValueError("This message doesn't contain any downloadable media")
 
-    def _update_cache(self, index, file_ref):
-        self.cache_file_ref[index] = file_ref
-        self.cache_last_access[index] = time()
-
-        if len(self.cache_file_ref) > self.cache_max_size:
-            oldest = sorted(self.cache_last_access.items(), key=lambda x: x[1])[0][0]
-            del self.cache_file_ref[oldest]
-            del self.cache_last_access[oldest]
-
     async def get_specific_file_ref(self, mid, client, max_retries=3):
         retries = 0
         last_error = None
@@ -107,13 +372,14 @@ class HyperTGDownload:
             f"Bot needs Admin access in Chat or message may be deleted. Error: {last_error}"
         )
 
+    def _file_ref_key(self, index):
+        return (self.dump_chat, self.message.id, index)
+
     async def get_file_id(self, client, index) -> FileId:
-        if index not in self.cache_file_ref:
-            file_ref = await self.get_specific_file_ref(self.message.id, client)
-            self._update_cache(index, file_ref)
-        else:
-            self.cache_last_access[index] = time()
-        return self.cache_file_ref[index]
+        return await FileRefCache.get(
+            self._file_ref_key(index),
+            lambda: self.get_specific_file_ref(self.message.id, client),
+        )
 
     @property
     def size(self):
@@ -121,7 +387,7 @@ class HyperTGDownload:
         
     @property
     def downloaded_bytes(self):
-        return self._processed_bytes
+        return self._done_bytes
 
     @property
     def download_speed(self):
@@ -134,82 +400,24 @@ class HyperTGDownload:
     @property
     def progress(self):
         try:
-             return (self._processed_bytes / self.file_size) * 100
+             return (self.downloaded_bytes / self.file_size) * 100
         except:
              return 0
 
-    async def _clean_cache(self):
-        while True:
-            await sleep(15 * 60)
-            current_time = time()
-            expired_keys = [
-                k
-                for k, v in self.cache_last_access.items()
-                if current_time - v > 45 * 60
-            ]
-
-            for key in expired_keys:
-                if key in self.cache_file_ref:
-                    del self.cache_file_ref[key]
-                if key in self.cache_last_access:
-                    del self.cache_last_access[key]
-
-    async def generate_media_session(self, client, file_id, index, max_retries=3):
+    async def generate_media_session(self, client, file_id, index):
         session_key = (index, file_id.dc_id)
 
-        if session_key in self.session_pool:
-            return self.session_pool[session_key]
-
-        retries = 0
-        while retries < max_retries:
-            try:
-                if file_id.dc_id != await client.storage.dc_id():
-                    media_session = Session(
-                        client,
-                        file_id.dc_id,
-                        await Auth(
-                            client, file_id.dc_id, await client.storage.test_mode()
-                        ).create(),
-                        await client.storage.test_mode(),
-                        is_media=True,
-                    )
-                    await media_session.start()
-
-                    for _ in range(6):
-                        exported_auth = await client.invoke(
-                            raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id)
-                        )
-
-                        try:
-                            await media_session.invoke(
-                                raw.functions.auth.ImportAuthorization(
-                                    id=exported_auth.id, bytes=exported_auth.bytes
-                                )
-                            )
-                            break
-                        except AuthBytesInvalid:
-                            await sleep(1)
-                    else:
-                        await media_session.stop()
-                        raise AuthBytesInvalid
-                else:
-                    media_session = Session(
-                        client,
-                        file_id.dc_id,
-                        await client.storage.auth_key(),
-                        await client.storage.test_mode(),
-                        is_media=True,
-                    )
-                    await media_session.start()
-
-                self.session_pool[session_key] = media_session
-                return media_session
-
-            except Exception:
-                retries += 1
-                await sleep(1)
+        if session_key not in self.session_pool:
+            self.session_pool[session_key] = await MediaSessionPool.acquire(
+                client, file_id.dc_id
+            )
+        return self.session_pool[session_key]
 
-        raise ValueError(f"Failed to create media session after {max_retries} attempts")
+    async def release_media_sessions(self):
+        for (index, dc_id), session in list(self.session_pool.items()):
+            if client := self.clients.get(index):
+                await MediaSessionPool.release(client, dc_id, session)
+        self.session_pool.clear()
 
     @staticmethod
     async def get_location(file_id: FileId):
@@ -250,93 +458,151 @@ class HyperTGDownload:
                 thumb_size=file_id.thumbnail_size,
             )
 
-    async def get_file(
-        self,
-        offset_bytes: int,
-        first_part_cut: int,
-        last_part_cut: int,
-        part_count: int,
-        max_retries=5,
-    ):
-        index = min(self.work_loads, key=self.work_loads.get)
-        client = self.clients[index]
+    async def _pick_client(self):
+        # Least loaded helper that isn't sitting out a FloodWait
+        while True:
+            if self._cancel_event.is_set():
+                raise CancelledError("Download cancelled")
+            now = time()
+            ready = [i for i in self.clients if self._throttled.get(i, 0) <= now]
+            if ready:
+                return min(ready, key=lambda i: self.work_loads.get(i, 0))
+            await sleep(max(0.5, min(self._throttled.values()) - now))
+
+    async def get_chunk(self, client, index, chunk_index):
+        file_id = await self.get_file_id(client, index)
+        media_session, location = await gather(
+            self.generate_media_session(client, file_id, index),
+            self.get_location(file_id),
+        )
+        offset = chunk_index * self.chunk_size
+        started = time()
+        r = await wait_for(
+            media_session.invoke(
+                raw.functions.upload.GetFile(
+                    location=location,
+                    offset=offset,
+                    limit=self.chunk_size,
+                ),
+            ),
+            timeout=30,
+        )
+        self._rtt_total += time() - started
+        self._rtt_count += 1
+        if not isinstance(r, raw.types.upload.File):
+            raise ValueError(f"Unexpected response: {r}")
+        expected = min(self.chunk_size, self.file_size - offset)
+        if len(r.bytes) != expected:
+            raise ValueError(
+                f"Incomplete chunk {chunk_index}: got {len(r.bytes)} of {expected} bytes"
+            )
+        return r.bytes
 
-        self.work_loads[index] += 1
-        current_retry = 0
+    def _spawn_worker(self):
+        # Counted up front so the controller never overshoots its target
+        self._live_workers += 1
+        return create_task(self._worker())
 
+    async def _worker(self, max_retries=5):
         try:
-            while current_retry < max_retries:
-                try:
-                    if self._cancel_event.is_set():
-                        raise CancelledError("Download cancelled")
-
-                    file_id = await self.get_file_id(client, index)
-                    media_session, location = await gather(
-                        self.generate_media_session(client, file_id, index),
-                        self.get_location(file_id),
-                    )
-
-                    current_part = 1
-                    current_offset = offset_bytes
-
-                    while current_part <= part_count:
-                        if self._cancel_event.is_set():
-                            raise CancelledError("Download cancelled")
-
-                        try:
-                            r = await wait_for(
-                                media_session.invoke(
-                                    raw.functions.upload.GetFile(
-                                        location=location,
-                                        offset=current_offset,
-                                        limit=self.chunk_size,
-                                    ),
-                                ),
-                                timeout=30,
-                            )
-
-                            if isinstance(r, raw.types.upload.File):
-                                chunk = r.bytes
-
-                                if not chunk:
-                                    break
-
-                                if part_count == 1:
-                                    yield chunk[first_part_cut:last_part_cut]
-                                elif current_part == 1:
-                                    yield chunk[first_part_cut:]
-                                elif current_part == part_count:
-                                    yield chunk[:last_part_cut]
-                                else:
-                                    yield chunk
-
-                                current_part += 1
-                                current_offset += self.chunk_size
-                                self._processed_bytes += len(chunk)
-                            else:
-                                raise ValueError(f"Unexpected response: {r}")
-
-                        except (FloodWait, AsyncTimeoutError, ConnectionError) as e:
-                            if isinstance(e, FloodWait):
-                                await sleep(e.value + 1)
-                            else:
-                                await sleep(1)
-                            continue
-
-                    if current_part <= part_count:
-                        raise ValueError(
-                            f"Incomplete download: got {current_part-1} of {part_count} parts"
-                        )
-                    break
-
-                except (AsyncTimeoutError, ConnectionError, AttributeError):
-                    current_retry += 1
-                    if current_retry >= max_retries:
-                        raise
-                    await sleep(current_retry * 2)
+            await self._work(max_retries)
+        finally:
+            self._live_workers -= 1
 
+    async def _work(self, max_retries):
+        while not self._cancel_event.is_set():
+            if self._live_workers > self._target_workers:
+                # The controller scaled down, retire this worker
+                return
+            try:
+                chunk_index = self._jobs.get_nowait()
+            except QueueEmpty:
+                return
+            index = await self._pick_client()
+            client = self.clients[index]
+            self.work_loads[index] += 1
+            try:
+                chunk = await self.get_chunk(client, index, chunk_index)
+            except FileReferenceExpired:
+                # Drop the stale reference, the retry refreshes it once for
+                # every worker on this client
+                FileRefCache.invalidate(self._file_ref_key(index))
+                retries = self._chunk_retries.get(chunk_index, 0) + 1
+                self._chunk_retries[chunk_index] = retries
+                if retries >= max_retries:
+                    raise
+                self._jobs.put_nowait(chunk_index)
+                continue
+            except FloodWait as e:
+                # Hand the chunk to whichever helper is free meanwhile
+                self._throttled[index] = time() + e.value + 1
+                self._flood_hits += 1
+                self._jobs.put_nowait(chunk_index)
+                continue
+            except (AsyncTimeoutError, ConnectionError, AttributeError, ValueError) as e:
+                if isinstance(e, ConnectionError):
+                    # Drop the broken session from the shared pool
+                    for dc_id in [k[1] for k in self.session_pool if k[0] == index]:
+                        # Another worker on this client may have dropped it
+                        if session := self.session_pool.pop((index, dc_id), None):
+                            await MediaSessionPool.invalidate(client, dc_id, session)
+                retries = self._chunk_retries.get(chunk_index, 0) + 1
+                self._chunk_retries[chunk_index] = retries
+                if retries >= max_retries:
+                    raise
+                self._throttled[index] = time() + retries
+                self._jobs.put_nowait(chunk_index)
+                continue
+            finally:
+                self.work_loads[index] -= 1
+
+            if self._cancel_event.is_set():
+                raise CancelledError("Download cancelled")
+            await sync_to_async(
+                pwrite, self._fd, chunk, chunk_index * self.chunk_size
+            )
+            self._hasher.write(chunk_index * self.chunk_size, chunk)
+            self._done_chunks.add(chunk_index)
+            self._done_bytes += len(chunk)
+            await self._save_journal()
+
+    async def _run_workers(self, max_workers, interval=2):
+        # Hill-climb the worker count on measured throughput: probe one
+        # more worker while speed keeps improving, fall back to the best
+        # count when it stops paying off and back off on FloodWait.
+        tasks = {self._spawn_worker() for _ in range(self._target_workers)}
+        best_speed, best_workers = 0, self._target_workers
+        last_bytes, last_tick = self._done_bytes, time()
+        try:
+            while tasks:
+                done, tasks = await wait(
+                    tasks, timeout=interval, return_when=FIRST_EXCEPTION
+                )
+                for task in done:
+                    task.result()
+                now = time()
+                speed = (self._done_bytes - last_bytes) / max(now - last_tick, 1e-3)
+                last_bytes, last_tick = self._done_bytes, now
+                self._download_speed = speed
+                if self._flood_hits:
+                    self._flood_hits = 0
+                    self._target_workers = max(1, self._target_workers - 1)
+                    best_workers = min(best_workers, self._target_workers)
+                elif speed > best_speed * 1.1:
+                    best_speed, best_workers = speed, self._target_workers
+                    if self._target_workers < max_workers:
+                        self._target_workers += 1
+                elif speed < best_speed * 0.9:
+                    self._target_workers = best_workers
+                while (
+                    self._live_workers < self._target_workers
+                    and not self._jobs.empty()
+                ):
+                    tasks.add(self._spawn_worker())
         finally:
-            self.work_loads[index] -= 1
+            for task in tasks:
+                task.cancel()
+        return best_workers, best_speed
 
     async def progress_callback(self, progress, progress_args):
         if not progress:
@@ -346,7 +612,7 @@ class HyperTGDownload:
             try:
                 if callable(progress):
                     await progress(
-                        self._processed_bytes, self.file_size, *progress_args
+                        self.downloaded_bytes, self.file_size, *progress_args
                     )
                 await sleep(1)
             except (CancelledError, StopTransmission):
@@ -354,145 +620,217 @@ class HyperTGDownload:
             except Exception:
                 await sleep(1)
 
-    async def single_part(self, start, end, part_index, max_retries=3):
-        until_bytes, from_bytes = min(end, self.file_size - 1), start
+    @staticmethod
+    def _preallocate(file_path, size):
+        fd = osopen(file_path, O_RDWR | O_CREAT, 0o644)
+        try:
+            if size > 0:
+                if posix_fallocate is not None:
+                    try:
+                        posix_fallocate(fd, 0, size)
+                    except OSError:
+                        ftruncate(fd, size)
+                else:
+                    ftruncate(fd, size)
+        except Exception:
+            osclose(fd)
+            raise
+        return fd
 
-        offset = from_bytes - (from_bytes % self.chunk_size)
-        first_part_cut = from_bytes - offset
-        last_part_cut = until_bytes % self.chunk_size + 1
+    def _load_journal(self, temp_file_path):
+        if not ospath.exists(self._journal_path) or not ospath.exists(temp_file_path):
+            return None
+        try:
+            with open(self._journal_path) as f:
+                journal = loads(f.read())
+        except (OSError, ValueError):
+            return None
+        if (
+            journal.get("size") != self.file_size
+            or journal.get("unique_id") != self.file_unique_id
+            or not journal.get("chunk_size")
+            or ospath.getsize(temp_file_path) != self.file_size
+        ):
+            return None
+        return journal
 
-        part_count = ceil(until_bytes / self.chunk_size) - floor(
-            offset / self.chunk_size
-        )
-        part_file_path = ospath.join(
-            self.directory, f"{self.file_name}.temp.{part_index:02d}"
-        )
+    def _write_journal(self):
+        tmp_path = f"{self._journal_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(dumps(self._journal))
+        replace(tmp_path, self._journal_path)
 
-        for attempt in range(max_retries):
+    async def _save_journal(self, force=False):
+        if self._journal is None or (not force and time() - self._journal_saved < 2):
+            return
+        self._journal_saved = time()
+        self._journal["done"] = sorted(self._done_chunks)
+        try:
+            await sync_to_async(self._write_journal)
+        except OSError as e:
+            LOGGER.warning(f"HyperDL: could not save journal: {e}")
+
+    @classmethod
+    def _prune_resume_dir(cls):
+        now = time()
+        for name in listdir(cls.RESUME_DIR):
+            path = ospath.join(cls.RESUME_DIR, name)
+            if name.split(".", 1)[0] in cls._resuming:
+                continue
             try:
-                async with aiopen(part_file_path, "wb") as f:
-                    async for chunk in self.get_file(
-                        offset, first_part_cut, last_part_cut, part_count
-                    ):
-                        if self._cancel_event.is_set():
-                            raise CancelledError("Download cancelled")
-                        await f.write(chunk)
-                return part_index, part_file_path
-            except (AsyncTimeoutError, ConnectionError):
-                if attempt == max_retries - 1:
-                    raise
-                await sleep((attempt + 1) * 2)
-                self._processed_bytes = 0
+                if now - ospath.getmtime(path) > cls.RESUME_TTL:
+                    osremove(path)
+            except OSError:
+                pass
 
     async def handle_download(self, progress, progress_args):
         self._cancel_event.clear()
 
         await makedirs(self.directory, exist_ok=True)
-        temp_file_path = (
-            ospath.abspath(
-                sub("\\\\", "/", ospath.join(self.directory, self.file_name))
-            )
-            + ".temp"
+        file_path = ospath.abspath(
+            sub("\\\\", "/", ospath.join(self.directory, self.file_name))
         )
-
-        # Smart part calculation: balance between parallelism and overhead
-        # Small files (<20MB): single part
-        # Medium files (20-100MB): 2-4 parts
-        # Large files (100-200MB): 4-8 parts
-        # Very large files (>200MB): 8-16 parts for max speed
-        # Smart part calculation based on HIGH_PERFORMANCE_MODE
-        if Config.HIGH_PERFORMANCE_MODE:
-             # Aggressive Strategy (Max Speed)
-            if self.file_size < 20 * 1024 * 1024:
-                num_parts = 1
-            elif self.file_size < 100 * 1024 * 1024:
-                num_parts = min(4, max(2, self.file_size // (25 * 1024 * 1024)))
-            elif self.file_size < 200 * 1024 * 1024:
-                num_parts = min(8, max(4, self.file_size // (25 * 1024 * 1024)))
-            else:
-                num_parts = min(16, max(8, self.file_size // (50 * 1024 * 1024)))
+        resume_key = None
+        if self.file_unique_id:
+            key = f"{self.file_unique_id}_{self.file_size}"
+            if key not in self._resuming:
+                resume_key = key
+                self._resuming.add(key)
+        if resume_key:
+            await makedirs(self.RESUME_DIR, exist_ok=True)
+            await sync_to_async(self._prune_resume_dir)
+            temp_file_path = ospath.abspath(
+                ospath.join(self.RESUME_DIR, f"{resume_key}.temp")
+            )
         else:
-            # Conservative Strategy (Protect CPU/RAM)
-            if self.file_size < 50 * 1024 * 1024:
-                num_parts = 1
-            else:
-                num_parts = min(4, max(2, self.file_size // (50 * 1024 * 1024)))
-        
-        # Limit by available clients and configured HYPER_THREADS
-        num_parts = min(num_parts, self.num_parts)
-        num_parts = min(num_parts, len(self.clients)) if self.clients else num_parts
-
-        part_size = self.file_size // num_parts if num_parts > 0 else self.file_size
-        ranges = [
-            (i * part_size, min((i + 1) * part_size - 1, self.file_size - 1))
-            for i in range(num_parts)
-        ]
+            temp_file_path = f"{file_path}.temp"
+        self._journal_path = f"{temp_file_path}.journal"
+        journal = await sync_to_async(self._load_journal, temp_file_path)
+
+        # Request size comes from what worked on this DC before (or the
+        # resumed journal) and concurrency is tuned while downloading
+        if journal:
+            self.chunk_size = journal["chunk_size"]
+        else:
+            self.chunk_size = HyperDLTuner.chunk_size(self.dc_id)
+        max_workers = HyperDLTuner.max_workers(self.chunk_size, len(self.clients))
+
+        # Fixed-size chunk jobs shared by all workers, so a slow or
+        # throttled helper only delays the chunk it holds, not a whole range
+        total_chunks = -(-self.file_size // self.chunk_size)
+        self._done_chunks = set(journal["done"]) if journal else set()
+        self._done_bytes = sum(
+            min(self.chunk_size, self.file_size - i * self.chunk_size)
+            for i in self._done_chunks
+        )
+        if journal:
+            LOGGER.info(
+                f"HyperDL: resuming {self.file_name} from {self.downloaded_bytes} bytes"
+            )
+        self._jobs = Queue()
+        for chunk_index in range(total_chunks):
+            if chunk_index not in self._done_chunks:
+                self._jobs.put_nowait(chunk_index)
+        self._chunk_retries = {}
+        self._throttled = {}
+        self._hasher = StreamHasher()
+        if self._done_chunks:
+            # Bytes from the earlier attempt never passed through the hasher
+            self._hasher.invalidate()
+        max_workers = max(1, min(max_workers, self._jobs.qsize()))
+        self._target_workers = HyperDLTuner.initial_workers(self.dc_id, max_workers)
+        self._flood_hits = 0
+        self._rtt_total = self._rtt_count = 0
+        self._journal = {
+            "size": self.file_size,
+            "unique_id": self.file_unique_id,
+            "chunk_size": self.chunk_size,
+            "done": [],
+        }
 
-        tasks = []
         prog_task = None
+        completed = False
+        keep_partial = False
 
         try:
-            for i, (start, end) in enumerate(ranges):
-                tasks.append(create_task(self.single_part(start, end, i)))
+            # Every chunk is written straight into its own region of one
+            # preallocated file, so no per-part temp files or merge pass.
+            self._fd = await sync_to_async(
+                self._preallocate, temp_file_path, self.file_size
+            )
 
             if progress:
                 prog_task = create_task(self.progress_callback(progress, progress_args))
 
-            results = await gather(*tasks)
-
-            # Switch to Merge Status
-            async with task_dict_lock:
-                 task_dict[self._listener.mid] = MergeStatus(self._listener, self, self._listener.mid)
-
-            async with aiopen(temp_file_path, "wb") as temp_file:
-                for _, part_file_path in sorted(results, key=lambda x: x[0]):
-                    try:
-                        async with aiopen(part_file_path, "rb") as part_file:
-                            while True:
-                                chunk = await part_file.read(16 * 1024 * 1024)  # 16MB buffer for faster merge
-                                if not chunk:
-                                    break
-                                await temp_file.write(chunk)
-                        await remove(part_file_path)
-                    except Exception as e:
-                        LOGGER.error(
-                            f"Error processing part file {part_file_path}: {e}"
-                        )
-                        raise
+            best_workers, best_speed = await self._run_workers(max_workers)
+            if len(self._done_chunks) != total_chunks:
+                raise ValueError(
+                    f"Incomplete download: got {len(self._done_chunks)} of {total_chunks} chunks"
+                )
 
             if prog_task and not prog_task.done():
                 prog_task.cancel()
 
-            file_path = ospath.splitext(temp_file_path)[0]
+            await sync_to_async(osclose, self._fd)
+            self._fd = None
+            if digests := self._hasher.digests(self.file_size):
+                try:
+                    await sync_to_async(save_hashes, temp_file_path, digests)
+                except OSError as e:
+                    LOGGER.warning(f"HyperDL: couldn't store hashes: {e}")
+
             await move(temp_file_path, file_path)
+            completed = True
+
+            if self._rtt_count and best_speed:
+                HyperDLTuner.remember(
+                    self.dc_id,
+                    self.chunk_size,
+                    best_workers,
+                    best_speed,
+                    self._rtt_total / self._rtt_count,
+                )
 
             return file_path
 
         except FloodWait as fw:
+            keep_partial = True
             raise fw
         except (CancelledError, StopTransmission):
             return None
         except Exception as e:
             LOGGER.error(f"HyperDL Error: {e}")
+            keep_partial = True
             return None
         finally:
             self._cancel_event.set()
             if prog_task and not prog_task.done():
                 prog_task.cancel()
+            await self.release_media_sessions()
 
-            for task in tasks:
-                if not task.done():
-                    task.cancel()
-
-            for i in range(len(ranges)):
-                part_path = ospath.join(
-                    self.directory, f"{self.file_name}.temp.{i:02d}"
-                )
+            if self._fd is not None:
                 try:
-                    if ospath.exists(part_path):
-                        await remove(part_path)
-                except Exception:
+                    osclose(self._fd)
+                except OSError:
                     pass
+                self._fd = None
+
+            if keep_partial:
+                # Keep the partial file and its journal so a retry, or a new
+                # task of the same file, resumes from the confirmed offsets.
+                await self._save_journal(force=True)
+            else:
+                paths = [self._journal_path]
+                if not completed:
+                    paths.append(temp_file_path)
+                for path in paths:
+                    try:
+                        if ospath.exists(path):
+                            await remove(path)
+                    except Exception:
+                        pass
+            self._journal = None
+            self._resuming.discard(resume_key)
 
     @staticmethod
     async def get_extension(file_type, mime_type):
@@ -540,10 +878,12 @@ class HyperTGDownload:
 
             file_id_str = media if isinstance(media, str) else media.file_id
             file_id_obj = FileId.decode(file_id_str)
+            self.dc_id = file_id_obj.dc_id
 
             file_type = file_id_obj.file_type
             media_file_name = getattr(media, "file_name", "")
             self.file_size = getattr(media, "file_size", 0)
+            self.file_unique_id = getattr(media, "file_unique_id", "")
             mime_type = getattr(media, "mime_type", "image/jpeg")
             date = getattr(media, "date", None)
 
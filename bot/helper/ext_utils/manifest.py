@@ -0,0 +1,132 @@
+from os import path as ospath, scandir, stat
+from stat import S_ISREG
+
+from .bot_utils import sync_to_async
+from .files_utils import get_mime_type
+
+
+class FileManifest:
+    """Files of a task, walked once and kept current by the stages after it.
+
+    Maps the path of every file to its size, (device, inode) and, once asked
+    for, its mime type. Symlinked files report their target like
+    get_path_size does. Stages that know what they wrote call add() and
+    discard(), the others refresh() only the path they worked on.
+    """
+
+    def __init__(self):
+        self._files = {}
+
+    @classmethod
+    async def build(cls, path):
+        manifest = cls()
+        await manifest.refresh(path)
+        return manifest
+
+    @staticmethod
+    def _entry(st):
+        return {"size": st.st_size, "inode": (st.st_dev, st.st_ino), "mime": None}
+
+    @classmethod
+    def _scan(cls, path, found, recursive=True):
+        try:
+            entries = scandir(path)
+        except NotADirectoryError:
+            found[path] = cls._entry(stat(path))
+            return
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            cls._scan(entry.path, found)
+                    elif entry.is_file():
+                        found[entry.path] = cls._entry(entry.stat())
+                except OSError:
+                    continue
+
+    @classmethod
+    def _scan_all(cls, paths, recursive):
+        found = {}
+        for path in paths:
+            cls._scan(path, found, recursive)
+        return found
+
+    @staticmethod
+    def _under(key, path):
+        return key == path or key.startswith(f"{path.rstrip('/')}/")
+
+    async def refresh(self, *paths, recursive=True):
+        """Re-reads paths from disk, one thread hop for all of them.
+
+        Without recursive only the files directly inside the folders are.
+        """
+        if recursive:
+            paths = [
+                path
+                for path in set(paths)
+                if not any(
+                    other != path and self._under(path, other) for other in paths
+                )
+            ]
+        found = await sync_to_async(self._scan_all, paths, recursive)
+        for path in paths:
+            if recursive:
+                self.discard(path)
+            else:
+                for key in [key for key in self._files if ospath.dirname(key) == path]:
+                    del self._files[key]
+        self._files.update(found)
+
+    async def add(self, *paths):
+        """Records files a stage wrote, missing ones are dropped."""
+
+        def stat_all():
+            found = {}
+            for path in paths:
+                try:
+                    st = stat(path)
+                except OSError:
+                    st = None
+                found[path] = self._entry(st) if st and S_ISREG(st.st_mode) else None
+            return found
+
+        for path, entry in (await sync_to_async(stat_all)).items():
+            if entry is None:
+                self._files.pop(path, None)
+            else:
+                self._files[path] = entry
+
+    def discard(self, path):
+        for key in [key for key in self._files if self._under(key, path)]:
+            del self._files[key]
+
+    def is_file(self, path):
+        return path in self._files
+
+    def size(self, path):
+        if path in self._files:
+            return self._files[path]["size"]
+        return sum(
+            entry["size"] for key, entry in self._files.items() if self._under(key, path)
+        )
+
+    def files(self, path):
+        return [key for key in self._files if self._under(key, path)]
+
+    def walk(self, path):
+        """(dirpath, [], filenames) per folder holding files, like os.walk."""
+        tree = {}
+        for key in self.files(path):
+            dirpath, name = ospath.split(key)
+            tree.setdefault(dirpath, []).append(name)
+        return [(dirpath, [], names) for dirpath, names in tree.items()]
+
+    async def mime(self, path):
+        if (entry := self._files.get(path)) is None:
+            return await sync_to_async(get_mime_type, path)
+        if entry["mime"] is None:
+            entry["mime"] = await sync_to_async(get_mime_type, path)
+        return entry["mime"]
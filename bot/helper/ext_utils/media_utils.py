@@ -1,8 +1,7 @@
 import re
 from contextlib import suppress
 from PIL import Image
-from hashlib import md5
-from aiofiles.os import remove, path as aiopath, makedirs
+from aiofiles.os import remove, path as aiopath, makedirs, stat as aiostat
 import json
 from asyncio import (
     create_subprocess_exec,
@@ -11,6 +10,8 @@ from asyncio import (
     sleep,
 )
 from asyncio.subprocess import PIPE
+from bisect import bisect_right
+from collections import OrderedDict
 from os import path as ospath
 from re import search as re_search, escape
 from time import time
@@ -21,18 +22,18 @@ from ... import LOGGER, cpu_no, DOWNLOAD_DIR
 from ...core.config_manager import BinConfig
 from .bot_utils import cmd_exec, sync_to_async
 from .files_utils import get_mime_type, is_archive, is_archive_split
+from .hash_utils import file_hash
 from .status_utils import time_to_seconds
 
 threads = max(1, cpu_no // 2)
 cores = ",".join(str(i) for i in range(threads))
+# Room left in every split part for the headers and index of its container
+SPLIT_OVERHEAD = 3000000
+SPLIT_OVERHEAD_RATIO = 0.005
 
 
 def get_md5_hash(up_path):
-    md5_hash = md5()
-    with open(up_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            md5_hash.update(byte_block)
-        return md5_hash.hexdigest()
+    return file_hash(up_path, "md5")
 
 
 async def create_thumb(msg, _id=""):
@@ -49,62 +50,112 @@ async def create_thumb(msg, _id=""):
     return output
 
 
+class MediaProbe:
+    """One ffprobe -show_format -show_streams run per file version.
+
+    Results are kept in an LRU keyed by (device, inode, size, mtime), so the
+    type check, caption, thumbnail and ffmpeg steps of a leech share a probe.
+    """
+
+    MAX_SIZE = 512
+    _cache = OrderedDict()
+
+    def __init__(self, data):
+        self.format = data.get("format") or {}
+        self.streams = data.get("streams") or []
+
+    @classmethod
+    async def get(cls, path):
+        try:
+            st = await aiostat(path)
+        except OSError as e:
+            LOGGER.error(f"MediaProbe: {e}. Mostly File not found! - File: {path}")
+            return None
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        if (probe := cls._cache.get(key)) is not None:
+            cls._cache.move_to_end(key)
+            return probe
+        try:
+            stdout, stderr, code = await cmd_exec(
+                [
+                    BinConfig.FFPROBE_NAME,
+                    "-hide_banner",
+                    "-loglevel",
+                    "error",
+                    "-print_format",
+                    "json",
+                    "-show_format",
+                    "-show_streams",
+                    path,
+                ]
+            )
+        except Exception as e:
+            LOGGER.error(f"MediaProbe: {e}. Mostly File not found! - File: {path}")
+            return None
+        if not stdout or code != 0:
+            # Expected for every non media file, callers that need media log it
+            LOGGER.debug(f"MediaProbe: {stderr} - File: {path}")
+            return None
+        try:
+            probe = cls(json.loads(stdout))
+        except ValueError as e:
+            LOGGER.error(f"MediaProbe: {e} - File: {path}")
+            return None
+        cls._cache[key] = probe
+        if len(cls._cache) > cls.MAX_SIZE:
+            cls._cache.popitem(last=False)
+        return probe
+
+    def duration(self):
+        return round(float(self.format.get("duration", 0)))
+
+    def streams_of(self, codec_type):
+        return [s for s in self.streams if s.get("codec_type") == codec_type]
+
+    def tag(self, name):
+        tags = self.format.get("tags", {})
+        return tags.get(name) or tags.get(name.upper()) or tags.get(name.title())
+
+    def languages(self, codec_type):
+        langs = []
+        for stream in self.streams_of(codec_type):
+            if lc := stream.get("tags", {}).get("language"):
+                with suppress(Exception):
+                    lc = Language.get(lc).display_name()
+                if lc not in langs:
+                    langs.append(lc)
+        return langs
+
+    def quality(self):
+        if not self.streams or self.streams[0].get("codec_type") != "video":
+            return ""
+        height = int(self.streams[0].get("height"))
+        for qual in (480, 540, 720, 1080, 2160, 4320):
+            if height <= qual:
+                return f"{qual}p"
+        return "8640p"
+
+
 async def get_media_info(path, extra_info=False):
-    try:
-        result = await cmd_exec(
-            [
-                "ffprobe",
-                "-hide_banner",
-                "-loglevel",
-                "error",
-                "-print_format",
-                "json",
-                "-show_format",
-                "-show_streams",
-                path,
-            ]
-        )
-    except Exception as e:
-        LOGGER.error(f"Get Media Info: {e}. Mostly File not found! - File: {path}")
+    if (probe := await MediaProbe.get(path)) is None:
         return (0, "", "", "") if extra_info else (0, None, None)
-    if result[0] and result[2] == 0:
-        ffresult = eval(result[0])
-        fields = ffresult.get("format")
-        if fields is None:
-            LOGGER.error(f"get_media_info: {result}")
-            return (0, "", "", "") if extra_info else (0, None, None)
-        duration = round(float(fields.get("duration", 0)))
-        if extra_info:
-            lang, qual, stitles = "", "", ""
-            if (streams := ffresult.get("streams")) and streams[0].get(
-                "codec_type"
-            ) == "video":
-                qual = int(streams[0].get("height"))
-                qual = f"{480 if qual <= 480 else 540 if qual <= 540 else 720 if qual <= 720 else 1080 if qual <= 1080 else 2160 if qual <= 2160 else 4320 if qual <= 4320 else 8640}p"
-                for stream in streams:
-                    if stream.get("codec_type") == "audio" and (
-                        lc := stream.get("tags", {}).get("language")
-                    ):
-                        with suppress(Exception):
-                            lc = Language.get(lc).display_name()
-                        if lc not in lang:
-                            lang += f"{lc}, "
-                    if stream.get("codec_type") == "subtitle" and (
-                        st := stream.get("tags", {}).get("language")
-                    ):
-                        with suppress(Exception):
-                            st = Language.get(st).display_name()
-                        if st not in stitles:
-                            stitles += f"{st}, "
-            return duration, qual, lang[:-2], stitles[:-2]
-        tags = fields.get("tags", {})
-        artist = tags.get("artist") or tags.get("ARTIST") or tags.get("Artist")
-        title = tags.get("title") or tags.get("TITLE") or tags.get("Title")
-        return duration, artist, title
-    return (0, "", "", "") if extra_info else (0, None, None)
-
-
-async def get_document_type(path):
+    if not probe.format:
+        LOGGER.error(f"get_media_info: no format info - File: {path}")
+        return (0, "", "", "") if extra_info else (0, None, None)
+    duration = probe.duration()
+    if extra_info:
+        if not (qual := probe.quality()):
+            return duration, "", "", ""
+        return (
+            duration,
+            qual,
+            ", ".join(probe.languages("audio")),
+            ", ".join(probe.languages("subtitle")),
+        )
+    return duration, probe.tag("artist"), probe.tag("title")
+
+
+async def get_document_type(path, mime_type=None):
     is_video, is_audio, is_image = False, False, False
     if (
         is_archive(path)
@@ -112,46 +163,20 @@ async def get_document_type(path):
         or re_search(r".+(\.|_)(rar|7z|zip|bin)(\.0*\d+)?$", path)
     ):
         return is_video, is_audio, is_image
-    mime_type = await sync_to_async(get_mime_type, path)
+    mime_type = mime_type or await sync_to_async(get_mime_type, path)
     if mime_type.startswith("image"):
         return False, False, True
-    try:
-        result = await cmd_exec(
-            [
-                "ffprobe",
-                "-hide_banner",
-                "-loglevel",
-                "error",
-                "-print_format",
-                "json",
-                "-show_streams",
-                path,
-            ]
-        )
-        if result[1] and mime_type.startswith("video"):
-            is_video = True
-    except Exception as e:
-        LOGGER.error(f"Get Document Type: {e}. Mostly File not found! - File: {path}")
+    if (probe := await MediaProbe.get(path)) is None:
         if mime_type.startswith("audio"):
             return False, True, False
-        if not mime_type.startswith("video") and not mime_type.endswith("octet-stream"):
-            return is_video, is_audio, is_image
-        if mime_type.startswith("video"):
-            is_video = True
-        return is_video, is_audio, is_image
-    if result[0] and result[2] == 0:
-        fields = eval(result[0]).get("streams")
-        if fields is None:
-            LOGGER.error(f"get_document_type: {result}")
-            return is_video, is_audio, is_image
-        is_video = False
-        for stream in fields:
-            if stream.get("codec_type") == "video":
-                codec_name = stream.get("codec_name", "").lower()
-                if codec_name not in {"mjpeg", "png", "bmp"}:
-                    is_video = True
-            elif stream.get("codec_type") == "audio":
-                is_audio = True
+        return mime_type.startswith("video"), is_audio, is_image
+    for stream in probe.streams:
+        if stream.get("codec_type") == "video":
+            codec_name = stream.get("codec_name", "").lower()
+            if codec_name not in {"mjpeg", "png", "bmp"}:
+                is_video = True
+        elif stream.get("codec_type") == "audio":
+            is_audio = True
     return is_video, is_audio, is_image
 
 
@@ -166,30 +191,13 @@ async def get_streams(file):
         A list of stream objects (dictionaries) or None if an error occurs
         or no streams are found.
     """
-    cmd = [
-        "ffprobe",
-        "-hide_banner",
-        "-loglevel",
-        "error",
-        "-print_format",
-        "json",
-        "-show_streams",
-        file,
-    ]
-    process = await create_subprocess_exec(*cmd, stdout=PIPE, stderr=PIPE)
-    stdout, stderr = await process.communicate()
-
-    if process.returncode != 0:
-        LOGGER.error(f"Error getting stream info: {stderr.decode().strip()}")
+    if (probe := await MediaProbe.get(file)) is None:
+        LOGGER.error(f"Error getting stream info - File: {file}")
         return None
-
-    try:
-        return json.loads(stdout)["streams"]
-    except KeyError:
-        LOGGER.error(
-            f"No streams found in the ffprobe output: {stdout.decode().strip()}",
-        )
+    if not probe.streams:
+        LOGGER.error(f"No streams found in the ffprobe output - File: {file}")
         return None
+    return probe.streams
 
 
 async def take_ss(video_file, ss_nb) -> bool:
@@ -322,19 +330,11 @@ async def take_ss_collage(video_file, ss_nb, mode="image", orientation="landscap
     
     if mode == "detailed":
         try:
-            cmd = [
-                BinConfig.FFPROBE_NAME, "-v", "quiet", "-print_format", "json",
-                "-show_format", "-show_streams", video_file
-            ]
-            stdout, _, _ = await cmd_exec(cmd)
-            probe_data = json.loads(stdout)
-            
-            format_info = probe_data.get("format", {})
-            format_name = format_info.get("format_long_name", "N/A")
+            probe = await MediaProbe.get(video_file)
+            format_name = probe.format.get("format_long_name", "N/A")
             
-            streams = probe_data.get("streams", [])
-            v_streams = [s for s in streams if s.get("codec_type") == "video"]
-            a_streams = [s for s in streams if s.get("codec_type") == "audio"]
+            v_streams = probe.streams_of("video")
+            a_streams = probe.streams_of("audio")
             
             if v_streams:
                 v = v_streams[0]
@@ -1096,16 +1096,138 @@ class FFMpeg:
                 await remove(output_file)
             return False
 
+    async def _keyframe_index(self, f_path, stream):
+        """(pts_time, byte offset) of every keyframe of a stream, from one demux pass."""
+        cmd = [
+            BinConfig.FFPROBE_NAME,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-select_streams",
+            str(stream),
+            "-show_entries",
+            "packet=pts_time,pos,flags",
+            "-of",
+            "compact=p=0",
+            f_path,
+        ]
+        self._listener.subproc = await create_subprocess_exec(
+            *cmd, stdout=PIPE, stderr=PIPE
+        )
+        index = []
+
+        async def read_index():
+            async for line in self._listener.subproc.stdout:
+                fields = dict(
+                    field.split("=", 1)
+                    for field in line.decode().strip().split("|")
+                    if "=" in field
+                )
+                if "K" not in fields.get("flags", ""):
+                    continue
+                with suppress(ValueError):
+                    pos = fields.get("pos", "N/A")
+                    index.append(
+                        (float(fields["pts_time"]), int(pos) if pos != "N/A" else None)
+                    )
+
+        _, stderr = await gather(read_index(), self._listener.subproc.stderr.read())
+        await self._listener.subproc.wait()
+        if self._listener.subproc.returncode != 0:
+            if self._listener.subproc.returncode == -9:
+                self._listener.is_cancelled = True
+            else:
+                LOGGER.warning(f"Keyframe index failed: {stderr.decode().strip()}")
+            return []
+        return index
+
+    @staticmethod
+    def _cut_points(index, f_size, step, cap):
+        """Keyframes to cut at so every part stays within cap bytes.
+
+        Each cut is the keyframe closest to the next multiple of step that
+        still keeps the part under cap.
+        """
+        offsets = [pos for _, pos in index]
+        cuts = []
+        start = 0
+        boundary = step
+        while f_size - start > cap:
+            first = bisect_right(offsets, start)
+            last = bisect_right(offsets, start + cap)
+            if first == len(index):
+                break
+            if first == last:
+                # A single GOP bigger than a part, cut right after it
+                best = first
+            else:
+                best = min(
+                    range(first, last), key=lambda i: abs(offsets[i] - boundary)
+                )
+            cuts.append(index[best])
+            start = offsets[best]
+            # The next boundary at least half a part away, so a cut that
+            # fell short doesn't pull the following one back with it
+            while boundary <= start + step // 2:
+                boundary += step
+        return cuts
+
     async def split(self, f_path, file_, parts, split_size):
         self.clear()
-        multi_streams = True
-        self._total_time = duration = (await get_media_info(f_path))[0]
+        probe = await MediaProbe.get(f_path)
+        if probe is None:
+            LOGGER.warning(f"Unable to probe the video to split. Path: {f_path}")
+            return False
+        self._total_time = probe.duration()
+        stream = next(
+            (
+                s["index"]
+                for s in probe.streams
+                if s.get("codec_type") == "video"
+                and not s.get("disposition", {}).get("attached_pic")
+            ),
+            None,
+        )
+        if stream is None:
+            LOGGER.warning(f"No video stream to split on. Path: {f_path}")
+            return False
+        start_time = float(probe.format.get("start_time", 0) or 0)
+        f_size = await aiopath.getsize(f_path)
+        index = await self._keyframe_index(f_path, stream)
+        if self._listener.is_cancelled:
+            return False
+        if not index:
+            LOGGER.warning(f"No keyframes found, unable to split. Path: {f_path}")
+            return False
+        if any(pos is None for _, pos in index):
+            # Containers without packet offsets, place keyframes by bitrate
+            duration = index[-1][0] - start_time or 1
+            index = [
+                (pts, int((pts - start_time) / duration * f_size)) for pts, _ in index
+            ]
+        index.sort(key=lambda keyframe: keyframe[1])
+        limit = (
+            self._listener.max_split_size if self._listener.equal_splits else split_size
+        )
+        # Byte offsets only cover the packets, leave room for the headers and
+        # index every part gets
+        cap = limit - SPLIT_OVERHEAD - int(limit * SPLIT_OVERHEAD_RATIO)
         base_name, extension = ospath.splitext(file_)
-        split_size -= 3000000
-        start_time = 0
-        i = 1
-        while i <= parts or start_time < duration - 4:
-            out_path = f_path.replace(file_, f"{base_name}.part{i:03}{extension}")
+        pattern = f_path.replace(
+            file_, f"{base_name.replace('%', '%%')}.part%03d{extension}"
+        )
+        out_paths = []
+        multi_streams = True
+        corrected = False
+        while True:
+            cuts = self._cut_points(index, f_size, split_size, cap)
+            if not cuts:
+                LOGGER.warning(f"No keyframe to cut at, unable to split. Path: {f_path}")
+                return False
+            out_paths = [
+                f_path.replace(file_, f"{base_name}.part{i:03}{extension}")
+                for i in range(1, len(cuts) + 2)
+            ]
             cmd = [
                 BinConfig.FFMPEG_NAME,
                 "-hide_banner",
@@ -1113,29 +1235,41 @@ class FFMpeg:
                 "error",
                 "-progress",
                 "pipe:1",
-                "-ss",
-                str(start_time),
                 "-i",
                 f_path,
-                "-fs",
-                str(split_size),
                 "-map",
                 "0",
                 "-map_chapters",
                 "-1",
-                "-async",
-                "1",
                 "-strict",
                 "-2",
                 "-c",
                 "copy",
+                "-f",
+                "segment",
+                "-segment_reference_stream",
+                str(stream),
+                "-segment_times",
+                ",".join(f"{max(pts - start_time, 0):.6f}" for pts, _ in cuts),
+                "-segment_time_delta",
+                "0.005",
+                "-segment_start_number",
+                "1",
+                "-reset_timestamps",
+                "1",
                 "-threads",
                 f"{threads}",
-                out_path,
+                pattern,
             ]
             if not multi_streams:
-                del cmd[12]
-                del cmd[12]
+                # Default stream selection renumbers the streams
+                del cmd[cmd.index("-map") : cmd.index("-map") + 2]
+                del cmd[
+                    cmd.index("-segment_reference_stream") : cmd.index(
+                        "-segment_reference_stream"
+                    )
+                    + 2
+                ]
             if self._listener.is_cancelled:
                 return False
             self._listener.subproc = await create_subprocess_exec(
@@ -1149,48 +1283,55 @@ class FFMpeg:
             if code == -9:
                 self._listener.is_cancelled = True
                 return False
-            elif code != 0:
+            if code != 0:
                 try:
                     stderr = stderr.decode().strip()
                 except Exception:
                     stderr = "Unable to decode the error!"
-                with suppress(Exception):
-                    await remove(out_path)
+                await self._remove_parts(out_paths)
                 if multi_streams:
                     LOGGER.warning(
                         f"{stderr}. Retrying without map, -map 0 not working in all situations. Path: {f_path}"
                     )
                     multi_streams = False
+                    self.clear()
                     continue
-                else:
-                    LOGGER.warning(
-                        f"{stderr}. Unable to split this video, if it's size less than {self._listener.max_split_size} will be uploaded as it is. Path: {f_path}"
-                    )
-                return False
-            out_size = await aiopath.getsize(out_path)
-            if out_size > self._listener.max_split_size:
-                split_size -= (out_size - self._listener.max_split_size) + 5000000
                 LOGGER.warning(
-                    f"Part size is {out_size}. Trying again with lower split size!. Path: {f_path}"
+                    f"{stderr}. Unable to split this video, if it's size less than {self._listener.max_split_size} will be uploaded as it is. Path: {f_path}"
                 )
-                await remove(out_path)
-                continue
-            lpd = (await get_media_info(out_path))[0]
-            if lpd == 0:
+                return False
+            sizes = [
+                await aiopath.getsize(path) if await aiopath.exists(path) else 0
+                for path in out_paths
+            ]
+            if max(sizes) <= limit:
+                return True
+            await self._remove_parts(out_paths)
+            if corrected:
                 LOGGER.error(
-                    f"Something went wrong while splitting, mostly file is corrupted. Path: {f_path}"
+                    f"Split parts still exceed {limit} bytes. Path: {f_path}"
                 )
-                break
-            elif duration == lpd:
-                LOGGER.warning(
-                    f"This file has been splitted with default stream and audio, so you will only see one part with less size from orginal one because it doesn't have all streams and audios. This happens mostly with MKV videos. Path: {f_path}"
+                return False
+            # The container overhead was underestimated, shrink every part by
+            # the worst ratio seen and cut once more
+            worst = max(
+                size / (end - begin)
+                for size, begin, end in zip(
+                    sizes,
+                    [0, *(pos for _, pos in cuts)],
+                    [*(pos for _, pos in cuts), f_size],
                 )
-                break
-            elif lpd <= 3:
-                await remove(out_path)
-                break
-            self._last_processed_time += lpd
-            self._last_processed_bytes += out_size
-            start_time += lpd - 3
-            i += 1
-        return True
+                if end > begin
+            )
+            LOGGER.warning(
+                f"Largest part is {max(sizes)}, cutting again with smaller parts. Path: {f_path}"
+            )
+            cap = int(cap / max(worst, 1)) - SPLIT_OVERHEAD
+            corrected = True
+            self.clear()
+
+    @staticmethod
+    async def _remove_parts(paths):
+        for path in paths:
+            with suppress(Exception):
+                await remove(path)
@@ -0,0 +1,200 @@
+from collections import deque
+from contextlib import suppress
+from time import time
+
+from psutil import disk_usage
+
+from ... import DOWNLOAD_DIR, queued_dl, queued_up, sudo_users, task_dict, user_data
+from ...core.config_manager import Config
+from .bot_utils import sync_to_async
+
+OWNER, SUDO, USER = 0, 1, 2
+# A waiting task climbs one priority class per interval, so nothing starves
+AGING_INTERVAL = 15 * 60
+
+queue_info = {}
+_user_turns = {"dl": deque(), "up": deque()}
+_releases = {"dl": deque(maxlen=20), "up": deque(maxlen=20)}
+
+# Bandwidth reserved for a download until it reports a higher speed
+MIN_TASK_SPEED = 1024**2
+# mid -> {"size", "disk", "downloading"} for every admitted task
+reservations = {}
+
+
+def _queue(state):
+    return queued_dl if state == "dl" else queued_up
+
+
+def priority_class(user_id):
+    if user_id == Config.OWNER_ID:
+        return OWNER
+    if user_id in sudo_users or user_data.get(user_id, {}).get("SUDO"):
+        return SUDO
+    return USER
+
+
+def add_to_queue(listener, state, event):
+    _queue(state)[listener.mid] = event
+    queue_info[listener.mid] = {
+        "user_id": listener.user_id,
+        "priority": priority_class(listener.user_id),
+        "size": listener.size or 0,
+        "disk": expected_bytes(listener),
+        "added": time(),
+    }
+    if listener.user_id not in _user_turns[state]:
+        _user_turns[state].append(listener.user_id)
+
+
+def _effective_class(info, now):
+    return max(OWNER, info["priority"] - int((now - info["added"]) // AGING_INTERVAL))
+
+
+def schedule_order(state):
+    """Queued mids of a state in the order they will be released.
+
+    Highest (aged) priority class first; within a class users take turns
+    round-robin, one task per turn, so one user's bulk can't block the
+    others. A user's own tasks go oldest first, or smallest first with
+    QUEUE_SJF.
+    """
+    queue = _queue(state)
+    now = time()
+    per_user = {}
+    for mid in queue:
+        info = queue_info.setdefault(
+            mid, {"user_id": 0, "priority": USER, "size": 0, "added": now}
+        )
+        per_user.setdefault(info["user_id"], []).append(mid)
+
+    def task_key(mid):
+        info = queue_info[mid]
+        return (
+            _effective_class(info, now),
+            info["size"] if Config.QUEUE_SJF else 0,
+            info["added"],
+        )
+
+    for mids in per_user.values():
+        mids.sort(key=task_key, reverse=True)
+
+    turns = [uid for uid in _user_turns[state] if uid in per_user]
+    turns += [uid for uid in per_user if uid not in turns]
+    order = []
+    while turns:
+        best = min(task_key(per_user[uid][-1])[0] for uid in turns)
+        for i, uid in enumerate(turns):
+            if task_key(per_user[uid][-1])[0] == best:
+                break
+        order.append(per_user[uid].pop())
+        turns.pop(i)
+        if per_user[uid]:
+            turns.append(uid)
+    return order
+
+
+def mark_released(mid, state):
+    if info := queue_info.pop(mid, None):
+        if state == "dl":
+            reservations[mid] = {
+                "size": info["size"],
+                "disk": info["disk"],
+                "downloading": True,
+            }
+        turns = _user_turns[state]
+        if info["user_id"] in turns:
+            turns.remove(info["user_id"])
+        if any(
+            queue_info.get(m, {}).get("user_id") == info["user_id"]
+            for m in _queue(state)
+        ):
+            turns.append(info["user_id"])
+    _releases[state].append(time())
+
+
+def forget(mid):
+    queue_info.pop(mid, None)
+    reservations.pop(mid, None)
+
+
+def expected_bytes(listener):
+    size = listener.size or 0
+    # Streamed extraction uploads members as they land, so it never holds
+    # the archive and all of its contents at once
+    doubles = listener.compress or (
+        listener.extract and not listener.streams_extract()
+    )
+    return size * 2 if doubles else size
+
+
+def reserve(listener, state="dl"):
+    reservations[listener.mid] = {
+        "size": listener.size or 0,
+        "disk": expected_bytes(listener),
+        "downloading": state == "dl",
+    }
+
+
+def _outstanding_bytes(mid):
+    """Reserved bytes that haven't reached the disk yet."""
+    res = reservations[mid]
+    done = res["size"]
+    if res["downloading"]:
+        done = 0
+        if task := task_dict.get(mid):
+            with suppress(Exception):
+                done = res["size"] * min(float(task.progress().strip("%")), 100) / 100
+    return max(res["disk"] - done, 0)
+
+
+def _reserved_speed(mid):
+    speed = 0
+    if task := task_dict.get(mid):
+        with suppress(Exception):
+            speed = task.speed_raw()
+    return max(speed, MIN_TASK_SPEED)
+
+
+async def disk_headroom(exclude=None):
+    """Free disk space left once every other reservation is written."""
+    free = (await sync_to_async(disk_usage, DOWNLOAD_DIR)).free
+    return free - sum(_outstanding_bytes(mid) for mid in reservations if mid != exclude)
+
+
+def bandwidth_headroom(exclude=None):
+    if not (budget := Config.QUEUE_BANDWIDTH):
+        return None
+    return budget * 1024**2 - sum(
+        _reserved_speed(mid)
+        for mid, res in reservations.items()
+        if mid != exclude and res["downloading"]
+    )
+
+
+async def has_headroom(disk_bytes, exclude=None):
+    """Whether one more download fits next to every reservation.
+
+    With nothing else reserved the task is always admitted. Only one that
+    can't fit on its own is rejected, by limit_checker with STORAGE_LIMIT.
+    """
+    if not any(mid != exclude for mid in reservations):
+        return True
+    if await disk_headroom(exclude) < disk_bytes + Config.STORAGE_LIMIT * 1024**3:
+        return False
+    bandwidth = bandwidth_headroom(exclude)
+    return bandwidth is None or bandwidth >= MIN_TASK_SPEED
+
+
+def queue_positions(state):
+    """mid -> (position, total, estimated seconds until start or None)."""
+    order = schedule_order(state)
+    releases = _releases[state]
+    interval = None
+    if len(releases) > 1:
+        interval = (releases[-1] - releases[0]) / (len(releases) - 1)
+    total = len(order)
+    return {
+        mid: (pos, total, interval * pos if interval is not None else None)
+        for pos, mid in enumerate(order, start=1)
+    }
@@ -17,8 +17,16 @@ from ... import (
 from ...core.config_manager import Config
 from ..telegram_helper.bot_commands import BotCommands
 from ..telegram_helper.button_build import ButtonMaker
+from .bot_utils import sync_to_async
+from .cpu_scheduler import cpu_scheduler
+from .queue_scheduler import queue_positions
 
 SIZE_UNITS = ["B", "KB", "MB", "GB", "TB", "PB"]
+SNAPSHOT_TTL = 1
+# Seconds an unchanged status page waits before its clocks are edited in
+PAGE_REFRESH = 60
+
+_snapshot = {"time": 0, "tasks": [], "statuses": {}}
 
 
 class MirrorStatus:
@@ -76,12 +84,62 @@ STATUSES = {
 
 async def get_task_by_gid(gid: str):
     async with task_dict_lock:
-        for tk in task_dict.values():
-            if hasattr(tk, "seeding"):
-                await tk.update()
-            if tk.gid() == gid:
-                return tk
-        return None
+        return task_dict.gid_index.get(gid)
+
+
+async def _get_task_status(tk):
+    if iscoroutinefunction(tk.status):
+        return await tk.status()
+    return tk.status()
+
+
+def _get_speed_raw(tk):
+    if hasattr(tk, "speed_raw"):
+        return tk.speed_raw()
+    return speed_string_to_bytes(tk.speed())
+
+
+async def get_status_snapshot():
+    """Statuses and speed totals of every task, built at most once per tick.
+
+    All status messages refreshing within SNAPSHOT_TTL share one snapshot
+    unless a task was added, removed or had its status object replaced.
+    """
+    tasks = list(task_dict.values())
+    if time() - _snapshot["time"] < SNAPSHOT_TTL and _snapshot["tasks"] == tasks:
+        return _snapshot
+    results = await gather(
+        *(_get_task_status(tk) for tk in tasks), return_exceptions=True
+    )
+    statuses = {}
+    total_dl = 0
+    total_ul = 0
+    for tk, st in zip(tasks, results):
+        if isinstance(st, Exception):
+            continue
+        statuses[tk] = st
+        try:
+            if st in (MirrorStatus.STATUS_DOWNLOAD, MirrorStatus.STATUS_ARCHIVE):
+                total_dl += _get_speed_raw(tk)
+            elif st in (MirrorStatus.STATUS_UPLOAD, MirrorStatus.STATUS_SEED):
+                total_ul += _get_speed_raw(tk)
+        except Exception:
+            pass
+    disk, memory = await gather(
+        sync_to_async(disk_usage, DOWNLOAD_DIR), sync_to_async(virtual_memory)
+    )
+    _snapshot.update(
+        {
+            "time": time(),
+            "tasks": tasks,
+            "statuses": statuses,
+            "total_dl": total_dl,
+            "total_ul": total_ul,
+            "free": disk.free,
+            "ram": memory.percent,
+        }
+    )
+    return _snapshot
 
 
 async def get_specific_tasks(status, user_id):
@@ -90,22 +148,11 @@ async def get_specific_tasks(status, user_id):
             return [tk for tk in task_dict.values() if tk.listener.user_id == user_id]
         else:
             return list(task_dict.values())
-    tasks_to_check = (
-        [tk for tk in task_dict.values() if tk.listener.user_id == user_id]
-        if user_id
-        else list(task_dict.values())
-    )
-    coro_tasks = []
-    coro_tasks.extend(tk for tk in tasks_to_check if iscoroutinefunction(tk.status))
-    coro_statuses = await gather(*[tk.status() for tk in coro_tasks])
+    statuses = (await get_status_snapshot())["statuses"]
     result = []
-    coro_index = 0
-    for tk in tasks_to_check:
-        if tk in coro_tasks:
-            st = coro_statuses[coro_index]
-            coro_index += 1
-        else:
-            st = tk.status()
+    for tk, st in statuses.items():
+        if user_id and tk.listener.user_id != user_id:
+            continue
         if (st == status) or (
             status == MirrorStatus.STATUS_DOWNLOAD and st not in STATUSES.values()
         ):
@@ -201,6 +248,7 @@ async def get_readable_message(sid, is_user, page_no=1, status="All", page_step=
     msg = ""
     button = None
 
+    snapshot = await get_status_snapshot()
     tasks = await get_specific_tasks(status, sid if is_user else None)
 
     STATUS_LIMIT = Config.STATUS_LIMIT
@@ -214,31 +262,18 @@ async def get_readable_message(sid, is_user, page_no=1, status="All", page_step=
         status_dict[sid]["page_no"] = page_no
     start_position = (page_no - 1) * STATUS_LIMIT
 
-    total_dl = 0
-    total_ul = 0
-    for tk in tasks:
-        try:
-            if iscoroutinefunction(tk.status):
-                st = await tk.status()
-            else:
-                st = tk.status()
-            sp = speed_string_to_bytes(tk.speed())
-            if st == MirrorStatus.STATUS_DOWNLOAD or st == MirrorStatus.STATUS_ARCHIVE:
-                total_dl += sp
-            elif st == MirrorStatus.STATUS_UPLOAD or st == MirrorStatus.STATUS_SEED:
-                total_ul += sp
-        except:
-            pass
-
+    # Only the visible page is formatted, its dynamic fields form page_key
+    page_key = [page_no, pages, status, tasks_no]
+    positions = {}
     for index, task in enumerate(
         tasks[start_position : STATUS_LIMIT + start_position], start=1
     ):
         if status != "All":
             tstatus = status
-        elif iscoroutinefunction(task.status):
-            tstatus = await task.status()
+        elif task in snapshot["statuses"]:
+            tstatus = snapshot["statuses"][task]
         else:
-            tstatus = task.status()
+            tstatus = await _get_task_status(task)
 
         msg += f"{index + start_position}. {escape(f'{task.name()}')}\n"
         msg += f"<b>By:</b> {task.listener.message.from_user.mention(style='html')} [<code>{task.listener.message.from_user.id}</code>]\n"
@@ -248,13 +283,23 @@ async def get_readable_message(sid, is_user, page_no=1, status="All", page_step=
             and task.listener.progress
         ):
             progress = task.progress()
+            page_key.append(
+                (
+                    task.gid(),
+                    tstatus,
+                    progress,
+                    task.processed_bytes(),
+                    task.speed(),
+                    task.eta(),
+                )
+            )
             msg += f"╭ <a href='{task.listener.message.link if task.listener.is_super_chat else ''}'>{tstatus} » {progress}</a>"
             msg += f"\n┊ {get_progress_bar_string(progress)}"
             if task.listener.subname:
                 msg += f"\n┊ <b>{task.processed_bytes()} of {task.size()}</b> / {get_readable_file_size(task.listener.subsize)}"
             else:
                 msg += f"\n┊ <b>{task.processed_bytes()} of {task.size()}</b>"
-            if task.listener.total_count > 1 and task.status() != MirrorStatus.STATUS_UPLOAD:
+            if task.listener.total_count > 1 and tstatus != MirrorStatus.STATUS_UPLOAD:
                 msg += f"\n┊ <b>Cᴏᴜɴᴛ:</b> {task.listener.proceed_count}/{task.listener.total_count}"
             msg += f"\n┊ <b>Sᴘᴇᴇᴅ:</b> {task.speed()}"
             msg += f"\n┊ <b>ETA:</b> {task.eta()}"
@@ -262,6 +307,7 @@ async def get_readable_message(sid, is_user, page_no=1, status="All", page_step=
             msg += f"\n┊ <b>Eɴɢɪɴᴇ:</b> {task.engine}"
             msg += f"\n┊ <b>Mᴏᴅᴇ:</b> {task.listener.mode[1]}\n"
         elif tstatus == MirrorStatus.STATUS_SEED:
+            page_key.append((task.gid(), tstatus, task.ratio(), task.uploaded_bytes()))
             msg += f"╭ Sᴇᴇᴅɪɴɢ » {task.ratio()}"
             msg += f"\n┊ {get_progress_bar_string(100)}"
             msg += f"\n┊ <b>Sɪᴢᴇ:</b> {task.size()}"
@@ -269,8 +315,21 @@ async def get_readable_message(sid, is_user, page_no=1, status="All", page_step=
             msg += f"\n┊ <b>Uᴘʟᴏᴀᴅᴇᴅ:</b> {task.uploaded_bytes()}"
             msg += f"\n╰ <b>Pᴀsᴛ:</b> {get_readable_time(time() - task.listener.message.date.timestamp())}\n"
         else:
+            page_key.append((task.gid(), tstatus, task.size()))
             msg += f"╭ <b>Status:</b> {tstatus}\n"
             msg += f"╰ <b>Size:</b> {task.size()}\n"
+            if cpu_queue := cpu_scheduler.position(task.listener.mid):
+                page_key.append(cpu_queue)
+                msg += f"╰ <b>CPU Queue:</b> #{cpu_queue[0]}/{cpu_queue[1]}\n"
+
+        if tstatus in [MirrorStatus.STATUS_QUEUEDL, MirrorStatus.STATUS_QUEUEUP]:
+            state = "dl" if tstatus == MirrorStatus.STATUS_QUEUEDL else "up"
+            if state not in positions:
+                positions[state] = queue_positions(state)
+            if queued := positions[state].get(task.listener.mid):
+                pos, total, wait = queued
+                page_key.append((task.gid(), pos, total))
+                msg += f"╰ <b>Queue:</b> #{pos}/{total} | <b>Starts In:</b> {get_readable_time(wait) if wait is not None else '-'}\n"
 
         msg += f"╰ /{BotCommands.CancelTaskCommand[1]}_{task.gid()}\n\n"
 
@@ -279,7 +338,6 @@ async def get_readable_message(sid, is_user, page_no=1, status="All", page_step=
             return None, None
         else:
             msg = f"No Active {status} Tasks!\n\n"
-
     buttons = ButtonMaker()
     if not is_user:
         buttons.data_button("☲", f"status {sid} ov", position="header")
@@ -296,9 +354,26 @@ async def get_readable_message(sid, is_user, page_no=1, status="All", page_step=
                 buttons.data_button(label, f"status {sid} st {status_value}")
     buttons.data_button("♻️", f"status {sid} ref", position="header")
     button = buttons.build_menu(8)
+    free = get_readable_file_size(snapshot["free"])
+    total_dl = get_readable_file_size(snapshot["total_dl"])
+    total_ul = get_readable_file_size(snapshot["total_ul"])
     msg += "\n〄 <b>Sʏsᴛᴇᴍ Sᴛᴀᴛɪsᴛɪᴄs...</b>"
-    msg += f"\n╭ <b>Cᴘᴜ:</b> {bot.GLOBAL_CPU_USAGE}% | <b>F:</b> {get_readable_file_size(disk_usage(DOWNLOAD_DIR).free)}"
-    msg += f"\n┊ <b>Rᴀᴍ:</b> {virtual_memory().percent}% | <b>Uᴘ:</b> {get_readable_time(time() - bot_start_time)}"
-    msg += f"\n┊ 🔻 <b>Total DL:</b> {get_readable_file_size(total_dl)}/s"
-    msg += f"\n╰ 🔺 <b>Total UL:</b> {get_readable_file_size(total_ul)}/s"
+    msg += f"\n╭ <b>Cᴘᴜ:</b> {bot.GLOBAL_CPU_USAGE}% | <b>F:</b> {free}"
+    msg += f"\n┊ <b>Rᴀᴍ:</b> {snapshot['ram']}% | <b>Uᴘ:</b> {get_readable_time(time() - bot_start_time)}"
+    msg += f"\n┊ 🔻 <b>Total DL:</b> {total_dl}/s"
+    msg += f"\n╰ 🔺 <b>Total UL:</b> {total_ul}/s"
+    if sid in status_dict:
+        # The footer counts too, the time bucket brings Pᴀsᴛ and Uᴘ up to
+        # date on a page nothing else moved on
+        page_key.extend(
+            [
+                bot.GLOBAL_CPU_USAGE,
+                snapshot["ram"],
+                free,
+                total_dl,
+                total_ul,
+                int(time() // PAGE_REFRESH),
+            ]
+        )
+        status_dict[sid]["page_key"] = tuple(page_key)
     return msg, button
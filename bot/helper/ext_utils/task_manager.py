@@ -18,6 +18,16 @@ from ..telegram_helper.tg_utils import check_botpm, forcesub, verify_token
 from .bot_utils import get_telegraph_list, sync_to_async, safe_int
 from .files_utils import get_base_name, check_storage_threshold
 from .links_utils import is_gdrive_id
+from .queue_scheduler import (
+    add_to_queue,
+    expected_bytes,
+    has_headroom,
+    mark_released,
+    queue_info,
+    reservations,
+    reserve,
+    schedule_order,
+)
 from .status_utils import get_readable_time, get_readable_file_size, get_specific_tasks
 
 
@@ -68,15 +78,18 @@ async def check_running_tasks(listener, state="dl"):
     )
     event = None
     is_over_limit = False
+    forced = (
+        listener.force_run
+        or (listener.force_upload and state == "up")
+        or (listener.force_download and state == "dl")
+    )
     async with queue_dict_lock:
-        if state == "up" and listener.mid in non_queued_dl:
-            non_queued_dl.remove(listener.mid)
-        if (
-            (all_limit or state_limit)
-            and not listener.force_run
-            and not (listener.force_upload and state == "up")
-            and not (listener.force_download and state == "dl")
-        ):
+        if state == "up":
+            if listener.mid in non_queued_dl:
+                non_queued_dl.remove(listener.mid)
+            # Download finished, the data is on disk and its bandwidth is free
+            reserve(listener, state)
+        if (all_limit or state_limit) and not forced:
             dl_count = len(non_queued_dl)
             up_count = len(non_queued_up)
             t_count = dl_count if state == "dl" else up_count
@@ -85,17 +98,18 @@ async def check_running_tasks(listener, state="dl"):
                 and dl_count + up_count >= all_limit
                 and (not state_limit or t_count >= state_limit)
             ) or (state_limit and t_count >= state_limit)
-            if is_over_limit:
-                event = Event()
-                if state == "dl":
-                    queued_dl[listener.mid] = event
-                else:
-                    queued_up[listener.mid] = event
-        if not is_over_limit:
-            if state == "up":
-                non_queued_up.add(listener.mid)
-            else:
-                non_queued_dl.add(listener.mid)
+        if state == "dl" and not forced and not is_over_limit:
+            is_over_limit = not await has_headroom(
+                expected_bytes(listener), listener.mid
+            )
+        if is_over_limit:
+            event = Event()
+            add_to_queue(listener, state, event)
+        elif state == "up":
+            non_queued_up.add(listener.mid)
+        else:
+            reserve(listener, state)
+            non_queued_dl.add(listener.mid)
 
     return is_over_limit, event
 
@@ -103,71 +117,42 @@ async def check_running_tasks(listener, state="dl"):
 async def start_dl_from_queued(mid: int):
     queued_dl[mid].set()
     del queued_dl[mid]
+    mark_released(mid, "dl")
     non_queued_dl.add(mid)
 
 
 async def start_up_from_queued(mid: int):
     queued_up[mid].set()
     del queued_up[mid]
+    mark_released(mid, "up")
     non_queued_up.add(mid)
 
 
 async def start_from_queued():
-    if all_limit := safe_int(Config.QUEUE_ALL):
-        dl_limit = safe_int(Config.QUEUE_DOWNLOAD)
-        up_limit = safe_int(Config.QUEUE_UPLOAD)
-        async with queue_dict_lock:
-            dl = len(non_queued_dl)
-            up = len(non_queued_up)
-            all_ = dl + up
-            if all_ < all_limit:
-                f_tasks = all_limit - all_
-                if queued_up and (not up_limit or up < up_limit):
-                    for index, mid in enumerate(list(queued_up.keys()), start=1):
-                        await start_up_from_queued(mid)
-                        f_tasks -= 1
-                        if f_tasks == 0 or (up_limit and index >= up_limit - up):
-                            break
-                if queued_dl and (not dl_limit or dl < dl_limit) and f_tasks != 0:
-                    for index, mid in enumerate(list(queued_dl.keys()), start=1):
-                        await start_dl_from_queued(mid)
-                        if (dl_limit and index >= dl_limit - dl) or index == f_tasks:
-                            break
-        return
-
-    if up_limit := Config.QUEUE_UPLOAD:
-        async with queue_dict_lock:
-            up = len(non_queued_up)
-            if queued_up and up < up_limit:
-                f_tasks = up_limit - up
-                for index, mid in enumerate(list(queued_up.keys()), start=1):
-                    await start_up_from_queued(mid)
-                    if index == f_tasks:
-                        break
-    else:
-        async with queue_dict_lock:
-            if queued_up:
-                for mid in list(queued_up.keys()):
-                    await start_up_from_queued(mid)
-
-    if dl_limit := Config.QUEUE_DOWNLOAD:
-        async with queue_dict_lock:
-            dl = len(non_queued_dl)
-            if queued_dl and dl < dl_limit:
-                f_tasks = dl_limit - dl
-                for index, mid in enumerate(list(queued_dl.keys()), start=1):
-                    await start_dl_from_queued(mid)
-                    if index == f_tasks:
-                        break
-    else:
-        async with queue_dict_lock:
-            if queued_dl:
-                for mid in list(queued_dl.keys()):
-                    await start_dl_from_queued(mid)
+    all_limit = safe_int(Config.QUEUE_ALL)
+    dl_limit = safe_int(Config.QUEUE_DOWNLOAD)
+    up_limit = safe_int(Config.QUEUE_UPLOAD)
+    async with queue_dict_lock:
+        dl = len(non_queued_dl)
+        up = len(non_queued_up)
+        free = all_limit - dl - up if all_limit else len(queued_dl) + len(queued_up)
+        up_slots = min(free, up_limit - up) if up_limit else free
+        for mid in schedule_order("up")[: max(up_slots, 0)]:
+            await start_up_from_queued(mid)
+            free -= 1
+        dl_slots = min(free, dl_limit - dl) if dl_limit else free
+        for mid in schedule_order("dl")[: max(dl_slots, 0)]:
+            # Strict order, a big task waits for room instead of being overtaken
+            if not await has_headroom(queue_info[mid]["disk"]):
+                break
+            await start_dl_from_queued(mid)
 
 
 async def limit_checker(listener, yt_playlist=0):
     LOGGER.info("Checking Size Limit...")
+    if listener.mid in reservations:
+        # Torrents and aria2 links learn their size only after admission
+        reserve(listener)
     if await CustomFilters.sudo("", listener.message):
         LOGGER.info("SUDO User. Skipping Size Limit...")
         return
@@ -217,7 +202,10 @@ async def limit_checker(listener, yt_playlist=0):
         if Config.STORAGE_LIMIT and not listener.is_clone:
             limit = Config.STORAGE_LIMIT * 1024**3
             if not await check_storage_threshold(
-                size, limit, any([listener.compress, listener.extract])
+                size,
+                limit,
+                listener.compress
+                or (listener.extract and not listener.streams_extract()),
             ):
                 limit_exceeded = f"┊ <b>Threshold Storage Limit</b> → {get_readable_file_size(limit)}"
 
@@ -79,7 +79,9 @@ async def _on_download_complete(api, data):
     if download.get("followedBy", []):
         new_gid = download.get("followedBy", [])[0]
         LOGGER.info(f"Gid changed from {gid} to {new_gid}")
-        if task := await get_task_by_gid(new_gid):
+        if task := await get_task_by_gid(new_gid) or await get_task_by_gid(gid):
+            # Moves the status over to new_gid and indexes it
+            await task.update()
             task.listener.is_torrent = True
             if Config.BASE_URL and task.listener.select:
                 if not task.queued:
@@ -21,6 +21,10 @@ from ..ext_utils.task_manager import stop_duplicate_check, limit_checker
 from ..mirror_leech_utils.status_utils.qbit_status import QbittorrentStatus
 from ..telegram_helper.message_utils import update_status_message
 
+# Reannounce of a stuck torrent backs off from REANNOUNCE_MIN up to REANNOUNCE_MAX
+REANNOUNCE_MIN = 30
+REANNOUNCE_MAX = 600
+
 
 async def _remove_torrent(hash_, tag):
     await TorrentManager.qbittorrent.torrents.delete([hash_], True)
@@ -97,7 +101,7 @@ async def _on_download_complete(tor):
                 if task.listener.mid in task_dict:
                     removed = False
                     task_dict[task.listener.mid] = QbittorrentStatus(
-                        task.listener, True
+                        task.listener, True, ext_hash=ext_hash
                     )
                 else:
                     removed = True
@@ -117,93 +121,106 @@ async def _on_download_complete(tor):
         await _remove_torrent(ext_hash, tag)
 
 
+def _reannounce_due(qb):
+    if time() < qb["reannounce_at"]:
+        return False
+    qb["reannounce_at"] = time() + qb["reannounce_delay"]
+    qb["reannounce_delay"] = min(qb["reannounce_delay"] * 2, REANNOUNCE_MAX)
+    return True
+
+
+def _dispatch(tor_info, qb, handlers, reannounce, recheck):
+    state = tor_info.state
+    changed = state != qb["state"]
+    qb["state"] = state
+    if state == "metaDL":
+        qb["stalled_time"] = time()
+        if (
+            Config.TORRENT_TIMEOUT
+            and time() - qb["start_time"] >= Config.TORRENT_TIMEOUT
+        ):
+            handlers.append((_on_download_error, ("Dead Torrent!", tor_info)))
+        elif _reannounce_due(qb):
+            reannounce.append(tor_info.hash)
+    elif state == "downloading":
+        qb["stalled_time"] = time()
+        if changed:
+            qb["reannounce_at"] = 0
+            qb["reannounce_delay"] = REANNOUNCE_MIN
+        if not qb["stop_dup_check"]:
+            qb["stop_dup_check"] = True
+            handlers.append((_stop_duplicate, (tor_info,)))
+        if not qb["size_check"]:
+            qb["size_check"] = True
+            handlers.append((_size_check, (tor_info,)))
+    elif state == "stalledDL":
+        if not qb["rechecked"] and 0.99989999999999999 < tor_info.progress < 1:
+            msg = f"Force recheck - Name: {tor_info.name} Hash: "
+            msg += f"{tor_info.hash} Downloaded Bytes: {tor_info.downloaded} "
+            msg += f"Size: {tor_info.size} Total Size: {tor_info.total_size}"
+            LOGGER.warning(msg)
+            recheck.append(tor_info.hash)
+            qb["rechecked"] = True
+        elif (
+            Config.TORRENT_TIMEOUT
+            and time() - qb["stalled_time"] >= Config.TORRENT_TIMEOUT
+        ):
+            handlers.append((_on_download_error, ("Dead Torrent!", tor_info)))
+        elif _reannounce_due(qb):
+            reannounce.append(tor_info.hash)
+    elif state == "missingFiles":
+        if changed:
+            recheck.append(tor_info.hash)
+    elif state == "error":
+        if changed:
+            handlers.append(
+                (
+                    _on_download_error,
+                    ("No enough space for this torrent on device", tor_info),
+                )
+            )
+    elif (
+        int(tor_info.completion_on.timestamp()) != -1
+        and not qb["uploaded"]
+        and state
+        in [
+            "queuedUP",
+            "stalledUP",
+            "uploading",
+            "forcedUP",
+        ]
+    ):
+        qb["uploaded"] = True
+        handlers.append((_on_download_complete, (tor_info,)))
+    elif state in ["stoppedUP", "stoppedDL"] and qb["seeding"]:
+        qb["seeding"] = False
+        handlers.append((_on_seed_finish, (tor_info,)))
+
+
 @new_task
 async def _qb_listener():
     while True:
-        async with qb_listener_lock:
-            try:
-                torrents = await TorrentManager.qbittorrent.torrents.info()
-                if len(torrents) == 0:
-                    intervals["qb"] = ""
-                    break
-                for tor_info in torrents:
-                    tag = tor_info.tags[0]
-                    if tag not in qb_torrents:
-                        continue
-                    state = tor_info.state
-                    if state == "metaDL":
-                        qb_torrents[tag]["stalled_time"] = time()
-                        if (
-                            Config.TORRENT_TIMEOUT
-                            and time() - qb_torrents[tag]["start_time"]
-                            >= Config.TORRENT_TIMEOUT
-                        ):
-                            await _on_download_error("Dead Torrent!", tor_info)
-                        else:
-                            await TorrentManager.qbittorrent.torrents.reannounce(
-                                [tor_info.hash]
-                            )
-                    elif state == "downloading":
-                        qb_torrents[tag]["stalled_time"] = time()
-                        if not qb_torrents[tag]["stop_dup_check"]:
-                            qb_torrents[tag]["stop_dup_check"] = True
-                            await _stop_duplicate(tor_info)
-                        if not qb_torrents[tag]["size_check"]:
-                            qb_torrents[tag]["size_check"] = True
-                            await _size_check(tor_info)
-                    elif state == "stalledDL":
-                        if (
-                            not qb_torrents[tag]["rechecked"]
-                            and 0.99989999999999999 < tor_info.progress < 1
-                        ):
-                            msg = f"Force recheck - Name: {tor_info.name} Hash: "
-                            msg += f"{tor_info.hash} Downloaded Bytes: {tor_info.downloaded} "
-                            msg += f"Size: {tor_info.size} Total Size: {tor_info.total_size}"
-                            LOGGER.warning(msg)
-                            await TorrentManager.qbittorrent.torrents.recheck(
-                                [tor_info.hash]
-                            )
-                            qb_torrents[tag]["rechecked"] = True
-                        elif (
-                            Config.TORRENT_TIMEOUT
-                            and time() - qb_torrents[tag]["stalled_time"]
-                            >= Config.TORRENT_TIMEOUT
-                        ):
-                            await _on_download_error("Dead Torrent!", tor_info)
-                        else:
-                            await TorrentManager.qbittorrent.torrents.reannounce(
-                                [tor_info.hash]
-                            )
-                    elif state == "missingFiles":
-                        await TorrentManager.qbittorrent.torrents.recheck(
-                            [tor_info.hash]
-                        )
-                    elif state == "error":
-                        await _on_download_error(
-                            "No enough space for this torrent on device", tor_info
+        try:
+            torrents = await TorrentManager.qb_torrents(0)
+            if len(torrents) == 0:
+                intervals["qb"] = ""
+                break
+            handlers, reannounce, recheck = [], [], []
+            # Only bookkeeping under the lock, API calls and handlers run after
+            async with qb_listener_lock:
+                for tag, tor_info in torrents.items():
+                    if tag in qb_torrents:
+                        _dispatch(
+                            tor_info, qb_torrents[tag], handlers, reannounce, recheck
                         )
-                    elif (
-                        int(tor_info.completion_on.timestamp()) != -1
-                        and not qb_torrents[tag]["uploaded"]
-                        and state
-                        in [
-                            "queuedUP",
-                            "stalledUP",
-                            "uploading",
-                            "forcedUP",
-                        ]
-                    ):
-                        qb_torrents[tag]["uploaded"] = True
-                        await _on_download_complete(tor_info)
-                    elif (
-                        state in ["stoppedUP", "stoppedDL"]
-                        and qb_torrents[tag]["seeding"]
-                    ):
-                        qb_torrents[tag]["seeding"] = False
-                        await _on_seed_finish(tor_info)
-                        await sleep(0.5)
-            except (ClientError, TimeoutError, Exception, AQError) as e:
-                LOGGER.error(str(e))
+            if reannounce:
+                await TorrentManager.qbittorrent.torrents.reannounce(reannounce)
+            if recheck:
+                await TorrentManager.qbittorrent.torrents.recheck(recheck)
+            for handler, args in handlers:
+                await handler(*args)
+        except (ClientError, TimeoutError, Exception, AQError) as e:
+            LOGGER.error(str(e))
         await sleep(3)
 
 
@@ -217,6 +234,9 @@ async def on_download_start(tag):
             "rechecked": False,
             "uploaded": False,
             "seeding": False,
+            "state": None,
+            "reannounce_at": 0,
+            "reannounce_delay": REANNOUNCE_MIN,
         }
         if not intervals["qb"]:
             intervals["qb"] = await _qb_listener()
\ No newline at end of file
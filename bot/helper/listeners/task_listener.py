@@ -1,4 +1,4 @@
-from asyncio import gather, sleep
+from asyncio import Queue, gather, sleep
 from html import escape
 from time import time
 from mimetypes import guess_type
@@ -28,15 +28,18 @@ from ...core.torrent_manager import TorrentManager
 from ..ext_utils.bot_utils import encode_slink, sync_to_async
 from ..ext_utils.db_handler import database
 from ..ext_utils.files_utils import (
+    ArchiveExtractor,
     clean_download,
     clean_target,
     create_recursive_symlink,
-    get_path_size,
+    get_base_name,
     join_files,
     remove_excluded_files,
     move_and_merge,
 )
 from ..ext_utils.links_utils import is_gdrive_id
+from ..ext_utils.manifest import FileManifest
+from ..ext_utils.queue_scheduler import forget
 from ..ext_utils.status_utils import get_readable_file_size, get_readable_time
 from ..ext_utils.task_manager import check_running_tasks, start_from_queued
 from ..mirror_leech_utils.gdrive_utils.upload import GoogleDriveUpload
@@ -221,7 +224,6 @@ class TaskListener(TaskConfig):
 
             dl_path = f"{self.dir}/{self.name}"
         
-        self.size = await get_path_size(dl_path)
         self.is_file = await aiopath.isfile(dl_path)
 
         if self.seed:
@@ -233,7 +235,10 @@ class TaskListener(TaskConfig):
             up_dir = self.dir
             up_path = dl_path
 
-        await remove_excluded_files(self.up_dir or self.dir, self.excluded_extensions)
+        # The only walk of the files, every stage below keeps it current
+        self.manifest = await FileManifest.build(up_dir)
+        self.size = self.manifest.size(up_path)
+        await remove_excluded_files(up_dir, self.excluded_extensions, self.manifest)
 
         if not Config.QUEUE_ALL:
             async with queue_dict_lock:
@@ -243,6 +248,13 @@ class TaskListener(TaskConfig):
 
         if self.join and not self.is_file:
             await join_files(up_path)
+            await self.manifest.refresh(up_path)
+
+        if self.streams_extract() and (
+            archives := await ArchiveExtractor.scan(up_path, self.manifest)
+        ):
+            await self._stream_extract_upload(up_path, up_dir, archives, gid)
+            return
 
         if self.extract:
             up_path = await self.proceed_extract(up_path, gid)
@@ -250,20 +262,22 @@ class TaskListener(TaskConfig):
                 return
             self.is_file = await aiopath.isfile(up_path)
             self.name = up_path.replace(f"{up_dir}/", "").split("/", 1)[0]
-            self.size = await get_path_size(up_dir)
+            await remove_excluded_files(up_dir, self.excluded_extensions, self.manifest)
+            self.size = self.manifest.size(up_dir)
             self.clear()
-            await remove_excluded_files(up_dir, self.excluded_extensions)
 
         if self.ffmpeg_cmds:
+            stage_path = up_path
             up_path = await self.proceed_ffmpeg(
                 up_path,
                 gid,
             )
             if self.is_cancelled:
                 return
+            await self.manifest.refresh(stage_path, up_path)
             self.is_file = await aiopath.isfile(up_path)
             self.name = up_path.replace(f"{up_dir}/", "").split("/", 1)[0]
-            self.size = await get_path_size(up_dir)
+            self.size = self.manifest.size(up_dir)
             self.clear()
 
         if self.is_leech:
@@ -272,7 +286,7 @@ class TaskListener(TaskConfig):
                return
            self.is_file = await aiopath.isfile(up_path)
            self.name = up_path.replace(f"{up_dir}/", "").split("/", 1)[0]
-           self.size = await get_path_size(up_dir)
+           self.size = self.manifest.size(up_dir)
            self.clear()
 
         if self.is_leech and self.is_file:
@@ -283,39 +297,47 @@ class TaskListener(TaskConfig):
             ] or "application/octet-stream"
 
         if self.name_swap:
+            stage_path = up_path
             up_path = await self.substitute(up_path)
             if self.is_cancelled:
                 return
+            await self.manifest.refresh(stage_path, up_path)
             self.is_file = await aiopath.isfile(up_path)
             self.name = up_path.replace(f"{up_dir}/", "").split("/", 1)[0]
 
         if self.screen_shots or self.screenshot_timestamps:
+            stage_path = up_path
             up_path = await self.generate_screenshots(up_path)
             if self.is_cancelled:
                 return
+            await self.manifest.refresh(stage_path, up_path)
             self.is_file = await aiopath.isfile(up_path)
             self.name = up_path.replace(f"{up_dir}/", "").split("/", 1)[0]
-            self.size = await get_path_size(up_dir)
+            self.size = self.manifest.size(up_dir)
 
         if self.convert_audio or self.convert_video:
+            stage_path = up_path
             up_path = await self.convert_media(
                 up_path,
                 gid,
             )
             if self.is_cancelled:
                 return
+            await self.manifest.refresh(stage_path, up_path)
             self.is_file = await aiopath.isfile(up_path)
             self.name = up_path.replace(f"{up_dir}/", "").split("/", 1)[0]
-            self.size = await get_path_size(up_dir)
+            self.size = self.manifest.size(up_dir)
             self.clear()
 
         if self.sample_video:
+            stage_path = up_path
             up_path = await self.generate_sample_video(up_path, gid)
             if self.is_cancelled:
                 return
+            await self.manifest.refresh(stage_path, up_path)
             self.is_file = await aiopath.isfile(up_path)
             self.name = up_path.replace(f"{up_dir}/", "").split("/", 1)[0]
-            self.size = await get_path_size(up_dir)
+            self.size = self.manifest.size(up_dir)
             self.clear()
 
         if self.compress:
@@ -326,15 +348,22 @@ class TaskListener(TaskConfig):
             self.is_file = await aiopath.isfile(up_path)
             if self.is_cancelled:
                 return
+            # Split archives land next to up_path, not under it
+            await self.manifest.refresh(up_dir)
             self.clear()
 
         self.name = up_path.replace(f"{up_dir}/", "").split("/", 1)[0]
-        self.size = await get_path_size(up_dir)
+        self.size = self.manifest.size(up_dir)
 
         if self.is_leech and not self.compress:
             await self.proceed_split(up_path, gid)
             if self.is_cancelled:
                 return
+            if self.files_to_proceed:
+                await self.manifest.refresh(
+                    *{ospath.dirname(f_path) for f_path in self.files_to_proceed},
+                    recursive=False,
+                )
             self.clear()
 
         self.subproc = None
@@ -350,7 +379,7 @@ class TaskListener(TaskConfig):
                 return
             LOGGER.info(f"Start from Queued/Upload: {self.name}")
 
-        self.size = await get_path_size(up_dir)
+        self.size = self.manifest.size(up_dir)
 
         if self.is_leech:
             LOGGER.info(f"Leech Name: {self.name}")
@@ -395,6 +424,34 @@ class TaskListener(TaskConfig):
             del RCTransfer
         return
 
+    async def _stream_extract_upload(self, up_path, up_dir, archives, gid):
+        if self.is_file:
+            self.name = ospath.basename(get_base_name(up_path))
+        self.subproc = None
+
+        add_to_queue, event = await check_running_tasks(self, "up")
+        await start_from_queued()
+        if add_to_queue:
+            LOGGER.info(f"Added to Queue/Upload: {self.name}")
+            async with task_dict_lock:
+                task_dict[self.mid] = QueueStatus(self, gid, "Up")
+            await event.wait()
+            if self.is_cancelled:
+                return
+            LOGGER.info(f"Start from Queued/Upload: {self.name}")
+
+        LOGGER.info(f"Extract and Leech Name: {self.name}")
+        feed = Queue()
+        tg = TelegramUploader(self, up_dir, feed)
+        async with task_dict_lock:
+            task_dict[self.mid] = TelegramStatus(self, tg, gid, "up")
+        await gather(
+            update_status_message(self.message.chat.id),
+            tg.upload(),
+            self.proceed_stream_extract(up_path, archives, feed),
+        )
+        del tg
+
     async def on_upload_complete(
         self, link, files, folders, mime_type, rclone_path="", dir_id=""
     ):
@@ -517,6 +574,7 @@ class TaskListener(TaskConfig):
             async with queue_dict_lock:
                 if self.mid in non_queued_up:
                     non_queued_up.remove(self.mid)
+                forget(self.mid)
             await start_from_queued()
             return
 
@@ -536,6 +594,7 @@ class TaskListener(TaskConfig):
         async with queue_dict_lock:
             if self.mid in non_queued_up:
                 non_queued_up.remove(self.mid)
+            forget(self.mid)
 
         await start_from_queued()
 
@@ -587,6 +646,7 @@ class TaskListener(TaskConfig):
                 non_queued_dl.remove(self.mid)
             if self.mid in non_queued_up:
                 non_queued_up.remove(self.mid)
+            forget(self.mid)
 
         await start_from_queued()
         await sleep(3)
@@ -625,6 +685,7 @@ class TaskListener(TaskConfig):
                 non_queued_dl.remove(self.mid)
             if self.mid in non_queued_up:
                 non_queued_up.remove(self.mid)
+            forget(self.mid)
 
         await start_from_queued()
         await sleep(3)
@@ -88,7 +88,9 @@ async def add_qb_torrent(listener, path, ratio, seed_time):
         ext_hash = tor_info.hash
 
         async with task_dict_lock:
-            task_dict[listener.mid] = QbittorrentStatus(listener, queued=add_to_queue)
+            task_dict[listener.mid] = QbittorrentStatus(
+                listener, queued=add_to_queue, ext_hash=ext_hash
+            )
         await on_download_start(f"{listener.mid}")
 
         if add_to_queue:
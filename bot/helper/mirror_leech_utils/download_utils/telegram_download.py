@@ -87,12 +87,24 @@ class TelegramDownloadHelper:
             # TODO : Add support for user session ( Huh ??)
             if self._hyper_dl:
                 try:
-                    download = await HyperTGDownload().download_media(
-                        message,
-                        file_name=path,
-                        progress=self._on_download_progress,
-                        dump_chat=Config.LEECH_DUMP_CHAT,
+                    # Copied once, every attempt reads the same dump message
+                    dump_msg = await TgClient.bot.copy_message(
+                        chat_id=Config.LEECH_DUMP_CHAT,
+                        from_chat_id=message.chat.id,
+                        message_id=message.id,
+                        disable_notification=True,
                     )
+                    # A failed attempt keeps its journal, so the retry, or a
+                    # later task of the same file, resumes from the last
+                    # confirmed offsets
+                    for _ in range(2):
+                        download = await HyperTGDownload().download_media(
+                            dump_msg,
+                            file_name=path,
+                            progress=self._on_download_progress,
+                        )
+                        if download is not None or self._listener.is_cancelled:
+                            break
                 except Exception:
                     if getattr(Config, "USER_TRANSMISSION", False):
                         try:
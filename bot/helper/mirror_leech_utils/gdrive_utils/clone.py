@@ -1,6 +1,10 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from googleapiclient.errors import HttpError
+from hashlib import md5
+from json import dump, load
 from logging import getLogger
-from os import path as ospath
+from os import makedirs, path as ospath, remove, replace
 from tenacity import (
     retry,
     wait_exponential,
@@ -8,20 +12,37 @@ from tenacity import (
     retry_if_exception_type,
     RetryError,
 )
-from time import time
+from time import sleep, time
 
 from ...ext_utils.bot_utils import async_to_sync
 from ...mirror_leech_utils.gdrive_utils.helper import GoogleDriveHelper
+from ...mirror_leech_utils.gdrive_utils.search import forget_searches
 
 LOGGER = getLogger(__name__)
 
 
 class GoogleDriveClone(GoogleDriveHelper):
+    # Files copied at once
+    MAX_WORKERS = 10
+    # Drive takes at most 100 calls in one batch request
+    BATCH_SIZE = 100
+    # Waits on userRateLimitExceeded before an account gives up
+    MAX_BACKOFFS = 6
+    # A failed clone of a folder keeps its state here, the same clone again
+    # picks up from it instead of starting over
+    CHECKPOINT_DIR = "clone_checkpoints"
+    CHECKPOINT_INTERVAL = 10
+
     def __init__(self, listener):
         self.listener = listener
         self._start_time = time()
         super().__init__()
         self.is_cloning = True
+        self._failed = False
+        self._gates = {}
+        self._checkpoint = None
+        self._checkpoint_path = None
+        self._saved_at = 0
         self.user_setting()
 
     def user_setting(self):
@@ -52,21 +73,23 @@ class GoogleDriveClone(GoogleDriveHelper):
                 None,
             )
         self.service = self.authorize()
+        self.bind_thread_service()
         msg = ""
         LOGGER.info(f"File ID: {file_id}")
         try:
             meta = self.get_file_metadata(file_id)
             mime_type = meta.get("mimeType")
             if mime_type == self.G_DRIVE_DIR_MIME_TYPE:
-                dir_id = self.create_directory(meta.get("name"), self.listener.up_dest)
-                self._clone_folder(meta.get("name"), meta.get("id"), dir_id)
+                dir_id = self._clone_tree(meta)
                 durl = self.G_DRIVE_DIR_BASE_DOWNLOAD_URL.format(dir_id)
                 if self.listener.is_cancelled:
                     LOGGER.info("Deleting cloned data from Drive...")
                     self.service.files().delete(
                         fileId=dir_id, supportsAllDrives=True
                     ).execute()
+                    self._drop_checkpoint()
                     return None, None, None, None, None
+                self._drop_checkpoint()
                 mime_type = "Folder"
                 self.listener.size = self.proc_bytes
             else:
@@ -76,6 +99,7 @@ class GoogleDriveClone(GoogleDriveHelper):
                 if mime_type is None:
                     mime_type = "File"
                 self.listener.size = int(meta.get("size", 0))
+            forget_searches()
             return (
                 durl,
                 mime_type,
@@ -87,6 +111,7 @@ class GoogleDriveClone(GoogleDriveHelper):
             if isinstance(err, RetryError):
                 LOGGER.info(f"Total Attempts: {err.last_attempt.attempt_number}")
                 err = err.last_attempt.exception()
+            self._save_checkpoint(force=True)
             err = str(err).replace(">", "").replace("<", "")
             if "User rate limit exceeded" in err:
                 msg = "User rate limit exceeded."
@@ -102,29 +127,160 @@ class GoogleDriveClone(GoogleDriveHelper):
             async_to_sync(self.listener.on_upload_error, msg)
             return None, None, None, None, None
 
-    def _clone_folder(self, folder_name, folder_id, dest_id):
-        LOGGER.info(f"Syncing: {folder_name}")
-        files = self.get_files_by_folder_id(folder_id)
-        if len(files) == 0:
-            return dest_id
-        for file in files:
-            if file.get("mimeType") == self.G_DRIVE_DIR_MIME_TYPE:
-                self.total_folders += 1
-                file_path = ospath.join(folder_name, file.get("name"))
-                current_dir_id = self.create_directory(file.get("name"), dest_id)
-                self._clone_folder(file_path, file.get("id"), current_dir_id)
-            elif (
-                not file.get("name")
-                .strip()
-                .lower()
-                .endswith(tuple(self.listener.excluded_extensions))
-            ):
-                self.total_files += 1
-                self._copy_file(file.get("id"), dest_id)
-                self.proc_bytes += int(file.get("size", 0))
-                self.total_time = int(time() - self._start_time)
+    def _clone_tree(self, meta):
+        """Lists the source, builds its folders, then copies the files.
+
+        Returns the id of the cloned root folder.
+        """
+        state = self._load_checkpoint(meta["id"])
+        if state is None:
+            dir_id = self.create_directory(meta.get("name"), self.listener.up_dest)
+            state = {"folders": {meta["id"]: dir_id}, "done": {}}
+        else:
+            LOGGER.info(f"Resuming Clone: {meta.get('name')}")
+        self._checkpoint = state
+        folders, files = self._list_tree(meta["id"], meta.get("name"))
+        self.total_folders = len(folders)
+        self.total_files = len(files)
+        for level in folders:
             if self.listener.is_cancelled:
                 break
+            self._create_folders(level)
+        self._save_checkpoint(force=True)
+        self.proc_bytes = sum(state["done"].values())
+        pending = [file for file in files if file["id"] not in state["done"]]
+        if pending and not self.listener.is_cancelled:
+            self._copy_files(pending)
+        return state["folders"][meta["id"]]
+
+    def _list_tree(self, folder_id, folder_name):
+        """Folders per depth as (id, parent id, name), files with their parent."""
+        LOGGER.info(f"Syncing: {folder_name}")
+        tree = self.list_tree(folder_id, follow_shortcuts=False)
+        levels = []
+        files = []
+        current = [folder_id]
+        while current:
+            level = []
+            for parent_id in current:
+                for item in tree[parent_id]:
+                    if item.get("mimeType") == self.G_DRIVE_DIR_MIME_TYPE:
+                        level.append((item["id"], parent_id, item.get("name")))
+                    elif (
+                        not item.get("name")
+                        .strip()
+                        .lower()
+                        .endswith(tuple(self.listener.excluded_extensions))
+                    ):
+                        files.append(
+                            {
+                                "id": item["id"],
+                                "parent": parent_id,
+                                "size": int(item.get("size", 0)),
+                            }
+                        )
+            if level:
+                levels.append(level)
+            current = [folder[0] for folder in level]
+        return levels, files
+
+    def _create_folders(self, level):
+        """Creates one depth of the tree, BATCH_SIZE folders per request."""
+        mapping = self._checkpoint["folders"]
+        pending = deque(folder for folder in level if folder[0] not in mapping)
+        backoffs = 0
+        while pending and not self.listener.is_cancelled:
+            chunk = [
+                pending.popleft() for _ in range(min(len(pending), self.BATCH_SIZE))
+            ]
+            errors = {}
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    mapping[request_id] = response["id"]
+                else:
+                    errors[request_id] = exception
+
+            batch = self.service.new_batch_http_request(callback=callback)
+            for src_id, parent_id, name in chunk:
+                batch.add(
+                    self.service.files().create(
+                        body=self.directory_metadata(name, mapping[parent_id]),
+                        supportsAllDrives=True,
+                        fields="id",
+                    ),
+                    request_id=src_id,
+                )
+            try:
+                batch.execute()
+            except Exception as err:
+                errors = {folder[0]: err for folder in chunk}
+            if not errors:
+                backoffs = 0
+                continue
+            err = next(iter(errors.values()))
+            if backoffs >= self.MAX_BACKOFFS or self._reason(err) not in [
+                "userRateLimitExceeded",
+                "rateLimitExceeded",
+                None,
+            ]:
+                raise err
+            backoffs += 1
+            LOGGER.info(f"Retrying {len(errors)} folders in {2**backoffs}s")
+            sleep(2**backoffs)
+            pending.extend(folder for folder in chunk if folder[0] in errors)
+            if self.use_sa and self.sa_count < self.sa_number:
+                self.switch_service_account()
+                self.bind_thread_service()
+
+    def _copy_files(self, files):
+        mapping = self._checkpoint["folders"]
+        workers = min(self.MAX_WORKERS, len(files))
+        LOGGER.info(f"Copying {len(files)} files with {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(self._copy_one, file, mapping[file["parent"]]): file
+                for file in files
+            }
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                self._failed = True
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _copy_one(self, file, dest_id):
+        if self.listener.is_cancelled or self._failed:
+            return
+        self._copy_file(file["id"], dest_id)
+        with self._lock:
+            self._checkpoint["done"][file["id"]] = file["size"]
+            self.proc_bytes += file["size"]
+            self.total_time = int(time() - self._start_time)
+        self._save_checkpoint()
+
+    @staticmethod
+    def _reason(err):
+        if isinstance(err, HttpError) and err.resp.get(
+            "content-type", ""
+        ).startswith("application/json"):
+            return eval(err.content).get("error").get("errors")[0].get("reason")
+        return None
+
+    def _wait_gate(self):
+        # Rate limits are per account, a worker on a throttled account
+        # waits while the others keep going
+        if (delay := self._gates.get(self.thread_account(), 0) - time()) > 0:
+            sleep(delay)
+
+    def _back_off(self, backoffs):
+        delay = min(2**backoffs, 64)
+        account = self.thread_account()
+        with self._lock:
+            self._gates[account] = max(self._gates.get(account, 0), time() + delay)
+        LOGGER.info(f"Rate limited on account {account}, waiting {delay}s")
 
     @retry(
         wait=wait_exponential(multiplier=2, min=3, max=6),
@@ -133,15 +289,20 @@ class GoogleDriveClone(GoogleDriveHelper):
     )
     def _copy_file(self, file_id, dest_id):
         body = {"parents": [dest_id]}
-        try:
-            return (
-                self.service.files()
-                .copy(fileId=file_id, body=body, supportsAllDrives=True)
-                .execute()
-            )
-        except HttpError as err:
-            if err.resp.get("content-type", "").startswith("application/json"):
-                reason = eval(err.content).get("error").get("errors")[0].get("reason")
+        backoffs = 0
+        while True:
+            self._wait_gate()
+            try:
+                return (
+                    self.thread_service()
+                    .files()
+                    .copy(fileId=file_id, body=body, supportsAllDrives=True)
+                    .execute()
+                )
+            except HttpError as err:
+                reason = self._reason(err)
+                if reason is None:
+                    raise err
                 if reason not in [
                     "userRateLimitExceeded",
                     "dailyLimitExceeded",
@@ -150,17 +311,60 @@ class GoogleDriveClone(GoogleDriveHelper):
                     raise err
                 if reason == "cannotCopyFile":
                     LOGGER.error(err)
-                elif self.use_sa:
-                    if self.sa_count >= self.sa_number:
-                        LOGGER.info(
-                            f"Reached maximum number of service accounts switching, which is {self.sa_count}"
-                        )
-                        raise err
-                    else:
-                        if self.listener.is_cancelled:
-                            return
-                        self.switch_service_account()
-                        return self._copy_file(file_id, dest_id)
+                    return None
+                if self.listener.is_cancelled:
+                    return None
+                if self.use_sa and self.switch_thread_account():
+                    continue
+                if reason == "userRateLimitExceeded" and backoffs < self.MAX_BACKOFFS:
+                    backoffs += 1
+                    self._back_off(backoffs)
+                    continue
+                if self.use_sa:
+                    LOGGER.info(
+                        f"Reached maximum number of service accounts switching, which is {self.sa_count}"
+                    )
                 else:
                     LOGGER.error(f"Got: {reason}")
-                    raise err
+                raise err
+
+    def _load_checkpoint(self, folder_id):
+        key = md5(
+            f"{folder_id}:{self.listener.up_dest}:{self.use_sa}".encode()
+        ).hexdigest()
+        self._checkpoint_path = f"{self.CHECKPOINT_DIR}/{key}.json"
+        if not ospath.exists(self._checkpoint_path):
+            return None
+        try:
+            with open(self._checkpoint_path) as f:
+                state = load(f)
+            root = (
+                self.service.files()
+                .get(
+                    fileId=state["folders"][folder_id],
+                    supportsAllDrives=True,
+                    fields="id, trashed",
+                )
+                .execute()
+            )
+        except Exception as e:
+            LOGGER.warning(f"Ignoring clone checkpoint {self._checkpoint_path}: {e}")
+            return None
+        return None if root.get("trashed") else state
+
+    def _save_checkpoint(self, force=False):
+        if self._checkpoint is None:
+            return
+        with self._lock:
+            if not force and time() - self._saved_at < self.CHECKPOINT_INTERVAL:
+                return
+            self._saved_at = time()
+            makedirs(self.CHECKPOINT_DIR, exist_ok=True)
+            with open(f"{self._checkpoint_path}.tmp", "w") as f:
+                dump(self._checkpoint, f)
+            replace(f"{self._checkpoint_path}.tmp", self._checkpoint_path)
+
+    def _drop_checkpoint(self):
+        self._checkpoint = None
+        if self._checkpoint_path and ospath.exists(self._checkpoint_path):
+            remove(self._checkpoint_path)
@@ -61,20 +61,50 @@ class GoogleDriveCount(GoogleDriveHelper):
         self.proc_bytes += size
 
     def _gdrive_directory(self, drive_folder):
-        files = self.get_files_by_folder_id(drive_folder["id"])
-        if len(files) == 0:
-            return
-        for filee in files:
-            shortcut_details = filee.get("shortcutDetails")
-            if shortcut_details is not None:
-                mime_type = shortcut_details["targetMimeType"]
-                file_id = shortcut_details["targetId"]
-                filee = self.get_file_metadata(file_id)
-            else:
-                mime_type = filee.get("mimeType")
-            if mime_type == self.G_DRIVE_DIR_MIME_TYPE:
-                self.total_folders += 1
-                self._gdrive_directory(filee)
+        tree = self.list_tree(drive_folder["id"])
+        shortcut_ids = []
+        folders = [drive_folder["id"]]
+        seen = set(folders)
+        while folders:
+            for filee in tree.get(folders.pop(), []):
+                shortcut_details = filee.get("shortcutDetails")
+                if shortcut_details is not None:
+                    mime_type = shortcut_details["targetMimeType"]
+                    file_id = shortcut_details["targetId"]
+                else:
+                    mime_type = filee.get("mimeType")
+                    file_id = filee["id"]
+                if mime_type == self.G_DRIVE_DIR_MIME_TYPE:
+                    self.total_folders += 1
+                    if file_id not in seen:
+                        seen.add(file_id)
+                        folders.append(file_id)
+                else:
+                    self.total_files += 1
+                    if shortcut_details is not None:
+                        shortcut_ids.append(file_id)
+                    else:
+                        self._gdrive_file(filee)
+        for filee in self._shortcut_targets(shortcut_ids):
+            self._gdrive_file(filee)
+
+    def _shortcut_targets(self, file_ids):
+        """Metadata of the files shortcuts point to, 100 per batch request."""
+        targets = []
+
+        def callback(_, response, exception):
+            if exception is None:
+                targets.append(response)
             else:
-                self.total_files += 1
-                self._gdrive_file(filee)
+                LOGGER.error(f"Skipping shortcut target: {exception}")
+
+        for start in range(0, len(file_ids), 100):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for file_id in file_ids[start : start + 100]:
+                batch.add(
+                    self.service.files().get(
+                        fileId=file_id, supportsAllDrives=True, fields="size"
+                    )
+                )
+            batch.execute()
+        return targets
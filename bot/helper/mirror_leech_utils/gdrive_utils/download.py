@@ -1,3 +1,5 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 from io import FileIO
@@ -17,18 +19,32 @@ from ...mirror_leech_utils.gdrive_utils.helper import GoogleDriveHelper
 
 LOGGER = getLogger(__name__)
 
+CHUNK_SIZE = 100 * 1024 * 1024
+
 
 class GoogleDriveDownload(GoogleDriveHelper):
+    # Files of a folder downloading at once
+    MAX_WORKERS = 8
+
     def __init__(self, listener, path):
         self.listener = listener
         self._updater = None
         self._path = path
         super().__init__()
         self.is_downloading = True
+        self._counted = {}
+        self._failed = False
+        self._chunk_size = CHUNK_SIZE
+
+    async def progress(self):
+        # Workers add their bytes to proc_bytes as the chunks land
+        self.total_time += self.update_interval
 
     def download(self):
         file_id = self.get_id_from_url(self.listener.link, self.listener.user_id)
         self.service = self.authorize()
+        self.bind_thread_service()
+        self._failed = False
         self._updater = SetInterval(self.update_interval, self.progress)
         try:
             meta = self.get_file_metadata(file_id)
@@ -37,7 +53,11 @@ class GoogleDriveDownload(GoogleDriveHelper):
             else:
                 makedirs(self._path, exist_ok=True)
                 self._download_file(
-                    file_id, self._path, self.listener.name, meta.get("mimeType")
+                    file_id,
+                    self._path,
+                    self.listener.name,
+                    meta.get("mimeType"),
+                    int(meta.get("size", 0)),
                 )
         except Exception as err:
             if isinstance(err, RetryError):
@@ -63,103 +83,175 @@ class GoogleDriveDownload(GoogleDriveHelper):
             async_to_sync(self.listener.on_download_complete)
             return
 
+    def _list_folder(self, folder_id, path, folder_name):
+        """Lists the tree breadth first, creating its folders on the way.
+
+        Returns (file_id, folder path, name, mime type, size) per file.
+        """
+        tree = self.list_tree(folder_id)
+        jobs = []
+        planned = set()
+        folders = deque([(folder_id, path, folder_name)])
+        seen = {folder_id}
+        while folders and not self.listener.is_cancelled:
+            folder_id, path, folder_name = folders.popleft()
+            path = f"{path}/{folder_name.replace('/', '')}"
+            makedirs(path, exist_ok=True)
+            for item in tree.get(folder_id, []):
+                file_id = item["id"]
+                filename = item["name"]
+                size = int(item.get("size", 0))
+                shortcut_details = item.get("shortcutDetails")
+                if shortcut_details is not None:
+                    file_id = shortcut_details["targetId"]
+                    mime_type = shortcut_details["targetMimeType"]
+                    size = 0
+                else:
+                    mime_type = item.get("mimeType")
+                if mime_type == self.G_DRIVE_DIR_MIME_TYPE:
+                    # Shortcuts can reach a folder twice or loop back up
+                    if file_id not in seen:
+                        seen.add(file_id)
+                        folders.append((file_id, path, filename))
+                    continue
+                if filename.strip().lower().endswith(
+                    tuple(self.listener.excluded_extensions)
+                ):
+                    continue
+                # Drive allows same names in a folder, two workers must not
+                # write one path
+                key = f"{path}/{filename.replace('/', '')}"
+                if key in planned:
+                    LOGGER.warning(f"Skipping duplicate name in G-Drive: {key}")
+                    continue
+                planned.add(key)
+                jobs.append((file_id, path, filename, mime_type, size))
+        return jobs
+
     def _download_folder(self, folder_id, path, folder_name):
-        folder_name = folder_name.replace("/", "")
-        if not ospath.exists(f"{path}/{folder_name}"):
-            makedirs(f"{path}/{folder_name}")
-        path += f"/{folder_name}"
-        result = self.get_files_by_folder_id(folder_id)
-        if len(result) == 0:
+        jobs = self._list_folder(folder_id, path, folder_name)
+        if not jobs or self.listener.is_cancelled:
             return
-        result = sorted(result, key=lambda k: k["name"])
-        for item in result:
-            file_id = item["id"]
-            filename = item["name"]
-            shortcut_details = item.get("shortcutDetails")
-            if shortcut_details is not None:
-                file_id = shortcut_details["targetId"]
-                mime_type = shortcut_details["targetMimeType"]
-            else:
-                mime_type = item.get("mimeType")
-            if mime_type == self.G_DRIVE_DIR_MIME_TYPE:
-                self._download_folder(file_id, path, filename)
-            elif not ospath.isfile(
-                f"{path}{filename}"
-            ) and not filename.strip().lower().endswith(
-                tuple(self.listener.excluded_extensions)
-            ):
-                self._download_file(file_id, path, filename, mime_type)
-            if self.listener.is_cancelled:
-                break
+        workers = min(self.MAX_WORKERS, len(jobs))
+        # Same memory for the chunks in flight as one 100 MB download
+        self._chunk_size = CHUNK_SIZE // workers
+        # Biggest first, so no large file starts last and runs alone
+        jobs.sort(key=lambda job: job[4], reverse=True)
+        LOGGER.info(
+            f"Downloading {len(jobs)} files from G-Drive with {workers} workers: {self.listener.name}"
+        )
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self._download_file, *job) for job in jobs]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                self._failed = True
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _account(self, key, done):
+        with self._lock:
+            self.proc_bytes += done - self._counted.get(key, 0)
+            self._counted[key] = done
+
+    def _stopped(self):
+        return self.listener.is_cancelled or self._failed
 
     @retry(
         wait=wait_exponential(multiplier=2, min=3, max=6),
         stop=stop_after_attempt(3),
         retry=retry_if_exception_type(Exception),
     )
-    def _download_file(self, file_id, path, filename, mime_type, export=False):
+    def _download_file(
+        self, file_id, path, filename, mime_type, size=0, export=False
+    ):
+        service = self.thread_service()
         if export:
-            request = self.service.files().export_media(
+            request = service.files().export_media(
                 fileId=file_id, mimeType="application/pdf"
             )
         else:
-            request = self.service.files().get_media(
+            request = service.files().get_media(
                 fileId=file_id, supportsAllDrives=True, acknowledgeAbuse=True
             )
         filename = filename.replace("/", "")
         if export:
             filename = f"{filename}.pdf"
+            size = 0
         if len(filename.encode()) > 255:
             ext = ospath.splitext(filename)[1]
             filename = f"{filename[:245]}{ext}"
 
             if self.listener.name.strip().endswith(ext):
                 self.listener.name = filename
-        if self.listener.is_cancelled:
+        if self._stopped():
+            return
+        f_path = f"{path}/{filename}"
+        # A retry continues a partial file with a byte range instead of
+        # fetching it again, the size to stop at is needed for that
+        offset = ospath.getsize(f_path) if size and ospath.isfile(f_path) else 0
+        if offset == size and size:
+            self._account(f_path, size)
             return
-        fh = FileIO(f"{path}/{filename}", "wb")
-        downloader = MediaIoBaseDownload(fh, request, chunksize=100 * 1024 * 1024)
+        if offset > size:
+            offset = 0
+        self._account(f_path, offset)
+        fh = FileIO(f_path, "ab" if offset else "wb")
+        downloader = MediaIoBaseDownload(fh, request, chunksize=self._chunk_size)
+        downloader._progress = offset
         done = False
         retries = 0
-        while not done:
-            if self.listener.is_cancelled:
-                fh.close()
-                break
-            try:
-                self.status, done = downloader.next_chunk()
-            except HttpError as err:
-                LOGGER.error(err)
-                if err.resp.status in [500, 502, 503, 504, 429] and retries < 10:
-                    retries += 1
-                    continue
-                if err.resp.get("content-type", "").startswith("application/json"):
-                    reason = (
-                        eval(err.content).get("error").get("errors")[0].get("reason")
-                    )
-                    if "fileNotDownloadable" in reason and "document" in mime_type:
-                        return self._download_file(
-                            file_id, path, filename, mime_type, True
+        try:
+            while not done:
+                if self._stopped():
+                    break
+                try:
+                    status, done = downloader.next_chunk()
+                    self._account(f_path, status.resumable_progress)
+                except HttpError as err:
+                    LOGGER.error(err)
+                    if err.resp.status in [500, 502, 503, 504, 429] and retries < 10:
+                        retries += 1
+                        continue
+                    if err.resp.get("content-type", "").startswith(
+                        "application/json"
+                    ):
+                        reason = (
+                            eval(err.content)
+                            .get("error")
+                            .get("errors")[0]
+                            .get("reason")
                         )
-                    if reason not in [
-                        "downloadQuotaExceeded",
-                        "dailyLimitExceeded",
-                    ]:
-                        raise err
-                    if self.use_sa:
-                        if self.sa_count >= self.sa_number:
-                            LOGGER.info(
-                                f"Reached maximum number of service accounts switching, which is {self.sa_count}"
+                        if "fileNotDownloadable" in reason and "document" in mime_type:
+                            fh.close()
+                            return self._download_file(
+                                file_id, path, filename, mime_type, export=True
                             )
+                        if reason not in [
+                            "downloadQuotaExceeded",
+                            "dailyLimitExceeded",
+                        ]:
                             raise err
-                        else:
-                            if self.listener.is_cancelled:
+                        if self.use_sa:
+                            if self._stopped():
                                 return
-                            self.switch_service_account()
+                            if not self.switch_thread_account():
+                                LOGGER.info(
+                                    f"Reached maximum number of service accounts switching, which is {self.sa_count}"
+                                )
+                                raise err
                             LOGGER.info(f"Got: {reason}, Trying Again...")
+                            fh.close()
                             return self._download_file(
-                                file_id, path, filename, mime_type
+                                file_id, path, filename, mime_type, size
                             )
-                    else:
-                        LOGGER.error(f"Got: {reason}")
-                        raise err
-        self.file_processed_bytes = 0
+                        else:
+                            LOGGER.error(f"Got: {reason}")
+                            raise err
+        finally:
+            fh.close()
+        if done and size and ospath.getsize(f_path) != size:
+            self._account(f_path, 0)
+            raise ValueError(f"Size mismatch after download: {f_path}")
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from google_auth_httplib2 import AuthorizedHttp
@@ -7,6 +9,8 @@ from os import path as ospath, listdir
 from pickle import load as pload
 from random import randrange
 from re import search as re_search
+from threading import Lock, local
+from time import time
 from urllib.parse import parse_qs, urlparse
 from tenacity import (
     retry,
@@ -21,8 +25,36 @@ from ...ext_utils.links_utils import is_gdrive_id
 LOGGER = getLogger(__name__)
 getLogger("googleapiclient.discovery").setLevel(ERROR)
 
+# Children of folders listed lately, {(auth, folder id): (time, items)}, so a
+# count right before a clone or download spares them listing it again
+_listings = {}
+LISTING_TTL = 120
+
+# Worker pools shared by all helpers, {name: executor}. Their threads live
+# on, so the services they authorized serve the next task too
+_pools = {}
+_pools_lock = Lock()
+# Services a thread authorized, per account, the latest THREAD_SERVICES kept
+_thread_services = local()
+THREAD_SERVICES = 4
+
+
+def shared_pool(name, workers):
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f"gdrive_{name}"
+            )
+        return _pools[name]
+
 
 class GoogleDriveHelper:
+    # Concurrent files.list queries of list_tree
+    LIST_WORKERS = 8
+    # Folders asked for in one 'a' in parents or 'b' in parents query, ids
+    # are ~33 chars so this keeps queries well under the length limit
+    PARENTS_PER_QUERY = 40
+
     def __init__(self):
         self._OAUTH_SCOPE = ["https://www.googleapis.com/auth/drive"]
         self.token_path = "token.pickle"
@@ -47,6 +79,9 @@ class GoogleDriveHelper:
         self.status = None
         self.update_interval = 3
         self.use_sa = Config.USE_SERVICE_ACCOUNTS
+        self._lock = Lock()
+        self._local = local()
+        self._next_sa = 0
 
     @property
     def speed(self):
@@ -69,15 +104,17 @@ class GoogleDriveHelper:
             self.proc_bytes += chunk_size
             self.total_time += self.update_interval
 
-    def authorize(self):
+    def authorize(self, sa_index=None):
         credentials = None
         if self.use_sa:
             json_files = listdir("accounts")
             self.sa_number = len(json_files)
-            self.sa_index = randrange(self.sa_number)
-            LOGGER.info(f"Authorizing with {json_files[self.sa_index]} service account")
+            if sa_index is None:
+                self.sa_index = sa_index = randrange(self.sa_number)
+            sa_file = json_files[sa_index % self.sa_number]
+            LOGGER.info(f"Authorizing with {sa_file} service account")
             credentials = service_account.Credentials.from_service_account_file(
-                f"accounts/{json_files[self.sa_index]}", scopes=self._OAUTH_SCOPE
+                f"accounts/{sa_file}", scopes=self._OAUTH_SCOPE
             )
         elif ospath.exists(self.token_path):
             LOGGER.info(f"Authorize with {self.token_path}")
@@ -96,7 +133,62 @@ class GoogleDriveHelper:
             self.sa_index += 1
         self.sa_count += 1
         LOGGER.info(f"Switching to {self.sa_index} index")
-        self.service = self.authorize()
+        self.service = self.authorize(self.sa_index)
+
+    def bind_thread_service(self):
+        """Makes self.service the one of the calling thread."""
+        self._local = local()
+        self._local.service, self._local.sa_index = self.service, self.sa_index
+
+    def thread_service(self):
+        # httplib2 connections can't be shared, every worker thread builds
+        # its own service and the workers are spread over the accounts
+        if getattr(self._local, "service", None) is None:
+            with self._lock:
+                self._next_sa += 1
+                sa_index = self.sa_index + self._next_sa
+            self._local.sa_index = sa_index % self.sa_number if self.use_sa else 0
+            self._local.service = self._account_service(self._local.sa_index)
+        return self._local.service
+
+    def _account_service(self, sa_index):
+        """The calling thread's service for an account, authorized once."""
+        if self.use_sa:
+            json_files = listdir("accounts")
+            self.sa_number = len(json_files)
+            key = json_files[sa_index % self.sa_number]
+        else:
+            # A replaced token file gets a new service
+            key = (
+                self.token_path,
+                ospath.getmtime(self.token_path)
+                if ospath.exists(self.token_path)
+                else 0,
+            )
+        services = getattr(_thread_services, "services", None)
+        if services is None:
+            services = _thread_services.services = OrderedDict()
+        if (service := services.get(key)) is None:
+            service = services[key] = self.authorize(sa_index)
+            if len(services) > THREAD_SERVICES:
+                services.popitem(last=False)
+        else:
+            services.move_to_end(key)
+        return service
+
+    def thread_account(self):
+        self.thread_service()
+        return self._local.sa_index
+
+    def switch_thread_account(self):
+        with self._lock:
+            if self.sa_count >= self.sa_number:
+                return False
+            self.sa_count += 1
+        self._local.sa_index = (self._local.sa_index + 1) % self.sa_number
+        LOGGER.info(f"Switching to {self._local.sa_index} index")
+        self._local.service = self._account_service(self._local.sa_index)
+        return True
 
     def get_id_from_url(self, link, user_id=""):
         if user_id and link.startswith("mtp:"):
@@ -176,7 +268,7 @@ class GoogleDriveHelper:
                     includeItemsFromAllDrives=True,
                     q=q,
                     spaces="drive",
-                    pageSize=200,
+                    pageSize=1000,
                     fields="nextPageToken, files(id, name, mimeType, size, shortcutDetails)",
                     orderBy="folder, name",
                     pageToken=page_token,
@@ -189,22 +281,101 @@ class GoogleDriveHelper:
                 break
         return files
 
+    @retry(
+        wait=wait_exponential(multiplier=2, min=3, max=6),
+        stop=stop_after_attempt(3),
+        retry=retry_if_exception_type(Exception),
+    )
+    def _list_parents(self, folder_ids):
+        page_token = None
+        children = {folder_id: [] for folder_id in folder_ids}
+        parents = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_ids)
+        while True:
+            response = (
+                self.thread_service()
+                .files()
+                .list(
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True,
+                    q=f"({parents}) and trashed = false",
+                    spaces="drive",
+                    pageSize=1000,
+                    fields="nextPageToken, files(id, name, mimeType, size, shortcutDetails, parents)",
+                    orderBy="folder, name",
+                    pageToken=page_token,
+                )
+                .execute()
+            )
+            for item in response.get("files", []):
+                for parent in item.get("parents", []):
+                    if parent in children:
+                        children[parent].append(item)
+            page_token = response.get("nextPageToken")
+            if page_token is None:
+                break
+        return children
+
+    def list_tree(self, folder_id, follow_shortcuts=True):
+        """Children of every folder under folder_id, {folder id: [items]}.
+
+        Goes breadth first, each level is listed PARENTS_PER_QUERY folders
+        per files.list query with the queries running concurrently on the
+        shared listing pool.
+        """
+        auth = "sa" if self.use_sa else self.token_path
+        now = time()
+        for key, (listed_at, _) in list(_listings.items()):
+            if now - listed_at > LISTING_TTL:
+                _listings.pop(key, None)
+        tree = {}
+        level = [folder_id]
+        pool = shared_pool("list", self.LIST_WORKERS)
+        while level:
+            missing = []
+            for parent in level:
+                if (cached := _listings.get((auth, parent))) is not None:
+                    tree[parent] = cached[1]
+                else:
+                    missing.append(parent)
+            groups = [
+                missing[start : start + self.PARENTS_PER_QUERY]
+                for start in range(0, len(missing), self.PARENTS_PER_QUERY)
+            ]
+            for children in pool.map(self._list_parents, groups):
+                for parent, items in children.items():
+                    _listings[(auth, parent)] = (time(), items)
+                    tree[parent] = items
+            next_level = []
+            for parent in level:
+                for item in tree[parent]:
+                    child = item["id"]
+                    mime_type = item.get("mimeType")
+                    if follow_shortcuts and (
+                        shortcut_details := item.get("shortcutDetails")
+                    ):
+                        child = shortcut_details["targetId"]
+                        mime_type = shortcut_details["targetMimeType"]
+                    if (
+                        mime_type == self.G_DRIVE_DIR_MIME_TYPE
+                        and child not in tree
+                    ):
+                        tree[child] = []
+                        next_level.append(child)
+            level = next_level
+        return tree
+
     @retry(
         wait=wait_exponential(multiplier=2, min=3, max=6),
         stop=stop_after_attempt(3),
         retry=retry_if_exception_type(Exception),
     )
     def create_directory(self, directory_name, dest_id):
-        file_metadata = {
-            "name": directory_name,
-            "description": "Uploaded by Mirror-leech-telegram-bot",
-            "mimeType": self.G_DRIVE_DIR_MIME_TYPE,
-        }
-        if dest_id is not None:
-            file_metadata["parents"] = [dest_id]
         file = (
             self.service.files()
-            .create(body=file_metadata, supportsAllDrives=True)
+            .create(
+                body=self.directory_metadata(directory_name, dest_id),
+                supportsAllDrives=True,
+            )
             .execute()
         )
         file_id = file.get("id")
@@ -213,6 +384,16 @@ class GoogleDriveHelper:
         LOGGER.info(f"Created G-Drive Folder:\nName: {file.get('name')}\nID: {file_id}")
         return file_id
 
+    def directory_metadata(self, directory_name, dest_id):
+        file_metadata = {
+            "name": directory_name,
+            "description": "Uploaded by Mirror-leech-telegram-bot",
+            "mimeType": self.G_DRIVE_DIR_MIME_TYPE,
+        }
+        if dest_id is not None:
+            file_metadata["parents"] = [dest_id]
+        return file_metadata
+
     def escapes(self, estr):
         chars = ["\\", "'", '"', r"\a", r"\b", r"\f", r"\n", r"\r", r"\t"]
         for char in chars:
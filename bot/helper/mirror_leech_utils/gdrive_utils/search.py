@@ -1,13 +1,34 @@
 from logging import getLogger
+from time import time
 
 from .... import drives_names, drives_ids, index_urls, user_data
 from ....helper.ext_utils.status_utils import get_readable_file_size
-from ....helper.mirror_leech_utils.gdrive_utils.helper import GoogleDriveHelper
+from ....helper.mirror_leech_utils.gdrive_utils.helper import (
+    GoogleDriveHelper,
+    shared_pool,
+)
 
 LOGGER = getLogger(__name__)
 
+# Recent drive query results, {(name, drive, query options, auth): (time,
+# response)}. Every mirror runs a stop duplicate search, repeats of a name
+# within the ttl skip the round trips. Those keep only misses, a deleted
+# duplicate must not block the name until the ttl runs out
+_results = {}
+SEARCH_TTL = 60
+
+
+def forget_searches():
+    """Called once data lands in a drive, so no stale miss lets a duplicate in."""
+    _results.clear()
+
 
 class GoogleDriveSearch(GoogleDriveHelper):
+    # Drives queried at once
+    MAX_WORKERS = 10
+    # Telegraph rejects pages much above this many bytes
+    PAGE_BYTES = 39000
+
     def __init__(self, stop_dup=False, no_multi=False, is_recursive=True, item_type=""):
         super().__init__()
         self._stop_dup = stop_dup
@@ -16,6 +37,16 @@ class GoogleDriveSearch(GoogleDriveHelper):
         self._item_type = item_type
 
     def _drive_query(self, dir_id, file_name, is_recursive):
+        key = (
+            file_name,
+            dir_id,
+            is_recursive,
+            self._stop_dup,
+            self._item_type,
+            "sa" if self.use_sa else self.token_path,
+        )
+        if (cached := _results.get(key)) and time() - cached[0] < SEARCH_TTL:
+            return cached[1]
         try:
             if is_recursive:
                 if self._stop_dup:
@@ -33,8 +64,9 @@ class GoogleDriveSearch(GoogleDriveHelper):
                         query += f"mimeType = '{self.G_DRIVE_DIR_MIME_TYPE}' and "
                 query += "trashed = false"
                 if dir_id == "root":
-                    return (
-                        self.service.files()
+                    response = (
+                        self.thread_service()
+                        .files()
                         .list(
                             q=f"{query} and 'me' in owners",
                             pageSize=200,
@@ -45,8 +77,9 @@ class GoogleDriveSearch(GoogleDriveHelper):
                         .execute()
                     )
                 else:
-                    return (
-                        self.service.files()
+                    response = (
+                        self.thread_service()
+                        .files()
                         .list(
                             supportsAllDrives=True,
                             includeItemsFromAllDrives=True,
@@ -74,8 +107,9 @@ class GoogleDriveSearch(GoogleDriveHelper):
                     elif self._item_type == "folders":
                         query += f"mimeType = '{self.G_DRIVE_DIR_MIME_TYPE}' and "
                 query += "trashed = false"
-                return (
-                    self.service.files()
+                response = (
+                    self.thread_service()
+                    .files()
                     .list(
                         supportsAllDrives=True,
                         includeItemsFromAllDrives=True,
@@ -91,9 +125,15 @@ class GoogleDriveSearch(GoogleDriveHelper):
             err = str(err).replace(">", "").replace("<", "")
             LOGGER.error(err)
             return {"files": []}
+        now = time()
+        for old_key, (searched_at, _) in list(_results.items()):
+            if now - searched_at > SEARCH_TTL:
+                _results.pop(old_key, None)
+        if not self._stop_dup or not response.get("files"):
+            _results[key] = (now, response)
+        return response
 
     def drive_list(self, file_name, target_id="", user_id=""):
-        msg = ""
         file_name = self.escapes(str(file_name))
         contents_no = 0
         telegraph_content = []
@@ -118,24 +158,41 @@ class GoogleDriveSearch(GoogleDriveHelper):
         ):
             self.use_sa = False
 
-        self.service = self.authorize()
+        drives = list(drives)
+        if self._no_multi:
+            drives = drives[:1]
 
-        for drive_name, dir_id, index_url in drives:
+        def search(drive):
+            dir_id = drive[1]
             isRecur = (
                 False if self._is_recursive and len(dir_id) > 23 else self._is_recursive
             )
-            response = self._drive_query(dir_id, file_name, isRecur)
+            return self._drive_query(dir_id, file_name, isRecur)
+
+        # Even one drive goes through the pool, its threads keep their
+        # authorized services from the searches before
+        responses = list(
+            shared_pool("search", self.MAX_WORKERS).map(search, drives)
+        )
+
+        parts = []
+        page_bytes = 0
+
+        def add(part):
+            nonlocal page_bytes
+            parts.append(part)
+            page_bytes += len(part.encode("utf-8"))
+
+        for (drive_name, dir_id, index_url), response in zip(drives, responses):
             if not response["files"]:
-                if self._no_multi:
-                    break
-                else:
-                    continue
+                continue
             if not Title:
-                msg += f"<h4>Search Result For {file_name}</h4>"
+                add(f"<h4>Search Result For {file_name}</h4>")
                 Title = True
             if drive_name:
-                msg += f"╾────────────╼<br><b>{drive_name}</b><br>╾────────────╼<br>"
+                add(f"╾────────────╼<br><b>{drive_name}</b><br>╾────────────╼<br>")
             for file in response.get("files", []):
+                msg = ""
                 mime_type = file.get("mimeType")
                 if mime_type == self.G_DRIVE_DIR_MIME_TYPE:
                     furl = self.G_DRIVE_DIR_BASE_DOWNLOAD_URL.format(file.get("id"))
@@ -160,16 +217,15 @@ class GoogleDriveSearch(GoogleDriveHelper):
                         if mime_type.startswith(("image", "video", "audio")):
                             urlv = f"{index_url}findpath?id={file.get('id')}&view=true"
                             msg += f' <b>| <a href="{urlv}">View Link</a></b>'
-                msg += "<br><br>"
+                add(f"{msg}<br><br>")
                 contents_no += 1
-                if len(msg.encode("utf-8")) > 39000:
-                    telegraph_content.append(msg)
-                    msg = ""
-            if self._no_multi:
-                break
-
-        if msg != "":
-            telegraph_content.append(msg)
+                if page_bytes > self.PAGE_BYTES:
+                    telegraph_content.append("".join(parts))
+                    parts = []
+                    page_bytes = 0
+
+        if parts:
+            telegraph_content.append("".join(parts))
 
         return telegraph_content, contents_no
 
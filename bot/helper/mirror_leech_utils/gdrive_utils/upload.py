@@ -14,6 +14,7 @@ from ....core.config_manager import Config
 from ...ext_utils.bot_utils import async_to_sync, SetInterval
 from ...ext_utils.files_utils import get_mime_type
 from ...mirror_leech_utils.gdrive_utils.helper import GoogleDriveHelper
+from ...mirror_leech_utils.gdrive_utils.search import forget_searches
 
 LOGGER = getLogger(__name__)
 
@@ -91,6 +92,7 @@ class GoogleDriveUpload(GoogleDriveHelper):
                 return
             elif self._is_errored:
                 return
+            forget_searches()
             async_to_sync(
                 self.listener.on_upload_complete,
                 link,
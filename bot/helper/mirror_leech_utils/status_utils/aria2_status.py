@@ -1,7 +1,11 @@
 from time import time
 
-from .... import LOGGER
-from ....core.torrent_manager import TorrentManager, aria2_name
+from .... import LOGGER, task_dict
+from ....core.torrent_manager import (
+    ARIA2_STATUS_KEYS,
+    TorrentManager,
+    aria2_name,
+)
 from ...ext_utils.status_utils import (
     EngineStatus,
     MirrorStatus,
@@ -12,7 +16,10 @@ from ...ext_utils.status_utils import (
 
 async def get_download(gid, old_info=None):
     try:
-        res = await TorrentManager.aria2.tellStatus(gid)
+        if res := (await TorrentManager.aria2_downloads()).get(gid):
+            return res
+        # Stopped or added since the last snapshot
+        res = await TorrentManager.aria2.tellStatus(gid, ARIA2_STATUS_KEYS)
         return res or old_info
     except Exception as e:
         LOGGER.error(f"{e}: Aria2c, Error while getting torrent info")
@@ -34,6 +41,9 @@ class Aria2Status:
         if self._download.get("followedBy", []):
             self._gid = self._download["followedBy"][0]
             self._download = await get_download(self._gid)
+            # A removed or replaced status must not come back into the index
+            if task_dict.get(self.listener.mid) is self:
+                task_dict.reindex(self)
 
     def progress(self):
         try:
@@ -44,6 +54,9 @@ class Aria2Status:
     def processed_bytes(self):
         return get_readable_file_size(int(self._download.get("completedLength", "0")))
 
+    def speed_raw(self):
+        return int(self._download.get("downloadSpeed", "0"))
+
     def speed(self):
         return (
             f"{get_readable_file_size(int(self._download.get("downloadSpeed", "0")))}/s"
@@ -44,6 +44,9 @@ class GoogleDriveStatus:
     def progress(self):
         return f"{round(self.progress_raw(), 2)}%"
 
+    def speed_raw(self):
+        return self._obj.speed
+
     def speed(self):
         return f"{get_readable_file_size(self._obj.speed)}/s"
 
@@ -87,6 +87,9 @@ class JDownloaderStatus:
     def processed_bytes(self):
         return get_readable_file_size(self._info.get("bytesLoaded", 0))
 
+    def speed_raw(self):
+        return self._info.get('speed', 0)
+
     def speed(self):
         return f"{get_readable_file_size(self._info.get('speed', 0))}/s"
 
@@ -54,6 +54,9 @@ class MegaDownloadStatus:
     def size(self):
         return get_readable_file_size(self._size)
 
+    def speed_raw(self):
+        return self._obj.speed
+
     def speed(self):
         return f"{get_readable_file_size(self._obj.speed)}/s"
 
@@ -31,6 +31,9 @@ class MergeStatus:
     def progress(self):
         return f"{round(self._obj.progress, 2)}%"
 
+    def speed_raw(self):
+        return self._obj.download_speed
+
     def speed(self):
         return f"{get_readable_file_size(self._obj.download_speed)}/s"
 
@@ -15,6 +15,9 @@ class MetadataStatus:
         self._cstatus = status
         self.engine = EngineStatus().STATUS_FFMPEG
 
+    def speed_raw(self):
+        return self._obj.speed_raw
+
     def speed(self):
         return f"{get_readable_file_size(self._obj.speed_raw)}/s"
 
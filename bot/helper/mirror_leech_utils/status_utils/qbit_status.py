@@ -12,19 +12,23 @@ from ...ext_utils.status_utils import (
 
 async def get_download(tag, old_info=None):
     try:
-        res = (await TorrentManager.qbittorrent.torrents.info(tag=tag))[0]
-        return res or old_info
+        torrents = await TorrentManager.qb_torrents()
+        if tag not in torrents and old_info is None:
+            # Added after the last snapshot was taken
+            torrents = await TorrentManager.qb_torrents(0)
+        return torrents.get(tag, old_info)
     except Exception as e:
         LOGGER.error(f"{e}: Qbittorrent, while getting torrent info. Tag: {tag}")
         return old_info
 
 
 class QbittorrentStatus:
-    def __init__(self, listener, seeding=False, queued=False):
+    def __init__(self, listener, seeding=False, queued=False, ext_hash=""):
         self.queued = queued
         self.seeding = seeding
         self.listener = listener
         self._info = None
+        self._hash = ext_hash
         self.engine = EngineStatus().STATUS_QBIT
 
     async def update(self):
@@ -36,6 +40,9 @@ class QbittorrentStatus:
     def processed_bytes(self):
         return get_readable_file_size(self._info.downloaded)
 
+    def speed_raw(self):
+        return self._info.dlspeed
+
     def speed(self):
         return f"{get_readable_file_size(self._info.dlspeed)}/s"
 
@@ -92,7 +99,7 @@ class QbittorrentStatus:
         return self.hash()[:12]
 
     def hash(self):
-        return self._info.hash
+        return self._info.hash if self._info else self._hash
 
     async def cancel_task(self):
         self.listener.is_cancelled = True
@@ -30,6 +30,9 @@ class QueueStatus:
     def progress(self):
         return "0%"
 
+    def speed_raw(self):
+        return 0
+
     def speed(self):
         return "0B/s"
 
@@ -28,6 +28,9 @@ class SevenZStatus:
     def progress(self):
         return self._obj.progress
 
+    def speed_raw(self):
+        return self._speed_raw()
+
     def speed(self):
         return f"{get_readable_file_size(self._speed_raw())}/s"
 
@@ -61,6 +64,7 @@ class SevenZStatus:
     async def cancel_task(self):
         LOGGER.info(f"Cancelling {self._cstatus}: {self.listener.name}")
         self.listener.is_cancelled = True
+        self._obj.cancel()
         if (
             self.listener.subproc is not None
             and self.listener.subproc.returncode is None
@@ -10,7 +10,6 @@ class TelegramStatus:
     def __init__(self, listener, obj, gid, status, hyper=False):
         self.listener = listener
         self._obj = obj
-        self._size = self.listener.size
         self._gid = gid
         self._status = status
         self.engine = EngineStatus().STATUS_TGRAM + (" (HyperDL)" if hyper else "")
@@ -19,7 +18,7 @@ class TelegramStatus:
         return get_readable_file_size(self._obj.processed_bytes)
 
     def size(self):
-        return get_readable_file_size(self._size)
+        return get_readable_file_size(self.listener.size)
 
     def status(self):
         if self._status == "up":
@@ -31,17 +30,20 @@ class TelegramStatus:
 
     def progress(self):
         try:
-            progress_raw = self._obj.processed_bytes / self._size * 100
+            progress_raw = self._obj.processed_bytes / self.listener.size * 100
         except ZeroDivisionError:
             progress_raw = 0
         return f"{round(progress_raw, 2)}%"
 
+    def speed_raw(self):
+        return self._obj.speed
+
     def speed(self):
         return f"{get_readable_file_size(self._obj.speed)}/s"
 
     def eta(self):
         try:
-            seconds = (self._size - self._obj.processed_bytes) / self._obj.speed
+            seconds = (self.listener.size - self._obj.processed_bytes) / self._obj.speed
             return get_readable_time(seconds)
         except ZeroDivisionError:
             return "-"
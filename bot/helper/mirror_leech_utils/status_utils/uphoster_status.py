@@ -35,6 +35,9 @@ class UphosterStatus:
             progress_raw = 0
         return f"{round(progress_raw, 2)}%"
 
+    def speed_raw(self):
+        return self._obj.speed
+
     def speed(self):
         return f"{get_readable_file_size(self._obj.speed)}/s"
 
@@ -33,6 +33,9 @@ class YtDlpStatus:
     def progress(self):
         return f"{round(self._obj.progress, 2)}%"
 
+    def speed_raw(self):
+        return self._obj.download_speed
+
     def speed(self):
         return f"{get_readable_file_size(self._obj.download_speed)}/s"
 
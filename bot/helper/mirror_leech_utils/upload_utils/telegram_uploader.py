@@ -1,13 +1,30 @@
-from asyncio import sleep
+from asyncio import (
+    FIRST_COMPLETED,
+    Event,
+    Queue,
+    create_task,
+    gather,
+    sleep,
+    wait,
+)
 from logging import getLogger
-from os import path as ospath, walk
+from os import path as ospath
 from re import match as re_match, sub as re_sub
 from time import time
 
 from aioshutil import rmtree
 from natsort import natsorted
 from PIL import Image
-from pyrogram.errors import BadRequest, FloodWait, RPCError
+from pyrogram import StopTransmission, raw, utils
+from pyrogram.errors import (
+    BadRequest,
+    ChannelPrivate,
+    ChatWriteForbidden,
+    FilePartMissing,
+    FloodWait,
+    PeerIdInvalid,
+    RPCError,
+)
 
 try:
     from pyrogram.errors import FloodPremiumWait
@@ -22,39 +39,53 @@ from pyrogram.types import (
     InputMediaDocument,
     InputMediaPhoto,
     InputMediaVideo,
+    InputReplyToMessage,
+    Message,
 )
 from tenacity import (
     RetryError,
     retry,
     retry_if_exception_type,
+    retry_if_not_exception_type,
     stop_after_attempt,
     wait_exponential,
 )
 
 from ....core.config_manager import Config
 from ....core.tg_client import TgClient
-from ...ext_utils.bot_utils import sync_to_async
 from ...ext_utils.files_utils import get_base_name, is_archive
+from ...ext_utils.hash_utils import get_file_hash
 from ...ext_utils.status_utils import get_readable_file_size, get_readable_time
 from ...ext_utils.media_utils import (
     get_audio_thumbnail,
-    get_document_type,
     get_media_info,
     get_multiple_frames_thumbnail,
     get_video_thumbnail,
-    get_md5_hash,
 )
 from ...telegram_helper.message_utils import delete_message
 
 LOGGER = getLogger(__name__)
 
+# Concurrent uploads, spread over the bot and helper bots
+MAX_PARALLEL_UPLOADS = 4
+# Files prepared (caption, rename, thumbnail) beyond the ones uploading
+PREPARE_AHEAD = 2
+# Errors of a bot that can't post in the destination chat
+NO_ACCESS = (ChatWriteForbidden, PeerIdInvalid, ChannelPrivate)
+
+# Whether a helper bot may post in a chat, per (helper bot, chat id)
+_helper_access = {}
+
 
 class TelegramUploader:
-    def __init__(self, listener, path):
-        self._last_uploaded = 0
+    def __init__(self, listener, path, feed=None):
         self._processed_bytes = 0
         self._listener = listener
         self._path = path
+        # Queue of file paths to upload as they get ready, ended by None.
+        # Without it the files under path are uploaded
+        self._feed = feed
+        self._streaming = feed is not None
         self._client = None
         self._start_time = time()
         self._total_files = 0
@@ -64,7 +95,10 @@ class TelegramUploader:
         self._is_corrupted = False
         self._media_dict = {"videos": {}, "documents": {}}
         self._last_msg_in_group = False
-        self._up_path = ""
+        self._sent_events = []
+        self._turns_taken = set()
+        self._item_bytes = {}
+        self._is_log_del = False
         self._lprefix = ""
         self._lsuffix = ""
         self._lcaption = ""
@@ -77,16 +111,6 @@ class TelegramUploader:
         self._user_session = self._listener.user_transmission
         self._error = ""
 
-    async def _upload_progress(self, current, _):
-        if self._listener.is_cancelled:
-            if self._user_session:
-                TgClient.user.stop_transmission()
-            else:
-                self._listener.client.stop_transmission()
-        chunk_size = current - self._last_uploaded
-        self._last_uploaded = current
-        self._processed_bytes += chunk_size
-
     async def _user_settings(self):
         settings_map = {
             "MEDIA_GROUP": ("_media_group", False),
@@ -133,7 +157,7 @@ class TelegramUploader:
                 else:
                     self._is_private = self._sent_msg.chat.type.name == "PRIVATE"
             except Exception as e:
-                await self._listener.on_upload_error(str(e))
+                await self._on_upload_error(str(e))
                 return False
 
         elif self._user_session:
@@ -151,8 +175,15 @@ class TelegramUploader:
             self._sent_msg = self._listener.message
         return True
 
+    async def _on_upload_error(self, error):
+        if self._streaming:
+            # Stops the extraction feeding this upload, nothing reads it now
+            self._listener.is_cancelled = True
+        await self._listener.on_upload_error(error)
+
     async def _prepare_file(self, pre_file_, dirpath):
         cap_file_ = file_ = pre_file_
+        up_path = ospath.join(dirpath, pre_file_)
         if self._listener.zip_all and is_archive(file_) and not self._lcaption:
             self._lcaption = f"<b>File Name:</b> {{filename}}\n<b>Total Files:</b> {{total_files}}\n<b>Total Size:</b> {{size}}"
 
@@ -185,7 +216,6 @@ class TelegramUploader:
             parts[0] = re_sub(
                 r"\{([^}]+)\}", lambda m: f"{{{m.group(1).lower()}}}", parts[0]
             )
-            up_path = ospath.join(dirpath, pre_file_)
             dur, qual, lang, subs = await get_media_info(up_path, True)
             cap_mono = parts[0].format(
                 filename=cap_file_,
@@ -194,7 +224,14 @@ class TelegramUploader:
                 quality=qual,
                 languages=lang,
                 subtitles=subs,
-                md5_hash=await sync_to_async(get_md5_hash, up_path),
+                md5_hash=(
+                    await get_file_hash(up_path, "md5")
+                    if "{md5_hash}" in parts[0]
+                    else ""
+                ),
+                file_hash=(
+                    await get_file_hash(up_path) if "{file_hash}" in parts[0] else ""
+                ),
                 mime_type=self._listener.file_details.get("mime_type", "text/plain"),
                 prefilename=self._listener.file_details.get("filename", ""),
                 precaption=self._listener.file_details.get("caption", ""),
@@ -238,10 +275,10 @@ class TelegramUploader:
 
         if pre_file_ != file_:
             new_path = ospath.join(dirpath, file_)
-            await rename(self._up_path, new_path)
-            self._up_path = new_path
+            await rename(up_path, new_path)
+            up_path = new_path
 
-        return cap_mono
+        return cap_mono, up_path
 
     def _get_input_media(self, subkey, key):
         rlist = []
@@ -366,89 +403,306 @@ class TelegramUploader:
             if not self._listener.is_cancelled:
                 LOGGER.error(f"Failed To Send in BotPM:\n{str(err)}")
 
+    async def _upload_clients(self):
+        # Helper bots can only post where they are members, so they're used
+        # for a leech destination chat and never for PM or user sessions
+        clients = [self._listener.client]
+        if (
+            not self._listener.up_dest
+            or self._user_session
+            or self._listener.hybrid_leech
+        ):
+            return clients
+        # Helper bots already copy into the dump chat, it needs no check
+        trusted = str(self._listener.up_dest) == str(Config.LEECH_DUMP_CHAT)
+        for helper in TgClient.helper_bots.values():
+            if len(clients) == MAX_PARALLEL_UPLOADS:
+                break
+            if trusted or await self._can_post(helper, self._sent_msg.chat):
+                clients.append(helper)
+        return clients
+
+    @staticmethod
+    async def _can_post(helper, chat):
+        key = (helper, chat.id)
+        if key not in _helper_access:
+            try:
+                member = await helper.get_chat_member(chat.id, "me")
+            except (FloodWait, FloodPremiumWait):
+                return False
+            except RPCError as e:
+                LOGGER.warning(f"Helper bot not used in {chat.id}: {e}")
+                _helper_access[key] = False
+                return False
+            status = member.status.name
+            _helper_access[key] = status in ["OWNER", "ADMINISTRATOR"] or (
+                status == "MEMBER" and chat.type.name != "CHANNEL"
+            )
+        return _helper_access[key]
+
+    async def _reply_target(self, client):
+        """Last sent message, bound to the client that will reply to it."""
+        if client is self._sent_msg._client:
+            return self._sent_msg
+        return await client.get_messages(
+            chat_id=self._sent_msg.chat.id, message_ids=self._sent_msg.id
+        )
+
+    async def _wait_turn(self, index, f_path):
+        """Hold the send of file index until every earlier item is sent."""
+        if index in self._turns_taken:
+            return
+        if index:
+            await self._sent_events[index - 1].wait()
+        self._turns_taken.add(index)
+        if self._last_msg_in_group:
+            group_lists = [x for v in self._media_dict.values() for x in v.keys()]
+            match = re_match(r".+(?=\.0*\d+$)|.+(?=\.part\d+\..+$)", f_path)
+            if not match or match and match.group(0) not in group_lists:
+                for key, value in list(self._media_dict.items()):
+                    for subkey, msgs in list(value.items()):
+                        if len(msgs) > 1:
+                            await self._send_media_group(subkey, key, msgs)
+        self._last_msg_in_group = False
+
+    def _progress(self, client, index):
+        async def progress(current, _):
+            if self._listener.is_cancelled:
+                client.stop_transmission()
+            # Per item, so a retried upload replaces its earlier bytes
+            self._processed_bytes += current - self._item_bytes.get(index, 0)
+            self._item_bytes[index] = current
+
+        return progress
+
+    async def _prepare_upload(self, dirpath, file_):
+        up_path = ospath.join(dirpath, file_)
+        manifest = self._listener.manifest
+        if manifest is not None and manifest.is_file(up_path):
+            f_size = manifest.size(up_path)
+        elif await aiopath.exists(up_path):
+            f_size = await aiopath.getsize(up_path)
+        else:
+            return None
+        if f_size == 0:
+            return f_size, None, up_path, None
+        cap_mono, up_path = await self._prepare_file(file_, dirpath)
+        return f_size, cap_mono, up_path, await self._prepare_media(up_path, file_)
+
+    async def _prepare_media(self, up_path, file, force_document=False):
+        if (
+            self._thumb is not None
+            and not await aiopath.exists(self._thumb)
+            and self._thumb != "none"
+        ):
+            self._thumb = None
+        is_video, is_audio, is_image = await self._listener.document_type(up_path)
+        media = {
+            "is_video": is_video,
+            "is_audio": is_audio,
+            "is_image": is_image,
+            "thumb": self._thumb,
+            "duration": 0,
+            "width": 480,
+            "height": 320,
+        }
+
+        if not is_image and media["thumb"] is None:
+            file_name = ospath.splitext(file)[0]
+            thumb_path = f"{self._path}/yt-dlp-thumb/{file_name}.jpg"
+            if await aiopath.isfile(thumb_path):
+                media["thumb"] = thumb_path
+            elif is_audio and not is_video:
+                media["thumb"] = await get_audio_thumbnail(up_path)
+
+        media["as_doc"] = (
+            self._listener.as_doc
+            or force_document
+            or (not is_video and not is_audio and not is_image)
+        )
+        if media["as_doc"]:
+            if is_video and media["thumb"] is None:
+                media["thumb"] = await get_video_thumbnail(up_path, None)
+        elif is_video:
+            media["duration"] = (await get_media_info(up_path))[0]
+            if media["thumb"] is None and self._listener.thumbnail_layout:
+                media["thumb"] = await get_multiple_frames_thumbnail(
+                    up_path,
+                    self._listener.thumbnail_layout,
+                    self._listener.screen_shots,
+                )
+            if media["thumb"] is None:
+                media["thumb"] = await get_video_thumbnail(up_path, media["duration"])
+            if media["thumb"] is not None and media["thumb"] != "none":
+                with Image.open(media["thumb"]) as img:
+                    media["width"], media["height"] = img.size
+        elif is_audio:
+            (
+                media["duration"],
+                media["artist"],
+                media["title"],
+            ) = await get_media_info(up_path)
+        return media
+
+    async def _remove_thumb(self, media):
+        thumb = media["thumb"]
+        if (
+            thumb is not None
+            and thumb != self._thumb
+            and thumb != "none"
+            and await aiopath.exists(thumb)
+        ):
+            await remove(thumb)
+
+    async def _upload_item(self, index, dirpath, file_, prepared, clients):
+        client = pool_client = await clients.get()
+        sent_msg = None
+        try:
+            if file_ is None:
+                await self._wait_turn(index, dirpath)
+                await self._send_screenshots(dirpath, prepared)
+                await rmtree(dirpath, ignore_errors=True)
+                return
+            f_path = ospath.join(dirpath, file_)
+            up_path = f_path
+            try:
+                if (res := await prepared) is None:
+                    LOGGER.error(f"{f_path} not exists! Continue uploading!")
+                    return
+                f_size, cap_mono, up_path, media = res
+                self._total_files += 1
+                if f_size == 0:
+                    LOGGER.error(
+                        f"{up_path} size is zero, telegram don't upload zero size files"
+                    )
+                    self._corrupted += 1
+                    return
+                if self._listener.is_cancelled:
+                    return
+                if self._listener.hybrid_leech and self._listener.user_transmission:
+                    await self._wait_turn(index, f_path)
+                    self._user_session = f_size > 2097152000
+                    if self._user_session:
+                        client = TgClient.user
+                    else:
+                        client = self._listener.client
+                    self._sent_msg = await client.get_messages(
+                        chat_id=self._sent_msg.chat.id,
+                        message_ids=self._sent_msg.id,
+                    )
+                elif self._user_session:
+                    client = TgClient.user
+                try:
+                    sent_msg = await self._upload_file(
+                        cap_mono, file_, f_path, up_path, media, client, index
+                    )
+                except NO_ACCESS as err:
+                    if client is self._listener.client:
+                        raise
+                    LOGGER.warning(f"Helper bot can't post here, dropped: {err}")
+                    _helper_access[(client, self._sent_msg.chat.id)] = False
+                    # The bot takes its place so the pool keeps its size
+                    client = pool_client = self._listener.client
+                    sent_msg = await self._upload_file(
+                        cap_mono, file_, f_path, up_path, None, client, index
+                    )
+                if self._log_msg and not self._is_log_del and Config.CLEAN_LOG_MSG:
+                    await delete_message(self._log_msg)
+                    self._is_log_del = True
+                if self._listener.is_cancelled:
+                    return
+                if (
+                    sent_msg is not None
+                    and (self._listener.is_super_chat or self._listener.up_dest)
+                    and not self._is_private
+                ):
+                    self._msgs_dict[sent_msg.link] = file_
+            except Exception as err:
+                if isinstance(err, RetryError):
+                    LOGGER.info(f"Total Attempts: {err.last_attempt.attempt_number}")
+                    err = err.last_attempt.exception()
+                LOGGER.error(f"{err}. Path: {up_path}", exc_info=True)
+                self._error = str(err)
+                self._corrupted += 1
+                if self._listener.is_cancelled:
+                    return
+            if not self._listener.is_cancelled and await aiopath.exists(up_path):
+                await remove(up_path)
+        finally:
+            self._sent_events[index].set()
+            if sent_msg is not None:
+                await sleep(1)
+            clients.put_nowait(pool_client)
+
     async def upload(self):
         await self._user_settings()
         res = await self._msg_to_reply()
         if not res:
             return
-        is_log_del = False
-        for dirpath, _, files in natsorted(await sync_to_async(walk, self._path)):
-            if dirpath.strip().endswith("/yt-dlp-thumb"):
-                continue
-            if dirpath.strip().endswith("_mltbss"):
-                await self._send_screenshots(dirpath, files)
-                await rmtree(dirpath, ignore_errors=True)
-                continue
-            for file_ in natsorted(files):
-                self._error = ""
-                self._up_path = f_path = ospath.join(dirpath, file_)
-                if not await aiopath.exists(self._up_path):
-                    LOGGER.error(f"{self._up_path} not exists! Continue uploading!")
+        items = []
+        if self._feed is None:
+            for dirpath, _, files in natsorted(
+                await self._listener.walk_files(self._path)
+            ):
+                if dirpath.strip().endswith("/yt-dlp-thumb"):
                     continue
-                try:
-                    f_size = await aiopath.getsize(self._up_path)
-                    self._total_files += 1
-                    if f_size == 0:
-                        LOGGER.error(
-                            f"{self._up_path} size is zero, telegram don't upload zero size files"
-                        )
-                        self._corrupted += 1
-                        continue
-                    if self._listener.is_cancelled:
-                        return
-                    cap_mono = await self._prepare_file(file_, dirpath)
-                    if self._last_msg_in_group:
-                        group_lists = [
-                            x for v in self._media_dict.values() for x in v.keys()
-                        ]
-                        match = re_match(r".+(?=\.0*\d+$)|.+(?=\.part\d+\..+$)", f_path)
-                        if not match or match and match.group(0) not in group_lists:
-                            for key, value in list(self._media_dict.items()):
-                                for subkey, msgs in list(value.items()):
-                                    if len(msgs) > 1:
-                                        await self._send_media_group(subkey, key, msgs)
-                    if self._listener.hybrid_leech and self._listener.user_transmission:
-                        self._user_session = f_size > 2097152000
-                        if self._user_session:
-                            self._sent_msg = await TgClient.user.get_messages(
-                                chat_id=self._sent_msg.chat.id,
-                                message_ids=self._sent_msg.id,
-                            )
-                        else:
-                            self._sent_msg = await self._listener.client.get_messages(
-                                chat_id=self._sent_msg.chat.id,
-                                message_ids=self._sent_msg.id,
-                            )
-                    self._last_msg_in_group = False
-                    self._last_uploaded = 0
-                    await self._upload_file(cap_mono, file_, f_path)
-                    if self._log_msg and not is_log_del and Config.CLEAN_LOG_MSG:
-                        await delete_message(self._log_msg)
-                        is_log_del = True
-                    if self._listener.is_cancelled:
-                        return
-                    if (
-                        not self._is_corrupted
-                        and (self._listener.is_super_chat or self._listener.up_dest)
-                        and not self._is_private
-                    ):
-                        self._msgs_dict[self._sent_msg.link] = file_
-                    await sleep(1)
-                except Exception as err:
-                    if isinstance(err, RetryError):
-                        LOGGER.info(
-                            f"Total Attempts: {err.last_attempt.attempt_number}"
-                        )
-                        err = err.last_attempt.exception()
-                    LOGGER.error(f"{err}. Path: {self._up_path}", exc_info=True)
-                    self._error = str(err)
-                    self._corrupted += 1
-                    if self._listener.is_cancelled:
-                        return
-                if not self._listener.is_cancelled and await aiopath.exists(
-                    self._up_path
-                ):
-                    await remove(self._up_path)
+                if dirpath.strip().endswith("_mltbss"):
+                    items.append((dirpath, None, files))
+                    continue
+                items.extend((dirpath, file_, None) for file_ in natsorted(files))
+
+        clients = Queue()
+        for client in await self._upload_clients():
+            clients.put_nowait(client)
+        workers = clients.qsize()
+        self._sent_events = [Event() for _ in items]
+        prepared, tasks = [], []
+
+        async def next_items():
+            # Blocks for the next fed file, then takes whatever else is ready
+            if self._feed is None:
+                return False
+            path = await self._feed.get()
+            while path is not None:
+                items.append((*ospath.split(path), None))
+                self._sent_events.append(Event())
+                if self._feed.empty():
+                    return True
+                path = self._feed.get_nowait()
+            self._feed = None
+            return index < len(items)
+
+        def prefetch(upto):
+            # Captions, renames and thumbnails run ahead of the uploads
+            while len(prepared) < min(upto, len(items)):
+                dirpath, file_, ss_files = items[len(prepared)]
+                prepared.append(
+                    ss_files
+                    if file_ is None
+                    else create_task(self._prepare_upload(dirpath, file_))
+                )
+
+        index = 0
+        while index < len(items) or await next_items():
+            if self._listener.is_cancelled:
+                break
+            dirpath, file_, _ = items[index]
+            prefetch(index + workers + PREPARE_AHEAD)
+            while len(tasks) - sum(t.done() for t in tasks) >= workers:
+                await wait(
+                    [t for t in tasks if not t.done()], return_when=FIRST_COMPLETED
+                )
+            tasks.append(
+                create_task(
+                    self._upload_item(index, dirpath, file_, prepared[index], clients)
+                )
+            )
+            index += 1
+        await gather(*tasks)
+        for task in prepared[len(tasks) :]:
+            if not isinstance(task, list):
+                task.cancel()
+
         for key, value in list(self._media_dict.items()):
             for subkey, msgs in list(value.items()):
                 if len(msgs) > 1:
@@ -461,12 +715,12 @@ class TelegramUploader:
         if self._listener.is_cancelled:
             return
         if self._total_files == 0:
-            await self._listener.on_upload_error(
+            await self._on_upload_error(
                 "No files to upload. In case you have filled EXCLUDED_EXTENSIONS, then check if all files have those extensions or not."
             )
             return
         if self._total_files <= self._corrupted:
-            await self._listener.on_upload_error(
+            await self._on_upload_error(
                 f"Files Corrupted or unable to upload. {self._error or 'Check logs!'}"
             )
             return
@@ -479,112 +733,53 @@ class TelegramUploader:
     @retry(
         wait=wait_exponential(multiplier=2, min=4, max=8),
         stop=stop_after_attempt(3),
-        retry=retry_if_exception_type(Exception),
+        retry=retry_if_exception_type(Exception)
+        & retry_if_not_exception_type(NO_ACCESS),
     )
-    async def _upload_file(self, cap_mono, file, o_path, force_document=False):
-        if (
-            self._thumb is not None
-            and not await aiopath.exists(self._thumb)
-            and self._thumb != "none"
+    async def _upload_file(
+        self, cap_mono, file, o_path, up_path, media, client, index, force_document=False
+    ):
+        if media is None or (
+            media["thumb"] not in [None, "none"]
+            and not await aiopath.exists(media["thumb"])
         ):
-            self._thumb = None
-        thumb = self._thumb
+            media = await self._prepare_media(up_path, file, force_document)
+        thumb = None if media["thumb"] == "none" else media["thumb"]
+        progress = self._progress(client, index)
         self._is_corrupted = False
+        if media["as_doc"]:
+            key = "documents"
+        elif media["is_video"]:
+            key = "videos"
+        elif media["is_audio"]:
+            key = "audios"
+        else:
+            key = "photos"
         try:
-            is_video, is_audio, is_image = await get_document_type(self._up_path)
-
-            if not is_image and thumb is None:
-                file_name = ospath.splitext(file)[0]
-                thumb_path = f"{self._path}/yt-dlp-thumb/{file_name}.jpg"
-                if await aiopath.isfile(thumb_path):
-                    thumb = thumb_path
-                elif is_audio and not is_video:
-                    thumb = await get_audio_thumbnail(self._up_path)
-
-            if (
-                self._listener.as_doc
-                or force_document
-                or (not is_video and not is_audio and not is_image)
-            ):
-                key = "documents"
-                if is_video and thumb is None:
-                    thumb = await get_video_thumbnail(self._up_path, None)
-
-                if self._listener.is_cancelled:
-                    return
-                if thumb == "none":
-                    thumb = None
-                self._sent_msg = await self._sent_msg.reply_document(
-                    document=self._up_path,
-                    quote=True,
-                    thumb=thumb,
-                    caption=cap_mono,
-                    force_document=True,
-                    disable_notification=True,
-                    progress=self._upload_progress,
-                )
-            elif is_video:
-                key = "videos"
-                duration = (await get_media_info(self._up_path))[0]
-                if thumb is None and self._listener.thumbnail_layout:
-                    thumb = await get_multiple_frames_thumbnail(
-                        self._up_path,
-                        self._listener.thumbnail_layout,
-                        self._listener.screen_shots,
-                    )
-                if thumb is None:
-                    thumb = await get_video_thumbnail(self._up_path, duration)
-                if thumb is not None and thumb != "none":
-                    with Image.open(thumb) as img:
-                        width, height = img.size
-                else:
-                    width = 480
-                    height = 320
-                if self._listener.is_cancelled:
-                    return
-                if thumb == "none":
-                    thumb = None
-                self._sent_msg = await self._sent_msg.reply_video(
-                    video=self._up_path,
-                    quote=True,
-                    caption=cap_mono,
-                    duration=duration,
-                    width=width,
-                    height=height,
-                    thumb=thumb,
-                    supports_streaming=True,
-                    disable_notification=True,
-                    progress=self._upload_progress,
-                )
-            elif is_audio:
-                key = "audios"
-                duration, artist, title = await get_media_info(self._up_path)
-                if self._listener.is_cancelled:
-                    return
-                if thumb == "none":
-                    thumb = None
-                self._sent_msg = await self._sent_msg.reply_audio(
-                    audio=self._up_path,
-                    quote=True,
-                    caption=cap_mono,
-                    duration=duration,
-                    performer=artist,
-                    title=title,
-                    thumb=thumb,
-                    disable_notification=True,
-                    progress=self._upload_progress,
-                )
-            else:
-                key = "photos"
-                if self._listener.is_cancelled:
-                    return
-                self._sent_msg = await self._sent_msg.reply_photo(
-                    photo=self._up_path,
-                    quote=True,
-                    caption=cap_mono,
-                    disable_notification=True,
-                    progress=self._upload_progress,
-                )
+            # The parts upload alongside the other files, only the send waits
+            # for the earlier items, then replies to the last one sent
+            try:
+                input_file = await client.save_file(up_path, progress=progress)
+            except StopTransmission:
+                return None
+            if input_file is None:
+                raise ValueError("Failed to upload the file parts")
+            if thumb is not None and key != "photos":
+                thumb = await client.save_file(thumb)
+            await self._wait_turn(index, o_path)
+            if self._listener.is_cancelled:
+                return
+            sent_msg = await self._send_uploaded(
+                client,
+                await self._reply_target(client),
+                input_file,
+                up_path,
+                key,
+                media,
+                cap_mono,
+                thumb,
+            )
+            self._sent_msg = sent_msg
 
             if (
                 not self._listener.is_cancelled
@@ -611,36 +806,103 @@ class TelegramUploader:
             if self._sent_msg:
                 await self._copy_media()
 
-            if (
-                self._thumb is None
-                and thumb is not None
-                and await aiopath.exists(thumb)
-            ):
-                await remove(thumb)
+            await self._remove_thumb(media)
+            return sent_msg
         except (FloodWait, FloodPremiumWait) as f:
             LOGGER.warning(str(f))
             await sleep(f.value * 1.3)
-            if (
-                self._thumb is None
-                and thumb is not None
-                and await aiopath.exists(thumb)
-            ):
-                await remove(thumb)
-            return await self._upload_file(cap_mono, file, o_path)
+            await self._remove_thumb(media)
+            return await self._upload_file(
+                cap_mono, file, o_path, up_path, None, client, index
+            )
         except Exception as err:
-            if (
-                self._thumb is None
-                and thumb is not None
-                and await aiopath.exists(thumb)
-            ):
-                await remove(thumb)
+            await self._remove_thumb(media)
+            if isinstance(err, NO_ACCESS):
+                raise err
             err_type = "RPCError: " if isinstance(err, RPCError) else ""
-            LOGGER.error(f"{err_type}{err}. Path: {self._up_path}", exc_info=True)
+            LOGGER.error(f"{err_type}{err}. Path: {up_path}", exc_info=True)
             if isinstance(err, BadRequest) and key != "documents":
-                LOGGER.error(f"Retrying As Document. Path: {self._up_path}")
-                return await self._upload_file(cap_mono, file, o_path, True)
+                LOGGER.error(f"Retrying As Document. Path: {up_path}")
+                return await self._upload_file(
+                    cap_mono, file, o_path, up_path, None, client, index, True
+                )
             raise err
 
+    async def _send_uploaded(
+        self, client, reply_to, input_file, up_path, key, media, caption, thumb
+    ):
+        """Sends a file save_file put on Telegram as a reply, like reply_*."""
+        if key == "photos":
+            input_media = raw.types.InputMediaUploadedPhoto(file=input_file)
+        else:
+            mime_type = "application/zip"
+            attributes = [
+                raw.types.DocumentAttributeFilename(
+                    file_name=ospath.basename(up_path)
+                )
+            ]
+            if key == "videos":
+                mime_type = "video/mp4"
+                attributes.insert(
+                    0,
+                    raw.types.DocumentAttributeVideo(
+                        supports_streaming=True,
+                        duration=media["duration"],
+                        w=media["width"],
+                        h=media["height"],
+                    ),
+                )
+            elif key == "audios":
+                mime_type = "audio/mpeg"
+                attributes.insert(
+                    0,
+                    raw.types.DocumentAttributeAudio(
+                        duration=media["duration"],
+                        performer=media["artist"],
+                        title=media["title"],
+                    ),
+                )
+            input_media = raw.types.InputMediaUploadedDocument(
+                mime_type=client.guess_mime_type(up_path) or mime_type,
+                file=input_file,
+                force_file=key == "documents" or None,
+                thumb=thumb,
+                attributes=attributes,
+            )
+        while True:
+            try:
+                r = await client.invoke(
+                    raw.functions.messages.SendMedia(
+                        peer=await client.resolve_peer(reply_to.chat.id),
+                        media=input_media,
+                        silent=True,
+                        reply_to=InputReplyToMessage(
+                            reply_to_message_id=reply_to.id,
+                            message_thread_id=reply_to.message_thread_id,
+                        ),
+                        random_id=client.rnd_id(),
+                        **await utils.parse_text_entities(client, caption, None, None),
+                    )
+                )
+            except FilePartMissing as e:
+                await client.save_file(
+                    up_path, file_id=input_file.id, file_part=e.value
+                )
+            else:
+                break
+        for update in r.updates:
+            if isinstance(
+                update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)
+            ):
+                return await Message._parse(
+                    client,
+                    update.message,
+                    {u.id: u for u in r.users},
+                    {c.id: c for c in r.chats},
+                )
+        # Nothing to reply to next, fails the upload instead
+        raise ValueError("Telegram returned no message for the sent file")
+
     @property
     def speed(self):
         try:
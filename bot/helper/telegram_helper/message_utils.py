@@ -301,6 +301,7 @@ async def update_status_message(sid, force=False):
         status = status_dict[sid]["status"]
         is_user = status_dict[sid]["is_user"]
         page_step = status_dict[sid]["page_step"]
+        page_key = status_dict[sid].get("page_key")
         text, buttons = await get_readable_message(
             sid, is_user, page_no, status, page_step
         )
@@ -310,6 +311,9 @@ async def update_status_message(sid, force=False):
                 obj.cancel()
                 del intervals["status"][sid]
             return
+        if not force and page_key == status_dict[sid].get("page_key"):
+            # Nothing visible on this page moved since the last edit
+            return
         if text != status_dict[sid]["message"].text:
             message = await edit_message(
                 status_dict[sid]["message"], text, buttons, block=False
@@ -321,6 +325,7 @@ async def update_status_message(sid, force=False):
                         obj.cancel()
                         del intervals["status"][sid]
                 else:
+                    status_dict[sid]["page_key"] = None
                     LOGGER.error(
                         f"Status with id: {sid} haven't been updated. Error: {message}"
                     )
@@ -68,6 +68,8 @@ DEFAULT_VALUES = {
     "QUEUE_ALL": 0,
     "QUEUE_DOWNLOAD": 0,
     "QUEUE_UPLOAD": 0,
+    "QUEUE_SJF": False,
+    "QUEUE_BANDWIDTH": 0,
     "USER_MAX_TASKS": 0,
 }
 
@@ -306,7 +308,7 @@ async def edit_variable(_, message, pre_message, key):
         await update_qb_options()
     elif key in ["SEARCH_PLUGINS", "SEARCH_API_LINK"]:
         await initiate_search_tools()
-    elif key in ["QUEUE_ALL", "QUEUE_DOWNLOAD", "QUEUE_UPLOAD"]:
+    elif key in ["QUEUE_ALL", "QUEUE_DOWNLOAD", "QUEUE_UPLOAD", "QUEUE_SJF", "QUEUE_BANDWIDTH"]:
         await start_from_queued()
     elif key in [
         "RCLONE_SERVE_URL",
@@ -578,7 +580,7 @@ async def edit_bot_settings(client, query):
         await database.update_config({data[2]: value})
         if data[2] in ["SEARCH_PLUGINS", "SEARCH_API_LINK"]:
             await initiate_search_tools()
-        elif data[2] in ["QUEUE_ALL", "QUEUE_DOWNLOAD", "QUEUE_UPLOAD"]:
+        elif data[2] in ["QUEUE_ALL", "QUEUE_DOWNLOAD", "QUEUE_UPLOAD", "QUEUE_SJF", "QUEUE_BANDWIDTH"]:
             await start_from_queued()
         elif data[2] in [
             "RCLONE_SERVE_URL",
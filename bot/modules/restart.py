@@ -17,6 +17,7 @@ from ..core.torrent_manager import TorrentManager
 from ..helper.ext_utils.bot_utils import new_task
 from ..helper.ext_utils.db_handler import database
 from ..helper.ext_utils.files_utils import clean_all
+from ..helper.ext_utils.hyperdl_utils import MediaSessionPool
 from ..helper.telegram_helper import button_build
 from ..helper.telegram_helper.message_utils import (
     delete_message,
@@ -28,6 +29,7 @@ from ..helper.telegram_helper.message_utils import (
 async def restart_bot(_, message):
     intervals["stopAll"] = True
     restart_message = await send_message(message, "<i>Restarting...</i>")
+    await MediaSessionPool.stop_all()
     await TgClient.stop()
     if scheduler.running:
         scheduler.shutdown(wait=False)
@@ -156,6 +158,7 @@ async def confirm_restart(_, query):
         intervals["stopAll"] = True
         restart_message = await send_message(reply_to, "<i>Restarting...</i>")
         await delete_message(message)
+        await MediaSessionPool.stop_all()
         await TgClient.stop()
         if scheduler.running:
             scheduler.shutdown(wait=False)
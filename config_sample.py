@@ -136,6 +136,8 @@ LEECH_PREFIX = ""
 LEECH_SUFFIX = ""
 LEECH_FONT = ""
 LEECH_CAPTION = ""
+HASH_ALGORITHM = "md5"  # {file_hash} in LEECH_CAPTION: md5, sha1 or xxh64
+STREAM_EXTRACT = False  # Leech extracted files while the rest is still extracting
 THUMBNAIL_LAYOUT = ""
 
 # Log Channels
@@ -153,6 +155,8 @@ WEB_PINCODE = True
 QUEUE_ALL = 0
 QUEUE_DOWNLOAD = 0
 QUEUE_UPLOAD = 0
+QUEUE_SJF = False
+QUEUE_BANDWIDTH = 0  # MB/s shared by all downloads, 0 to disable
 
 # RSS
 RSS_DELAY = 600